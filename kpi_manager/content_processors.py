@@ -1,8 +1,10 @@
+from functools import lru_cache
 from urllib.parse import urlsplit
 import re
 
 from lxml.html.clean import Cleaner, autolink_html
 import lxml.html
+import markdown2
 
 
 WEBSITE_WHITELIST = [
@@ -49,4 +51,35 @@ def clean_up_html(html, method='html'):
         h1.tag = 'h2'
     for a in html.cssselect('a'):
         a.attrib['target'] = '_blank'
-    return lxml.html.tostring(html, encoding='utf-8', method=method)
\ No newline at end of file
+    return lxml.html.tostring(html, encoding='utf-8', method=method)
+
+
+MARKDOWN_EXTRAS = ['tables', 'fenced-code-blocks', 'code-friendly']
+# Số mô tả khác nhau được nhớ kết quả render trong mỗi tiến trình
+RENDER_CACHE_SIZE = 1024
+# Trường mô tả (Markdown) -> trường HTML đã lọc của từng model
+DESCRIPTION_FIELDS = {
+    'tag': ('tag_description', 'tag_description_html'),
+    'task': ('task_description', 'task_description_html'),
+}
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def render_markdown(text):
+    """
+    Markdown -> HTML đã lọc (autolink, Cleaner theo WEBSITE_WHITELIST). Kết quả được nhớ theo nội dung nên
+    mỗi mô tả chỉ render một lần. Khi đổi WEBSITE_WHITELIST/cleaner, chạy lệnh render_descriptions.
+    """
+    if not text or not text.strip():
+        return None
+    html = markdown2.markdown(text, extras=MARKDOWN_EXTRAS)
+    return clean_up_html(html).decode('utf-8')
+
+
+def render_description(instance):
+    """
+    Ghi HTML của mô tả vào Tag/Task (trước khi lưu hoặc bulk_create).
+    """
+    source, target = DESCRIPTION_FIELDS[instance._meta.model_name]
+    setattr(instance, target, render_markdown(getattr(instance, source)))
+    return instance
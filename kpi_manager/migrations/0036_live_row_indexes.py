@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# Chỉ mục một phần (WHERE NOT removed) cho các API danh sách: mọi truy vấn đều lọc removed=False
+# rồi lọc theo nhân viên / thời gian và sắp xếp theo -created_at, -updated_at hoặc -date.
+# Django 1.11 chưa hỗ trợ Index(condition=...) nên dùng RunSQL (PostgreSQL và SQLite đều hiểu cú pháp này).
+LIVE_ROW_INDEXES = (
+    ('kpi_manager_tag_live_created_idx', 'kpi_manager_tag', 'created_at DESC'),
+    ('kpi_manager_tag_live_period_end_idx', 'kpi_manager_tag', 'period_end'),
+    ('kpi_manager_tag_live_user_created_idx', 'kpi_manager_tag', 'user_id, created_at DESC'),
+    ('kpi_manager_tag_live_user_updated_idx', 'kpi_manager_tag', 'user_id, updated_at DESC'),
+    ('kpi_manager_task_live_tag_user_created_idx', 'kpi_manager_task', 'tag_id, user_id, created_at DESC'),
+    ('kpi_manager_comment_live_task_created_idx', 'kpi_manager_comment', 'task_id, created_at DESC'),
+    ('kpi_manager_worktime_live_user_date_idx', 'kpi_manager_worktime', 'user_id, date DESC, created_at DESC'),
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kpi_manager', '0035_worktime_rest_time'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=['CREATE INDEX %s ON %s (%s) WHERE NOT removed' % (name, table, columns)],
+            reverse_sql=['DROP INDEX %s' % name],
+        )
+        for name, table, columns in LIVE_ROW_INDEXES
+    ]
@@ -1,5 +1,8 @@
+import json
+
 import arrow
 from django.conf import settings
+from django.core.files.storage import default_storage
 from django.db import models
 from django.contrib.auth.models import User
 # import django.utils.timezone
@@ -29,6 +32,8 @@ PERMISSION_CHOICE = (
     ('EM', 'Employee'),
 )
 
+PERMISSION_NAMES = dict(PERMISSION_CHOICE)
+
 STATE_TAG_CHOICE = (
     ('NF', 'Chưa Hoàn Thành'),
     ('PR', 'Đang Thực Hiện'),
@@ -56,13 +61,31 @@ class Profile(models.Model):
         'autocrop': True,
         'crop': 'smart'
     })
+    # Ảnh gốc vừa tải lên (đang chờ xử lý) và các kích thước đã tạo {kích thước: đường dẫn}, xem web_api.avatars
+    avatar_original = models.CharField(max_length=255, null=True, blank=True, editable=False)
+    avatar_sizes = models.TextField(null=True, blank=True, editable=False)
     role = models.CharField(max_length=2, choices=PERMISSION_CHOICE, blank=True)
     removed = models.BooleanField(default=False)
 
     def __str__(self):
         return self.full_name
 
-    def get_avatar_url(self):
+    def get_avatar_urls(self):
+        """
+        :return: {kích thước: url} của các ảnh đại diện đã tạo sẵn
+        """
+        if not self.avatar_sizes:
+            return {}
+        return {int(size): default_storage.url(name) for size, name in json.loads(self.avatar_sizes).items()}
+
+    def get_avatar_url(self, size=None):
+        """
+        :param size: kích thước cần dùng, lấy ảnh nhỏ nhất không nhỏ hơn size (mặc định ảnh lớn nhất)
+        """
+        urls = self.get_avatar_urls()
+        if urls:
+            fit = [item for item in sorted(urls) if size and item >= size]
+            return urls[fit[0] if fit else max(urls)]
         if self.avatar:
             return self.avatar.url
         elif self.sex == 'F':
@@ -79,7 +102,7 @@ class Profile(models.Model):
         return True if self.role == 'EM' else False
 
     def get_role(self):
-        return next(y for x, y in PERMISSION_CHOICE if self.role == x)
+        return PERMISSION_NAMES.get(self.role)
 
     def get_sex(self):
         return next(y for x, y in SEX_CHOICES if self.sex == x)
@@ -121,6 +144,8 @@ class Tag(models.Model):
                              verbose_name='Nhân Viên')
     tag_name = models.TextField(max_length=500, null=True, blank=True, verbose_name='Công Việc')
     tag_description = SimpleMDEField(null=True, blank=True, verbose_name='Mô Tả')
+    # HTML đã lọc của tag_description, được render khi lưu (content_processors.render_description)
+    tag_description_html = models.TextField(null=True, blank=True, editable=False)
     period_start = models.DateTimeField(null=True, blank=True, verbose_name='Thời Gian Bắt Đầu')
     period_end = models.DateTimeField(null=True, blank=True, verbose_name='Thời Gian Kết Thúc')
     weight = models.IntegerField(default=0, null=True, blank=True)
@@ -147,6 +172,7 @@ class Task(models.Model):
     user = models.ForeignKey(DepartmentMember, related_name='+', null=True, blank=True, on_delete=models.CASCADE)
     task_name = models.TextField(max_length=500, null=True, blank=True)
     task_description = SimpleMDEField(null=True, blank=True)
+    task_description_html = models.TextField(null=True, blank=True, editable=False)
     period_start = models.DateTimeField(null=True, blank=True, verbose_name='Thời Gian Bắt Đầu')
     period_end = models.DateTimeField(null=True, blank=True, verbose_name='Thời Gian Kết Thúc')
     unit_of_measure = models.CharField(max_length=100, null=True, blank=True)
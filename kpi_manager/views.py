@@ -1,13 +1,15 @@
 import arrow
 from django.conf import settings
-from django.db.models import Sum
 from datetime import datetime, date
-import user_agents
 
 from django.views.generic import TemplateView, ListView
 
-from kpi_manager.models import Profile, DepartmentMember, Tag, WorkTime
+from kpi_manager.models import Profile, DepartmentMember, Tag
 from utils.common import can_be_integer
+from utils.devices import request_is_desktop
+from web_api.members import get_member
+from web_api.reports import CachedReportMixin
+from web_api.summary import get_member_month_summary
 
 # Create your views here.
 
@@ -21,8 +23,7 @@ class MainNavMixin(object):
         return context
 
     def is_desktop(self):
-        user_agent = user_agents.parse(self.request.META.get('HTTP_USER_AGENT'))
-        return user_agent.is_pc
+        return request_is_desktop(self.request)
 
 
 class HomeIndexView(MainNavMixin, TemplateView):
@@ -32,71 +33,42 @@ class HomeIndexView(MainNavMixin, TemplateView):
         # if self.request.user.is_authenticated:
         #     if self.request.user.profile.force_mobile:
         #         return ['index.html']
-        user_agent = user_agents.parse(self.request.META.get('HTTP_USER_AGENT'))
-        if user_agent.is_pc:
+        if self.is_desktop():
             return ['desktop/home.html']
         return ['index.html']
 
 
-class StatisticTagView(MainNavMixin, TemplateView):
+class StatisticTagView(CachedReportMixin, MainNavMixin, TemplateView):
+    report_template = 'print/tag_statistic.html'
+
+    def get_report_member(self):
+        return self.get_department_member()
+
     def get_profile(self):
-        user_id = self.request.user.id
-        profile = Profile.objects.get(user__id=user_id)
-        return profile
+        return self.request.member.profile
 
     def get_department_member(self):
         try:
-            user_id = self.request.user.id
-            profile = Profile.objects.get(user__id=user_id, removed=False)
-            dpm = DepartmentMember.objects.get(department_member=profile, removed=False)
+            dpm = self.request.member.get_department_member()
             return dpm
         except (Profile.DoesNotExist, DepartmentMember.DoesNotExist):
             pass
 
     def get_tag_info(self):
         try:
-            user_id = self.request.user.id
             year_request = self.kwargs['year_request']
             month_request = self.kwargs['month_request']
-            profile = Profile.objects.get(user__id=user_id, removed=False)
-            dpm = DepartmentMember.objects.get(department_member=profile, removed=False)
+            dpm = self.request.member.get_department_member()
             start = arrow.now(). \
                 replace(month=int(month_request), year=int(year_request)). \
                 to(settings.TIME_ZONE).floor('month').datetime
-            end = arrow.now(). \
-                replace(month=int(month_request), year=int(year_request)). \
-                to(settings.TIME_ZONE).ceil('month').datetime
-            wt = WorkTime.objects.filter(user=dpm,
-                                         date__range=(start, end),
-                                         removed=False).aggregate(totalTime=Sum('time_total'))['totalTime']
-            tag = Tag.objects.filter(user=dpm,
-                                     created_at__range=(start, end),
-                                     removed=False)
-            total = 0
-            count_finished = 0
-            count_progress = 0
-            count_un_finished = 0
-            for item in tag:
-                total += 1
-                if item.state == 'CO':
-                    count_finished += 1
-                elif item.state == 'PR':
-                    count_progress += 1
-                elif item.state == 'NF':
-                    count_un_finished += 1
-
-            return {
-                'total_time': round(wt, 2) if wt else 0,
-                'total_tag': total,
-                'count_finished': count_finished,
-                'count_progress': count_progress,
-                'count_un_finished': count_un_finished,
-            }
+            data = get_member_month_summary(dpm, start)
+            data['total_time'] = round(data['total_time'], 2) if data['total_time'] else 0
+            return data
         except (Profile.DoesNotExist, DepartmentMember.DoesNotExist, Tag.DoesNotExist):
             return {}
 
     def get_queryset(self):
-        user_id = self.request.user.id
         year_request = self.kwargs['year_request']
         month_request = self.kwargs['month_request']
         if month_request and year_request:
@@ -120,8 +92,7 @@ class StatisticTagView(MainNavMixin, TemplateView):
                     replace(month=int(month_request), year=int(year_request)). \
                     to(settings.TIME_ZONE).ceil('month').datetime
 
-                profile = Profile.objects.get(user__id=user_id)
-                dpm = DepartmentMember.objects.get(department_member=profile)
+                dpm = self.request.member.get_department_member()
                 tag = Tag.objects.filter(user=dpm,
                                          created_at__range=(start, end),
                                          removed=False).order_by('-updated_at')
@@ -143,27 +114,32 @@ class StatisticTagView(MainNavMixin, TemplateView):
         # if self.request.user.is_authenticated:
         #     if self.request.user.profile.force_mobile:
         #         return ['index.html']
-        user_agent = user_agents.parse(self.request.META.get('HTTP_USER_AGENT'))
-        if user_agent.is_pc:
+        if self.is_desktop():
             return ['print/tag_statistic.html']
         return ['index.html']
 
 
-class MemberStatisticTagView(MainNavMixin, TemplateView):
+class MemberStatisticTagView(CachedReportMixin, MainNavMixin, TemplateView):
+    report_template = 'print/member_tag_statistic.html'
+
+    def get_report_member(self):
+        # Chỉ lưu khi người xem có quyền (Giám đốc hoặc trưởng phòng cùng phòng ban), nội dung không phụ thuộc người xem
+        if not can_be_integer(self.kwargs['profile_id']):
+            return None
+        return self.get_department_member() or None
+
     def get_my_profile(self):
-        user_id = self.request.user.id
-        profile = Profile.objects.get(user__id=user_id)
-        return profile
+        return self.request.member.profile
 
     def get_profile(self):
         profile_id = self.kwargs['profile_id']
         try:
-            my_profile = Profile.objects.get(user__id=self.request.user.id, removed=False)
+            my_profile = self.request.member.get_profile()
             profile = Profile.objects.get(id=profile_id, removed=False)
             if my_profile.get_role() == 'Director':
                 return profile
             elif my_profile.get_role() == 'Manager':
-                me = DepartmentMember.objects.get(department_member=my_profile)
+                me = self.request.member.get_department_member()
                 member = DepartmentMember.objects.get(department_member=profile)
                 if int(me.department.id) == int(member.department.id):
                     return profile
@@ -177,13 +153,12 @@ class MemberStatisticTagView(MainNavMixin, TemplateView):
     def get_department_member(self):
         profile_id = self.kwargs['profile_id']
         try:
-            my_profile = Profile.objects.get(user__id=self.request.user.id, removed=False)
-            profile = Profile.objects.get(id=profile_id, removed=False)
-            member = DepartmentMember.objects.get(department_member=profile, removed=False)
+            my_profile = self.request.member.get_profile()
+            member = get_member(department_member_id=profile_id)
             if my_profile.get_role() == 'Director':
                 return member
             elif my_profile.get_role() == 'Manager':
-                me = DepartmentMember.objects.get(department_member=my_profile, removed=False)
+                me = self.request.member.get_department_member()
                 if int(me.department.id) == int(member.department.id):
                     return member
                 else:
@@ -201,74 +176,20 @@ class MemberStatisticTagView(MainNavMixin, TemplateView):
             start = arrow.now(). \
                 replace(month=int(month_request), year=int(year_request)). \
                 to(settings.TIME_ZONE).floor('month').datetime
-            end = arrow.now(). \
-                replace(month=int(month_request), year=int(year_request)). \
-                to(settings.TIME_ZONE).ceil('month').datetime
 
-            my_profile = Profile.objects.get(user__id=self.request.user.id, removed=False)
-            profile = Profile.objects.get(id=profile_id, removed=False)
-            member = DepartmentMember.objects.get(department_member=profile, removed=False)
-            if my_profile.get_role() == 'Director':
-                wt = WorkTime.objects.filter(user=member,
-                                             date__range=(start, end),
-                                             removed=False).aggregate(totalTime=Sum('time_total'))['totalTime']
-                tag = Tag.objects.filter(user=member,
-                                         created_at__range=(start, end),
-                                         removed=False)
-                total = 0
-                count_finished = 0
-                count_progress = 0
-                count_un_finished = 0
-                for item in tag:
-                    total += 1
-                    if item.state == 'CO':
-                        count_finished += 1
-                    elif item.state == 'PR':
-                        count_progress += 1
-                    elif item.state == 'NF':
-                        count_un_finished += 1
-
-                return {
-                    'total_time': round(wt, 2) if wt else 0,
-                    'total_tag': total,
-                    'count_finished': count_finished,
-                    'count_progress': count_progress,
-                    'count_un_finished': count_un_finished,
-                }
-            elif my_profile.get_role() == 'Manager':
-                me = DepartmentMember.objects.get(department_member=my_profile, removed=False)
-                if int(me.department.id) == int(member.department.id):
-                    wt = WorkTime.objects.filter(user=member,
-                                                 date__range=(start, end),
-                                                 removed=False).aggregate(totalTime=Sum('time_total'))['totalTime']
-                    tag = Tag.objects.filter(user=member,
-                                             created_at__range=(start, end),
-                                             removed=False)
-                    total = 0
-                    count_finished = 0
-                    count_progress = 0
-                    count_un_finished = 0
-                    for item in tag:
-                        total += 1
-                        if item.state == 'CO':
-                            count_finished += 1
-                        elif item.state == 'PR':
-                            count_progress += 1
-                        elif item.state == 'NF':
-                            count_un_finished += 1
-
-                    return {
-                        'total_time': round(wt, 2) if wt else 0,
-                        'total_tag': total,
-                        'count_finished': count_finished,
-                        'count_progress': count_progress,
-                        'count_un_finished': count_un_finished,
-                    }
-                else:
+            my_profile = self.request.member.get_profile()
+            member = get_member(department_member_id=profile_id)
+            if my_profile.get_role() == 'Manager':
+                me = self.request.member.get_department_member()
+                if int(me.department.id) != int(member.department.id):
                     return {}
-            else:
+            elif my_profile.get_role() != 'Director':
                 return {}
 
+            data = get_member_month_summary(member, start)
+            data['total_time'] = round(data['total_time'], 2) if data['total_time'] else 0
+            return data
+
         except (Profile.DoesNotExist, DepartmentMember.DoesNotExist, Tag.DoesNotExist):
             return {}
 
@@ -297,16 +218,15 @@ class MemberStatisticTagView(MainNavMixin, TemplateView):
                     replace(month=int(month_request), year=int(year_request)). \
                     to(settings.TIME_ZONE).ceil('month').datetime
 
-                my_profile = Profile.objects.get(user__id=self.request.user.id)
-                profile = Profile.objects.get(id=profile_id, removed=False)
-                member = DepartmentMember.objects.get(department_member=profile)
+                my_profile = self.request.member.get_profile()
+                member = get_member(department_member_id=profile_id)
                 if my_profile.get_role() == 'Director':
                     tag = Tag.objects.filter(user=member,
                                              created_at__range=(start, end),
                                              removed=False).order_by('-updated_at')
                     return tag
                 elif my_profile.get_role() == 'Manager':
-                    me = DepartmentMember.objects.get(department_member=my_profile, removed=False)
+                    me = self.request.member.get_department_member()
                     if int(me.department.id) == int(member.department.id):
                         tag = Tag.objects.filter(user=member,
                                                  created_at__range=(start, end),
@@ -335,7 +255,6 @@ class MemberStatisticTagView(MainNavMixin, TemplateView):
         # if self.request.user.is_authenticated:
         #     if self.request.user.profile.force_mobile:
         #         return ['index.html']
-        user_agent = user_agents.parse(self.request.META.get('HTTP_USER_AGENT'))
-        if user_agent.is_pc:
+        if self.is_desktop():
             return ['print/member_tag_statistic.html']
         return ['index.html']
@@ -49,7 +49,7 @@ INSTALLED_APPS = [
     'crispy_forms',
     'simplemde',
     'kpi_manager',
-    'web_api',
+    'web_api.apps.WebApiConfig',
     'registration.apps.RegistrationConfig',
 
     'corsheaders',
@@ -69,6 +69,9 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'web_api.middleware.ActingMemberMiddleware',
+    'web_api.middleware.DeviceMiddleware',
+    'web_api.middleware.InstrumentationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -168,16 +171,51 @@ LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/home'
 LOGOUT_REDIRECT_URL = '/'
 
+# Các kích thước (px) ảnh đại diện được tạo sẵn sau khi tải lên (web_api.avatars)
+AVATAR_SIZES = (320, 96, 40)
+
 PERSON_DEFAULT = {
     'female': urljoin(STATIC_URL, 'avatars/female.png'),
     'male': urljoin(STATIC_URL, 'avatars/male.png'),
 }
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
-    },
-}
+# Cache dùng chung giữa các tiến trình. CACHE_BACKEND=locmem dùng cache trong tiến trình (phát triển, chạy thử)
+if os.environ.get('CACHE_BACKEND', 'memcached') == 'locmem':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'kpi-manager',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': os.environ.get('MEMCACHED_LOCATION', '127.0.0.1:11211'),
+            'KEY_PREFIX': 'kpi-manager',
+        },
+    }
+
+# Thời gian lưu cache (giây) cho các API chỉ đọc, dữ liệu cũ được loại bỏ sớm hơn nhờ tăng phiên bản
+API_CACHE_TIMEOUT = 60 * 15
+
+# Đo thời gian phản hồi / số câu truy vấn của từng API (web_api.middleware.InstrumentationMiddleware)
+API_INSTRUMENTATION = os.environ.get('API_INSTRUMENTATION') == '1'
+# Số liệu được giữ trong bấy nhiêu giây gần nhất
+API_INSTRUMENTATION_WINDOW = 60 * 15
+# Request chậm hơn ngưỡng này (ms) được ghi log kèm API_SLOW_REQUEST_TOP_SQL câu SQL tốn thời gian nhất
+API_SLOW_REQUEST_MS = 500
+API_SLOW_REQUEST_TOP_SQL = 5
+API_SLOW_REQUEST_LOG_SIZE = 50
+
+# Số chuỗi User-Agent được nhớ kết quả phân loại máy tính/điện thoại (utils.devices)
+USER_AGENT_CACHE_SIZE = 1024
+
+# Hàng đợi công việc chạy nền (web_api.jobs, lệnh run_jobs)
+# Công việc lỗi được chạy lại sau JOB_RETRY_DELAY * 2^(lần thử - 1) giây
+JOB_RETRY_DELAY = 30
+# Công việc đang chạy quá bấy nhiêu giây (worker bị dừng) được đưa lại vào hàng đợi
+JOB_TIMEOUT = 60 * 30
 
 CORS_ORIGIN_WHITELIST = (
     'localhost:8000',
@@ -204,10 +242,13 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.JSONRenderer',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_jwt.authentication.JSONWebTokenAuthentication',
+        'web_api.authentication.CachedJSONWebTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ),
+    'DEFAULT_PERMISSION_CLASSES': (
+        'web_api.scopes.ScopePermission',
+    ),
 }
 
 JWT_AUTH = {
@@ -240,7 +281,14 @@ JWT_AUTH = {
     'JWT_AUTH_HEADER_PREFIX': 'JWT',
 }
 
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# Số giây lưu User/Profile/DepartmentMember của token JWT (web_api.authentication)
+JWT_PRINCIPAL_CACHE_TIMEOUT = 60
+
+# Session đọc qua cache, chỉ ghi CSDL khi thay đổi (web_api.sessions); xóa session hết hạn bằng
+# lệnh clear_expired_sessions
+SESSION_ENGINE = 'web_api.sessions'
+# Session của người dùng đang hoạt động được gia hạn (ghi lại) nhiều nhất một lần trong bấy nhiêu giây
+SESSION_REFRESH_INTERVAL = 60 * 60 * 24
 
 SIMPLEMDE_OPTIONS = {
     'placeholder': '',
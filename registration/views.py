@@ -1,4 +1,3 @@
-import user_agents
 from django.shortcuts import render, redirect
 from django.conf import settings
 from django.contrib.auth import login as auth_login, authenticate
@@ -11,6 +10,7 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import BasePermission
 from rest_framework.response import Response
 
+from utils.devices import request_is_desktop
 from . import forms
 # Create your views here.
 
@@ -23,8 +23,7 @@ class DeviceAutoSelectMixin(TemplateResponseMixin, ContextMixin):
     extra_context = {}
 
     def is_desktop(self):
-        user_agent = user_agents.parse(self.request.META.get('HTTP_USER_AGENT'))
-        return user_agent.is_pc
+        return request_is_desktop(self.request)
 
     def get_template_names(self):
         # if self.request.user.is_authenticated:
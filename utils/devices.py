@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+from functools import lru_cache
+
+import user_agents
+from django.conf import settings
+
+Device = namedtuple('Device', ['is_pc', 'is_mobile', 'is_tablet', 'is_bot'])
+
+# Số chuỗi User-Agent khác nhau được nhớ kết quả phân loại
+USER_AGENT_CACHE_SIZE = getattr(settings, 'USER_AGENT_CACHE_SIZE', 1024)
+
+
+@lru_cache(maxsize=USER_AGENT_CACHE_SIZE)
+def classify(user_agent_string):
+    """
+    Phân loại thiết bị theo chuỗi User-Agent. user_agents.parse() dùng nhiều regex nên kết quả được nhớ
+    theo chuỗi (LRU, tối đa USER_AGENT_CACHE_SIZE chuỗi).
+    :rtype: Device
+    """
+    user_agent = user_agents.parse(user_agent_string)
+    return Device(user_agent.is_pc, user_agent.is_mobile, user_agent.is_tablet, user_agent.is_bot)
+
+
+def is_desktop(user_agent_string):
+    return classify(user_agent_string or '').is_pc
+
+
+def request_is_desktop(request):
+    """
+    Dùng request.is_desktop do DeviceMiddleware gắn sẵn, nếu không có thì tự phân loại.
+    """
+    if not hasattr(request, 'is_desktop'):
+        request.is_desktop = is_desktop(request.META.get('HTTP_USER_AGENT'))
+    return request.is_desktop
+
+
+def cache_stats():
+    info = classify.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'max_size': info.maxsize}
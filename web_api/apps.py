@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class WebApiConfig(AppConfig):
     name = 'web_api'
+
+    def ready(self):
+        import web_api.signals
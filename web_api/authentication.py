@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_jwt.authentication import JSONWebTokenAuthentication
+from rest_framework_jwt.settings import api_settings
+
+from . import caching
+from .members import resolve_acting_member
+
+jwt_get_user_id_from_payload = api_settings.JWT_PAYLOAD_GET_USER_ID_HANDLER
+
+
+def principal_key(user_id, issued_at):
+    """
+    Khóa theo (tài khoản, thời điểm cấp token) và phiên bản hồ sơ/phòng ban: đổi tài khoản, hồ sơ,
+    thành viên phòng ban hoặc phòng ban đều làm khóa cũ không còn được đọc tới.
+    """
+    return caching.make_key(caching.principals(user_id), issued_at, caching.get_version(caching.PROFILES),
+                            caching.get_version(caching.DEPARTMENTS))
+
+
+def without_password(user):
+    """
+    Bỏ mật khẩu (hash) khỏi User trước khi lưu vào cache dùng chung: trường được coi như đã defer(),
+    chỉ đọc lại từ CSDL nếu có chỗ cần đến.
+    """
+    if user is not None:
+        user.__dict__.pop('password', None)
+    return user
+
+
+class CachedJSONWebTokenAuthentication(JSONWebTokenAuthentication):
+    """
+    Giống JSONWebTokenAuthentication (token vẫn được kiểm tra chữ ký, hạn dùng mỗi request) nhưng User và
+    ActingMember (Profile, DepartmentMember, Department) được lưu trong cache JWT_PRINCIPAL_CACHE_TIMEOUT giây,
+    nên các request liên tiếp không phải truy vấn lại thông tin người dùng. Mật khẩu không được lưu vào cache.
+    """
+
+    def authenticate(self, request):
+        self.request = request
+        return super(CachedJSONWebTokenAuthentication, self).authenticate(request)
+
+    def authenticate_credentials(self, payload):
+        user_id = jwt_get_user_id_from_payload(payload)
+        issued_at = payload.get('orig_iat', payload.get('iat'))
+        if not user_id or issued_at is None:
+            return super(CachedJSONWebTokenAuthentication, self).authenticate_credentials(payload)
+
+        key = principal_key(user_id, issued_at)
+        principal = cache.get(key)
+        if principal is None:
+            user = without_password(super(CachedJSONWebTokenAuthentication, self).authenticate_credentials(payload))
+            member = resolve_acting_member(user)
+            if member.profile is not None:
+                member.profile.user = user
+            principal = (user, member)
+            cache.set(key, principal, settings.JWT_PRINCIPAL_CACHE_TIMEOUT)
+
+        user, member = principal
+        # request.member (ActingMemberMiddleware) dùng luôn thông tin đã lưu
+        self.request._request._cached_member = member
+        return user
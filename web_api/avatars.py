@@ -0,0 +1,107 @@
+import hashlib
+import json
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from kpi_manager.models import Profile
+
+AVATAR_DIR = 'profile'
+JPEG_QUALITY = 85
+
+
+def content_name(data, suffix, extension):
+    """
+    Tên file theo nội dung: cùng ảnh cho cùng tên nên không ghi trùng, và url đổi khi ảnh đổi (cache lâu dài được).
+    """
+    return '%s/%s%s.%s' % (AVATAR_DIR, hashlib.sha1(data).hexdigest()[:20], suffix, extension)
+
+
+def save_file(name, data):
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(data))
+    return name
+
+
+def save_original(upload):
+    """
+    Lưu ảnh gốc vừa tải lên (chưa xử lý).
+    :return: đường dẫn trong storage
+    """
+    data = upload.read()
+    extension = 'png' if upload.content_type.endswith('png') else 'jpg'
+    return save_file(content_name(data, '', extension), data)
+
+
+def render_sizes(data, sizes):
+    """
+    Cắt vuông ở giữa rồi thu nhỏ ảnh về từng kích thước, lưu JPEG.
+    :return: {kích thước: bytes}
+    """
+    image = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+    if image.mode != 'RGB':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        image = image.convert('RGBA')
+        background.paste(image, mask=image.split()[-1])
+        image = background
+
+    rendered = {}
+    for size in sizes:
+        buffer = BytesIO()
+        ImageOps.fit(image, (size, size), Image.LANCZOS).save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+        rendered[size] = buffer.getvalue()
+    return rendered
+
+
+def is_referenced(name):
+    """
+    File còn được hồ sơ nào dùng: ảnh hiện tại, ảnh gốc đang chờ xử lý hoặc một kích thước đã tạo.
+    Tên file theo nội dung nên nhiều hồ sơ có thể dùng chung một file.
+    """
+    return Profile.objects.filter(Q(avatar=name) | Q(avatar_original=name) |
+                                  Q(avatar_sizes__contains=json.dumps(name))).exists()
+
+
+def delete_unused(names):
+    """
+    Xóa các file ảnh đại diện không còn hồ sơ nào dùng.
+    """
+    for name in set(names):
+        if name and name.startswith(AVATAR_DIR + '/') and not is_referenced(name) and default_storage.exists(name):
+            default_storage.delete(name)
+
+
+def process_avatar(profile_id, original):
+    """
+    Tạo các kích thước AVATAR_SIZES từ ảnh gốc và ghi vào Profile, rồi xóa ảnh cũ không còn dùng.
+    Bỏ qua (và xóa ảnh này) nếu người dùng đã tải ảnh khác lên sau đó.
+    :return: {kích thước: đường dẫn} hoặc None
+    """
+    # Ảnh đã được thay (hoặc đã xử lý bởi công việc trước với cùng ảnh): không cần đọc và resize
+    if Profile.objects.get(id=profile_id).avatar_original != original:
+        delete_unused([original])
+        return None
+
+    with default_storage.open(original, 'rb') as f:
+        data = f.read()
+
+    names = {size: save_file(content_name(content, '-%s' % size, 'jpg'), content)
+             for size, content in render_sizes(data, settings.AVATAR_SIZES).items()}
+
+    profile = Profile.objects.get(id=profile_id)
+    if profile.avatar_original != original:
+        delete_unused([original] + list(names.values()))
+        return None
+
+    superseded = [original, profile.avatar.name] + list(json.loads(profile.avatar_sizes or '{}').values())
+    # Gán tên file đã lưu: ThumbnailerImageField không resize lại (resize_source chỉ áp dụng cho file mới tải lên)
+    profile.avatar = names[max(names)]
+    profile.avatar_sizes = json.dumps(names)
+    profile.avatar_original = None
+    profile.save(update_fields=['avatar', 'avatar_sizes', 'avatar_original'])
+    delete_unused(superseded)
+    return names
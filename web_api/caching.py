@@ -0,0 +1,86 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+# Mỗi nhóm dữ liệu có một số phiên bản riêng; web_api.signals tăng phiên bản khi dữ liệu thay đổi,
+# các khóa cũ không còn được đọc tới và tự hết hạn.
+DEPARTMENTS = 'departments'
+PROFILES = 'profiles'
+# Trang in báo cáo tháng: mỗi nhân viên một phiên bản (member_reports), REPORTS dùng khi dựng lại toàn bộ
+REPORTS = 'reports'
+
+
+def member_reports(member_id):
+    return '%s:%s' % (REPORTS, member_id)
+
+
+# Thông tin người dùng đã xác thực bằng JWT (web_api.authentication), mỗi tài khoản một phiên bản
+def principals(user_id):
+    return 'principals:%s' % user_id
+
+
+def version_key(namespace):
+    return 'kpi:version:%s' % namespace
+
+
+def get_version(namespace):
+    key = version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        # Khởi tạo bằng thời điểm hiện tại (ms) để không trùng với các phiên bản cũ
+        # nếu khóa phiên bản bị memcached loại bỏ
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key, 0)
+    return version
+
+
+def bump_version(*namespaces):
+    for namespace in namespaces:
+        try:
+            cache.incr(version_key(namespace))
+        except ValueError:
+            get_version(namespace)
+
+
+def make_key(namespace, *parts):
+    # Băm phần tham số để khóa luôn hợp lệ với memcached (không khoảng trắng, không quá 250 ký tự)
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return 'kpi:%s:v%s:%s' % (namespace, get_version(namespace), digest)
+
+
+def get_or_set(namespace, parts, builder, timeout=None):
+    """
+    Lấy dữ liệu từ cache theo phiên bản hiện tại của nhóm, nếu chưa có thì gọi builder() rồi lưu lại.
+    """
+    key = make_key(namespace, *parts)
+    data = cache.get(key)
+    if data is None:
+        data = builder()
+        cache.set(key, data, timeout or settings.API_CACHE_TIMEOUT)
+    return data
+
+
+class CachedListMixin(object):
+    """
+    Cache kết quả của ListAPIView theo tham số truy vấn (trang, số dòng, con trỏ...).
+    """
+    cache_namespace = None
+
+    def get_cache_parts(self):
+        return tuple('%s=%s' % item for item in sorted(self.request.query_params.items()))
+
+    def list(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return super(CachedListMixin, self).list(request, *args, **kwargs)
+
+        key = make_key(self.cache_namespace, self.__class__.__name__, *self.get_cache_parts())
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = super(CachedListMixin, self).list(request, *args, **kwargs)
+        cache.set(key, response.data, settings.API_CACHE_TIMEOUT)
+        return response
@@ -0,0 +1,212 @@
+import csv
+import re
+import zipfile
+from datetime import datetime, date, time
+from xml.sax.saxutils import escape
+
+import arrow
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from kpi_manager.models import STATE_TAG_CHOICE
+
+STATE_LABELS = dict(STATE_TAG_CHOICE)
+
+# (tiêu đề cột, trường trong values_list)
+TAG_COLUMNS = (
+    ('Mã KPI', 'id'),
+    ('Nhân viên', 'user__department_member__full_name'),
+    ('Phòng ban', 'user__department__department_name'),
+    ('Chức vụ', 'user__position'),
+    ('KPI', 'tag_name'),
+    ('Bắt đầu', 'period_start'),
+    ('Kết thúc', 'period_end'),
+    ('Trọng số', 'weight'),
+    ('Chỉ tiêu', 'quantity'),
+    ('Đã đạt', 'finished'),
+    ('Tiến độ (%)', 'progress'),
+    ('Trạng thái', 'state'),
+    ('Người tạo', 'created_by__full_name'),
+    ('Ngày tạo', 'created_at'),
+    ('Cập nhật', 'updated_at'),
+)
+TASK_COLUMNS = (
+    ('Mã Task', 'id'),
+    ('Mã KPI', 'tag_id'),
+    ('KPI', 'tag__tag_name'),
+    ('Nhân viên', 'user__department_member__full_name'),
+    ('Phòng ban', 'user__department__department_name'),
+    ('Task', 'task_name'),
+    ('Bắt đầu', 'period_start'),
+    ('Kết thúc', 'period_end'),
+    ('Đơn vị', 'unit_of_measure'),
+    ('Chỉ tiêu', 'target_value'),
+    ('Đã đạt', 'result_value'),
+    ('Tiến độ (%)', 'progress'),
+    ('Trọng số', 'weight'),
+    ('Trạng thái', 'state'),
+    ('Ngày tạo', 'created_at'),
+    ('Cập nhật', 'updated_at'),
+)
+WORK_TIME_COLUMNS = (
+    ('Nhân viên', 'user__department_member__full_name'),
+    ('Phòng ban', 'user__department__department_name'),
+    ('Ngày', 'date'),
+    ('Bắt đầu', 'start_in_day'),
+    ('Kết thúc', 'end_in_day'),
+    ('Nghỉ (giờ)', 'rest_time'),
+    ('Tổng (giờ)', 'time_total'),
+)
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+# Số dòng mỗi lần gửi về trình duyệt khi xuất XLSX
+FLUSH_ROWS = 200
+
+ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def format_value(field, value):
+    if value is None:
+        return ''
+    if field == 'state':
+        return STATE_LABELS.get(value, value)
+    if isinstance(value, datetime):
+        return arrow.get(value).to(settings.TIME_ZONE).strftime('%d/%m/%Y %H:%M')
+    if isinstance(value, date):
+        return value.strftime('%d/%m/%Y')
+    if isinstance(value, time):
+        return value.strftime('%H:%M')
+    return value
+
+
+def export_rows(queryset, columns):
+    """
+    Các dòng của file xuất: đọc bằng values_list().iterator(), không tạo model và không giữ cả kết quả trong bộ nhớ.
+    """
+    fields = [field for _, field in columns]
+    for row in queryset.values_list(*fields).iterator():
+        yield [format_value(field, value) for field, value in zip(fields, row)]
+
+
+class Echo(object):
+    """
+    csv.writer ghi vào đây và nhận lại đúng chuỗi vừa ghi
+    """
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(headers, rows):
+    writer = csv.writer(Echo())
+    yield '\ufeff' + writer.writerow(headers)  # BOM để Excel đọc đúng UTF-8
+    for row in rows:
+        # Tránh Excel hiểu ô bắt đầu bằng =, +, -, @ là công thức
+        yield writer.writerow(["'" + value if isinstance(value, str) and value[:1] in '=+-@' else value
+                               for value in row])
+
+
+class StreamBuffer(object):
+    """
+    File chỉ ghi, không seek: zipfile ghi file nén tuần tự, mỗi lần pop() lấy phần đã ghi để gửi đi.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def xlsx_cell(value):
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, (int, float)):
+        return '<c><v>%s</v></c>' % value
+    value = ILLEGAL_XML_CHARS.sub('', str(value))
+    return '<c t="inlineStr"><is><t xml:space="preserve">%s</t></is></c>' % escape(value)
+
+
+def xlsx_row(values):
+    return ('<row>%s</row>' % ''.join(xlsx_cell(value) for value in values)).encode()
+
+
+XLSX_FILES = (
+    ('[Content_Types].xml',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+     '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+     '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+     '<Default Extension="xml" ContentType="application/xml"/>'
+     '<Override PartName="/xl/workbook.xml" '
+     'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+     '<Override PartName="/xl/worksheets/sheet1.xml" '
+     'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+     '</Types>'),
+    ('_rels/.rels',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+     '<Relationship Id="rId1" '
+     'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+     'Target="xl/workbook.xml"/>'
+     '</Relationships>'),
+    ('xl/workbook.xml',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+     '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+     'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+     '<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets>'
+     '</workbook>'),
+    ('xl/_rels/workbook.xml.rels',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+     '<Relationship Id="rId1" '
+     'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+     'Target="worksheets/sheet1.xml"/>'
+     '</Relationships>'),
+)
+
+
+def stream_xlsx(headers, rows):
+    """
+    File XLSX tối giản (một sheet, chuỗi inline) được nén và gửi dần theo từng nhóm dòng.
+    """
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_FILES:
+            archive.writestr(name, content)
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            sheet.write(xlsx_row(headers))
+            for i, row in enumerate(rows, 1):
+                sheet.write(xlsx_row(row))
+                if i % FLUSH_ROWS == 0:
+                    yield buffer.pop()
+            sheet.write(b'</sheetData></worksheet>')
+    yield buffer.pop()
+
+
+def export_response(queryset, columns, file_type, name):
+    """
+    StreamingHttpResponse của file CSV/XLSX. queryset có thể là [] (không có quyền xem).
+    """
+    headers = [header for header, _ in columns]
+    rows = export_rows(queryset, columns) if not isinstance(queryset, list) else iter(queryset)
+    content = stream_xlsx(headers, rows) if file_type == 'xlsx' else stream_csv(headers, rows)
+
+    response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[file_type])
+    response['Content-Disposition'] = 'attachment; filename="%s-%s.%s"' % (
+        name, arrow.now(settings.TIME_ZONE).format('YYYYMMDD-HHmm'), file_type)
+    return response
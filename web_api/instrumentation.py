@@ -0,0 +1,231 @@
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+import arrow
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger('web_api.slow_requests')
+
+# Các mốc thời gian phản hồi (ms) của histogram; số liệu theo mốc cộng dồn được giữa các tiến trình
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf'))
+SLOT_SECONDS = 60
+PUBLISH_INTERVAL = 30
+INDEX_KEY = 'kpi:instrumentation:index'
+
+
+def get_window():
+    return getattr(settings, 'API_INSTRUMENTATION_WINDOW', 60 * 15)
+
+
+def empty_histogram():
+    return {
+        'count': 0,
+        'buckets': [0] * len(BUCKETS),
+        'latency_ms': 0.0,
+        'max_latency_ms': 0.0,
+        'queries': 0,
+        'max_queries': 0,
+        'db_ms': 0.0,
+    }
+
+
+def add_sample(histogram, latency_ms, queries, db_ms):
+    histogram['count'] += 1
+    histogram['buckets'][next(i for i, bound in enumerate(BUCKETS) if latency_ms <= bound)] += 1
+    histogram['latency_ms'] += latency_ms
+    histogram['max_latency_ms'] = max(histogram['max_latency_ms'], latency_ms)
+    histogram['queries'] += queries
+    histogram['max_queries'] = max(histogram['max_queries'], queries)
+    histogram['db_ms'] += db_ms
+
+
+def merge_histogram(target, histogram):
+    target['count'] += histogram['count']
+    target['buckets'] = [a + b for a, b in zip(target['buckets'], histogram['buckets'])]
+    target['latency_ms'] += histogram['latency_ms']
+    target['max_latency_ms'] = max(target['max_latency_ms'], histogram['max_latency_ms'])
+    target['queries'] += histogram['queries']
+    target['max_queries'] = max(target['max_queries'], histogram['max_queries'])
+    target['db_ms'] += histogram['db_ms']
+    return target
+
+
+def bucket_percentile(histogram, percent):
+    """
+    Phân vị ước lượng: mốc trên của khoảng chứa phân vị (khoảng cuối cùng lấy thời gian lớn nhất).
+    """
+    rank = percent / 100.0 * histogram['count']
+    total = 0
+    for bound, count in zip(BUCKETS, histogram['buckets']):
+        total += count
+        if count and total >= rank:
+            return min(bound, histogram['max_latency_ms'])
+    return histogram['max_latency_ms']
+
+
+def summarize(histogram):
+    count = histogram['count'] or 1
+    return {
+        'count': histogram['count'],
+        'p50_ms': round(bucket_percentile(histogram, 50), 2),
+        'p95_ms': round(bucket_percentile(histogram, 95), 2),
+        'p99_ms': round(bucket_percentile(histogram, 99), 2),
+        'max_ms': round(histogram['max_latency_ms'], 2),
+        'mean_ms': round(histogram['latency_ms'] / count, 2),
+        'mean_queries': round(float(histogram['queries']) / count, 2),
+        'max_queries': histogram['max_queries'],
+        'mean_db_ms': round(histogram['db_ms'] / count, 2),
+        'buckets': dict(zip(['<=%s' % bound for bound in BUCKETS[:-1]] + ['>%s' % BUCKETS[-2]],
+                            histogram['buckets'])),
+    }
+
+
+class EndpointStats(object):
+    """
+    Histogram cuốn chiếu theo từng API trong tiến trình hiện tại: mỗi phút một ô, giữ các ô trong
+    API_INSTRUMENTATION_WINDOW giây gần nhất. Định kỳ ghi bản sao vào cache để lệnh api_stats và các
+    tiến trình khác đọc được.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.slots = {}
+        self.slow_requests = deque(maxlen=getattr(settings, 'API_SLOW_REQUEST_LOG_SIZE', 50))
+        self.process_key = 'kpi:instrumentation:%s:%s' % (socket.gethostname(), os.getpid())
+        self.published_at = 0
+
+    def record(self, key, latency_ms, queries, db_ms, now=None):
+        now = now or time.time()
+        slot = int(now // SLOT_SECONDS) * SLOT_SECONDS
+        with self.lock:
+            slots = self.slots.setdefault(key, deque())
+            if not slots or slots[-1][0] != slot:
+                slots.append((slot, empty_histogram()))
+            add_sample(slots[-1][1], latency_ms, queries, db_ms)
+            self.expire(now)
+        self.publish(now)
+
+    def record_slow(self, entry):
+        with self.lock:
+            self.slow_requests.append(entry)
+
+    def expire(self, now):
+        oldest = now - get_window()
+        for key in list(self.slots):
+            slots = self.slots[key]
+            while slots and slots[0][0] + SLOT_SECONDS <= oldest:
+                slots.popleft()
+            if not slots:
+                del self.slots[key]
+
+    def histograms(self, now=None):
+        """
+        :return: {key: histogram} đã gộp các ô trong cửa sổ thời gian
+        """
+        with self.lock:
+            self.expire(now or time.time())
+            return {key: self._merge(slots) for key, slots in self.slots.items()}
+
+    @staticmethod
+    def _merge(slots):
+        merged = empty_histogram()
+        for _, histogram in slots:
+            merge_histogram(merged, histogram)
+        return merged
+
+    def snapshot(self):
+        return {'histograms': self.histograms(), 'slow_requests': list(self.slow_requests)}
+
+    def publish(self, now=None, force=False):
+        now = now or time.time()
+        if not force and now - self.published_at < PUBLISH_INTERVAL:
+            return
+        self.published_at = now
+        cache.set(self.process_key, self.snapshot(), get_window())
+
+        index = cache.get(INDEX_KEY) or []
+        if self.process_key not in index:
+            cache.set(INDEX_KEY, index + [self.process_key], None)
+
+    def reset(self):
+        with self.lock:
+            self.slots.clear()
+            self.slow_requests.clear()
+            self.published_at = 0
+
+
+stats = EndpointStats()
+
+
+def collect(include_local=True):
+    """
+    Gộp số liệu của tiến trình hiện tại với số liệu các tiến trình khác đã ghi vào cache.
+    :return: {'endpoints': {key: số liệu}, 'slow_requests': [...], 'processes': số tiến trình}
+    """
+    snapshots = []
+    index = cache.get(INDEX_KEY) or []
+    published = cache.get_many(index) if index else {}
+    for key in index:
+        if include_local and key == stats.process_key:
+            continue
+        if key in published:
+            snapshots.append(published[key])
+    if include_local:
+        snapshots.append(stats.snapshot())
+
+    # Bỏ các tiến trình đã dừng (bản ghi đã hết hạn) khỏi danh sách
+    alive = [key for key in index if key in published]
+    if len(alive) != len(index):
+        cache.set(INDEX_KEY, alive, None)
+
+    histograms, slow_requests = {}, []
+    for snapshot in snapshots:
+        for key, histogram in snapshot['histograms'].items():
+            merge_histogram(histograms.setdefault(key, empty_histogram()), histogram)
+        slow_requests.extend(snapshot['slow_requests'])
+
+    slow_requests.sort(key=lambda entry: entry['time'], reverse=True)
+    return {
+        'endpoints': {key: summarize(histogram) for key, histogram in histograms.items()},
+        'slow_requests': slow_requests[:getattr(settings, 'API_SLOW_REQUEST_LOG_SIZE', 50)],
+        'processes': len(snapshots),
+    }
+
+
+def reset():
+    stats.reset()
+    index = cache.get(INDEX_KEY) or []
+    cache.delete_many(index + [INDEX_KEY])
+
+
+def endpoint_key(request):
+    """
+    Khóa của API: đường dẫn bỏ tiền tố web-api/, ví dụ tag/list/statistics.
+    Chỉ các view của web_api được đo (các route này không có tham số trên URL).
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None or not match.func.__module__.startswith('web_api.'):
+        return None
+    path = request.path_info.strip('/')
+    return path[len('web-api/'):] if path.startswith('web-api/') else path
+
+
+def slow_request_entry(request, key, status, latency_ms, queries):
+    top = sorted(queries, key=lambda query: float(query['time']), reverse=True)
+    return {
+        'key': key,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'status': status,
+        'time': arrow.now(settings.TIME_ZONE).isoformat(),
+        'latency_ms': round(latency_ms, 2),
+        'queries': len(queries),
+        'db_ms': round(sum(float(query['time']) for query in queries) * 1000, 2),
+        'top_sql': [{'time_ms': round(float(query['time']) * 1000, 2), 'sql': query['sql'][:1000]}
+                    for query in top[:getattr(settings, 'API_SLOW_REQUEST_TOP_SQL', 5)]],
+    }
@@ -0,0 +1,211 @@
+import json
+import logging
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+import arrow
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from kpi_manager.models import Tag, DepartmentMember
+from . import scopes
+from .avatars import process_avatar
+from .members import get_member
+from .models import Job
+from .rollup import reconcile_tag, reconcile_tags
+from .summary import get_member_month_summary, month_range, rebuild_summaries
+
+logger = logging.getLogger('web_api.jobs')
+
+# Các loại công việc: tên -> JobType, đăng ký bằng @register
+JOBS = {}
+
+
+class JobType(object):
+    def __init__(self, name, func, allowed, max_attempts):
+        self.name = name
+        self.func = func
+        self.allowed = allowed
+        self.max_attempts = max_attempts
+
+
+def director_only(member, params):
+    return member.role == scopes.DIRECTOR
+
+
+def register(name, allowed=director_only, max_attempts=3):
+    """
+    Đăng ký một loại công việc chạy nền.
+    :param allowed: allowed(request.member, params) -> người dùng có được thêm công việc này không
+    """
+    def decorator(func):
+        JOBS[name] = JobType(name, func, allowed, max_attempts)
+        return func
+    return decorator
+
+
+def enqueue(name, params=None, created_by=None, run_at=None):
+    """
+    Thêm một công việc vào hàng đợi.
+    :return: Job
+    """
+    job_type = JOBS[name]
+    return Job.objects.create(name=name, params=json.dumps(params or {}, cls=DjangoJSONEncoder),
+                              created_by=created_by, max_attempts=job_type.max_attempts,
+                              run_at=run_at or timezone.now())
+
+
+def default_worker_id():
+    return '%s:%s' % (socket.gethostname(), os.getpid())
+
+
+def claim(worker_id, limit):
+    """
+    Nhận tối đa limit công việc đến hạn. Mỗi công việc được nhận bằng một câu UPDATE có điều kiện
+    state=PENDING nên nhiều worker chạy cùng lúc không nhận trùng.
+    :return: danh sách id công việc đã nhận
+    """
+    now = timezone.now()
+    candidates = Job.objects.filter(state=Job.PENDING, run_at__lte=now).order_by('run_at', 'id') \
+        .values_list('id', flat=True)[:limit * 2]
+
+    claimed = []
+    for job_id in candidates:
+        if len(claimed) >= limit:
+            break
+        if Job.objects.filter(pk=job_id, state=Job.PENDING).update(
+                state=Job.RUNNING, locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1, updated_at=now):
+            claimed.append(job_id)
+    return claimed
+
+
+def run(job_id):
+    """
+    Chạy một công việc đã nhận. Lỗi thì chờ JOB_RETRY_DELAY * 2^(lần thử - 1) giây rồi chạy lại,
+    hết số lần thử thì chuyển sang Thất Bại.
+    :return: True nếu thành công
+    """
+    job = Job.objects.get(pk=job_id)
+    job_type = JOBS.get(job.name)
+    jobs = Job.objects.filter(pk=job_id)
+    try:
+        if job_type is None:
+            raise LookupError('Không có loại công việc %s!' % job.name)
+        with transaction.atomic():
+            result = job_type.func(json.loads(job.params))
+    except Exception:
+        now = timezone.now()
+        error = traceback.format_exc()
+        logger.exception('Công việc %s lỗi (lần %s/%s)', job, job.attempts, job.max_attempts)
+        if job_type is not None and job.attempts < job.max_attempts:
+            delay = timedelta(seconds=settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1))
+            jobs.update(state=Job.PENDING, run_at=now + delay, error=error, locked_by=None, locked_at=None,
+                        updated_at=now)
+        else:
+            jobs.update(state=Job.FAILED, error=error, finished_at=now, updated_at=now)
+        return False
+
+    now = timezone.now()
+    jobs.update(state=Job.DONE, result=json.dumps(result, cls=DjangoJSONEncoder), error=None, finished_at=now,
+                updated_at=now)
+    return True
+
+
+def requeue_stale():
+    """
+    Công việc đang chạy quá JOB_TIMEOUT giây (worker bị dừng giữa chừng) được chạy lại hoặc chuyển sang Thất Bại.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(state=Job.RUNNING, locked_at__lt=now - timedelta(seconds=settings.JOB_TIMEOUT))
+    requeued = stale.filter(attempts__lt=F('max_attempts')).update(state=Job.PENDING, locked_by=None,
+                                                                   locked_at=None, run_at=now, updated_at=now)
+    failed = stale.update(state=Job.FAILED, error='Quá thời gian chạy!', finished_at=now, updated_at=now)
+    return requeued + failed
+
+
+def run_pending(worker_id=None, limit=100):
+    """
+    Chạy lần lượt các công việc đến hạn trong tiến trình hiện tại.
+    :return: số công việc đã chạy
+    """
+    job_ids = claim(worker_id or default_worker_id(), limit)
+    for job_id in job_ids:
+        run(job_id)
+    return len(job_ids)
+
+
+def can_view_member(member, params):
+    """
+    Giám đốc, trưởng phòng cùng phòng ban hoặc chính nhân viên đó
+    """
+    if member.role == scopes.DIRECTOR:
+        return True
+    try:
+        target = get_member(department_member_id=int(params.get('profile_id')))
+    except (TypeError, ValueError, DepartmentMember.DoesNotExist):
+        return False
+    return scopes.in_scope(member, target, include_self=True)
+
+
+def owns_tag(member, params):
+    try:
+        tag_id = int(params.get('tag_id'))
+    except (TypeError, ValueError):
+        return False
+    return bool(member.department_member) and \
+        Tag.objects.filter(id=tag_id, user=member.department_member, removed=False).exists()
+
+
+@register('reconcile_tag', allowed=owns_tag)
+def reconcile_tag_job(params):
+    """
+    Đếm lại kết quả của các Task và cập nhật cho một Tag (giống my-tag/computation)
+    """
+    tag = Tag.objects.get(id=params['tag_id'], removed=False)
+    reconcile_tag(tag)
+    return {'tagId': tag.id, 'finished': tag.finished, 'progress': tag.progress}
+
+
+@register('reconcile_tags')
+def reconcile_tags_job(params):
+    tags = Tag.objects.filter(removed=False)
+    if params.get('member_ids'):
+        tags = tags.filter(user_id__in=params['member_ids'])
+    return {'updated': reconcile_tags(tags)}
+
+
+@register('rebuild_monthly_summary')
+def rebuild_monthly_summary_job(params):
+    return {'rows': rebuild_summaries(params.get('member_ids'))}
+
+
+@register('monthly_report', allowed=can_view_member)
+def monthly_report_job(params):
+    """
+    Số liệu báo cáo tháng của một nhân viên (như trang in KPI): số liệu tháng và danh sách KPI
+    """
+    member = get_member(department_member_id=params['profile_id'])
+    month = arrow.Arrow(int(params['year']), int(params['month']), 1, tzinfo=settings.TIME_ZONE)
+    start, end = month_range(month.datetime)
+    tags = Tag.objects.filter(user=member, created_at__range=(start, end), removed=False).order_by('-updated_at')
+
+    data = get_member_month_summary(member, start)
+    data['tags'] = [{'tagId': tag_id, 'tagName': tag_name, 'weight': weight, 'quantity': quantity,
+                     'finished': finished, 'progress': progress, 'state': state}
+                    for tag_id, tag_name, weight, quantity, finished, progress, state in
+                    tags.values_list('id', 'tag_name', 'weight', 'quantity', 'finished', 'progress', 'state')]
+    return data
+
+
+@register('avatar_sizes', allowed=lambda member, params: False)
+def avatar_sizes_job(params):
+    """
+    Tạo các kích thước ảnh đại diện sau khi tải lên (chỉ được thêm bởi avatar/upload/)
+    """
+    names = process_avatar(params['profile_id'], params['original'])
+    return {'sizes': names, 'skipped': names is None}
@@ -0,0 +1,54 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from web_api import instrumentation
+
+SORT_FIELDS = ('p95_ms', 'p50_ms', 'count', 'mean_queries', 'mean_db_ms', 'max_ms')
+
+
+class Command(BaseCommand):
+    help = 'Số liệu thời gian phản hồi, số câu truy vấn của từng API do InstrumentationMiddleware ghi lại ' \
+           '(gộp từ các tiến trình web qua cache) và các request chậm.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sort', choices=SORT_FIELDS, default='p95_ms')
+        parser.add_argument('--limit', type=int, default=0, help='Chỉ hiện bấy nhiêu API đầu tiên')
+        parser.add_argument('--slow', action='store_true', help='Hiện các request chậm kèm câu SQL')
+        parser.add_argument('--json', action='store_true', help='In kết quả dạng JSON')
+        parser.add_argument('--reset', action='store_true', help='Xóa số liệu đã ghi')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            instrumentation.reset()
+            self.stdout.write('Đã xóa số liệu.')
+            return
+
+        data = instrumentation.collect(include_local=False)
+        if options['json']:
+            self.stdout.write(json.dumps(data, indent=2, ensure_ascii=False))
+            return
+
+        if not settings.API_INSTRUMENTATION:
+            self.stdout.write(self.style.WARNING('API_INSTRUMENTATION đang tắt, số liệu có thể đã cũ.'))
+
+        endpoints = sorted(data['endpoints'].items(), key=lambda item: item[1][options['sort']], reverse=True)
+        if options['limit']:
+            endpoints = endpoints[:options['limit']]
+
+        self.stdout.write('%s tiến trình, %s API' % (data['processes'], len(data['endpoints'])))
+        self.stdout.write('%-36s %7s %9s %9s %9s %9s %9s' % ('api', 'count', 'p50 (ms)', 'p95 (ms)', 'max (ms)',
+                                                            'queries', 'db (ms)'))
+        for key, item in endpoints:
+            self.stdout.write('%-36s %7s %9.1f %9.1f %9.1f %9.1f %9.1f' % (
+                key, item['count'], item['p50_ms'], item['p95_ms'], item['max_ms'], item['mean_queries'],
+                item['mean_db_ms']))
+
+        if options['slow']:
+            for entry in data['slow_requests']:
+                self.stdout.write('\n%s %s %s: %.0f ms, %s câu truy vấn (%.0f ms)' % (
+                    entry['time'], entry['method'], entry['path'], entry['latency_ms'], entry['queries'],
+                    entry['db_ms']))
+                for item in entry['top_sql']:
+                    self.stdout.write('%10.1f ms  %s' % (item['time_ms'], item['sql']))
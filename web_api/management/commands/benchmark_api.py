@@ -0,0 +1,300 @@
+import json
+import math
+import time
+
+import arrow
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from kpi_manager.models import DepartmentMember, Task, WorkTime, Comment
+from web_api import caching, urls
+from web_api.models import Job
+
+# Kịch bản cho từng route trong web_api/urls.py: (phương thức, vai trò gọi API, tham số).
+# Tham số dạng chuỗi được điền bằng str.format từ dữ liệu mẫu (xem Command.get_context).
+# None: route không đo được, kèm lý do.
+SCENARIOS = {
+    'api-info/': ('GET', 'director', {}),
+    'web-api/current-profile/get/': ('GET', 'employee', {}),
+    'web-api/profile/info/': ('GET', 'employee', {}),
+    'web-api/profile/info/specific/': ('GET', 'manager', {'user_id': '{user_id}'}),
+    'web-api/profile/list/no-pagination/': ('GET', 'director', {'department_id': '{department_id}'}),
+    'web-api/profile/update/': ('POST', 'employee', {'fullName': 'Nhân Viên Đo Hiệu Năng', 'birthDay': '1990-01-01',
+                                                     'idNumber': '123456789', 'address': 'Hà Nội'}),
+    'web-api/department/list/': ('GET', 'director', {}),
+    'web-api/department/list/no-pagination/': ('GET', 'director', {}),
+    'web-api/members/list/': ('GET', 'director', {'department_id': '{department_id}'}),
+    'web-api/tag/list/': ('GET', 'director', {'query': 'all'}),
+    'web-api/tag/member/': ('GET', 'manager', {'user_id': '{user_id}', 'query': 'all'}),
+    'web-api/my-tag/list/': ('GET', 'employee', {'query': 'all'}),
+    'web-api/my-tag/list/statistics/': ('GET', 'employee', {'query': 'all'}),
+    'web-api/tag/member/list/statistics/': ('GET', 'manager', {'user_id': '{user_id}'}),
+    'web-api/tag/list/statistics/': ('GET', 'director', {'query': 'all'}),
+    'web-api/tag/member/detail/': ('GET', 'manager', {'user_id': '{user_id}', 'tag_id': '{tag_id}'}),
+    'web-api/new-tag/add/': ('POST', 'manager', {'profile_id': '{profile_id}', 'tag_name': 'KPI đo hiệu năng',
+                                                 'quantity': 10, 'weight': 1, 'period_start': '{now}',
+                                                 'period_end': '{next_week}'}),
+    'web-api/tag/member/edit/': ('POST', 'manager', {'profile_id': '{profile_id}', 'tag_id': '{tag_id}',
+                                                     'tag_request': 'edit', 'tag_name': 'KPI đo hiệu năng',
+                                                     'quantity': 10, 'weight': 1, 'period_start': '{now}',
+                                                     'period_end': '{next_week}'}),
+    'web-api/my-tag/detail/': ('GET', 'employee', {'tag_id': '{tag_id}'}),
+    'web-api/my-tag/list/no-pagination/': ('GET', 'employee', {}),
+    'web-api/my-tag/edit/': ('POST', 'employee', {'profile_id': '{profile_id}', 'tag_id': '{tag_id}', 'finished': 1,
+                                                  'tag_state': 'Đang Thực Hiện'}),
+    'web-api/my-tag/computation/': ('POST', 'employee', {'profile_id': '{profile_id}', 'tag_id': '{tag_id}'}),
+    'web-api/task/list/': ('GET', 'manager', {'user_id': '{user_id}', 'tag_id': '{tag_id}'}),
+    'web-api/my-task/list/': ('GET', 'employee', {'tag_id': '{tag_id}'}),
+    'web-api/task/member/detail/': ('GET', 'manager', {'user_id': '{user_id}', 'task_id': '{task_id}'}),
+    'web-api/new-task/add/': ('POST', 'employee', {'tag_id': '{tag_id}', 'task_name': 'Task đo hiệu năng',
+                                                   'target_value': 5}),
+    'web-api/new-task/batch-add/': ('POST', 'employee', {'tag_id': '{tag_id}', 'tasks': '{batch_tasks}'}),
+    'web-api/my-task/edit/': ('POST', 'employee', {'tag_id': '{tag_id}', 'task_id': '{task_id}',
+                                                   'edit_task': 'compact', 'result_value': 1,
+                                                   'task_state': 'Đang Thực Hiện'}),
+    'web-api/my-task/detail/': ('GET', 'employee', {'task_id': '{task_id}'}),
+    'web-api/task/comment/list/': ('GET', 'manager', {'task_id': '{task_id}'}),
+    'web-api/my-task/comment/list/': ('GET', 'employee', {'task_id': '{task_id}'}),
+    'web-api/my-task/comment/add/': ('POST', 'employee', {'task_id': '{task_id}', 'cmt_content': 'Bình luận'}),
+    'web-api/task/comment/add/': ('POST', 'manager', {'user_id': '{user_id}', 'task_id': '{task_id}',
+                                                      'cmt_content': 'Bình luận'}),
+    'web-api/my-task/comment/edit/': ('POST', 'employee', {'comment_id': '{comment_id}', 'cmt_request': 'edit',
+                                                           'cmt_content': 'Bình luận'}),
+    'web-api/work-time/member/list/': ('GET', 'manager', {'user_id': '{user_id}'}),
+    'web-api/my-work-time/list/': ('GET', 'employee', {}),
+    'web-api/my-work-time/add/': ('POST', 'employee', {'date': '{now}', 'start_in_day': '{start_in_day}',
+                                                       'end_in_day': '{end_in_day}', 'rest_time': 1}),
+    'web-api/my-work-time/edit/': ('POST', 'employee', {'work_time_id': '{work_time_id}', 'work_time_request': 'edit',
+                                                        'date': '{now}', 'start_in_day': '{start_in_day}',
+                                                        'end_in_day': '{end_in_day}', 'rest_time': 1}),
+    'web-api/work-time/member/statistic/': ('GET', 'manager', {'user_id': '{user_id}'}),
+    'web-api/my-work-time/statistic/': ('GET', 'employee', {}),
+    'web-api/instrumentation/stats/': ('GET', 'director', {}),
+    'web-api/tag/export/': ('GET', 'director', {'query': 'all'}),
+    'web-api/task/export/': ('GET', 'director', {'query': 'all'}),
+    'web-api/work-time/export/': ('GET', 'director', {'file_type': 'xlsx'}),
+    'web-api/job/add/': ('POST', 'director', {'name': 'reconcile_tags', 'params': '{{}}'}),
+    'web-api/job/status/': ('GET', 'director', {'job_id': '{job_id}'}),
+    'web-api/job/result/': ('GET', 'director', {'job_id': '{job_id}'}),
+    'web-api/my-work-time/import/': None,
+    'web-api/avatar/upload/': None,
+}
+SKIP_REASONS = {
+    'web-api/my-work-time/import/': 'cần gửi file CSV',
+    'web-api/avatar/upload/': 'ghi file ảnh vào MEDIA_ROOT',
+}
+
+
+def list_routes(patterns=None, prefix=''):
+    """
+    Các đường dẫn cụ thể (không tham số) của web_api/urls.py theo thứ tự khai báo.
+    """
+    routes = []
+    for pattern in urls.urlpatterns if patterns is None else patterns:
+        path = prefix + pattern.regex.pattern.lstrip('^').rstrip('$')
+        if hasattr(pattern, 'url_patterns'):
+            routes.extend(list_routes(pattern.url_patterns, path))
+        elif path not in routes:
+            routes.append(path)
+    return routes
+
+
+def percentile(values, percent):
+    """
+    Phân vị theo hạng gần nhất.
+    """
+    values = sorted(values)
+    return values[max(int(math.ceil(percent / 100.0 * len(values))) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = 'Gọi lần lượt mọi route trong web_api/urls.py bằng test client trên dữ liệu hiện có (xem seed_data), ' \
+           'ghi p50/p95 thời gian phản hồi và số câu truy vấn ra file JSON để so sánh giữa các commit. ' \
+           'Các API POST chạy trong transaction rồi hoàn tác.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='Số lần gọi mỗi route')
+        parser.add_argument('--output', help='Ghi kết quả ra file JSON')
+        parser.add_argument('--compare', help='File JSON kết quả cũ để so sánh')
+        parser.add_argument('--threshold', type=float, default=20.0,
+                            help='Báo chậm đi khi p95 tăng quá bấy nhiêu phần trăm')
+        parser.add_argument('--username', help='Tài khoản nhân viên dùng làm dữ liệu mẫu')
+        parser.add_argument('--route', nargs='+', help='Chỉ đo những route này')
+        parser.add_argument('--cold-cache', action='store_true', help='Làm mới cache trước mỗi lần gọi')
+
+    def handle(self, *args, **options):
+        members = self.get_members(options['username'])
+        # Công việc đã hoàn thành dùng cho job/status/ và job/result/, xóa sau khi đo
+        job = Job.objects.create(name='reconcile_tags', state=Job.DONE, result='{"updated": 0}',
+                                 created_by=members['director'].department_member)
+        try:
+            context = self.get_context(members)
+            context['job_id'] = job.id
+            result = self.run(members, context, options)
+        finally:
+            job.delete()
+
+        self.report(result)
+        for path, reason in result['skipped'].items():
+            self.stdout.write('Bỏ qua /%s: %s' % (path, reason))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(result, f, indent=2, sort_keys=True)
+            self.stdout.write('Đã ghi kết quả vào %s' % options['output'])
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                regressions = self.compare(json.load(f), result, options['threshold'])
+            if regressions:
+                raise CommandError('%s route chậm đi hoặc tăng số câu truy vấn.' % regressions)
+
+    def run(self, members, context, options):
+        routes = options['route'] or list_routes()
+        result = {
+            'created_at': arrow.now(settings.TIME_ZONE).isoformat(),
+            'database': connection.vendor,
+            'repeat': options['repeat'],
+            'endpoints': {},
+            'skipped': {},
+        }
+        # Test client gửi Host: testserver
+        with override_settings(ALLOWED_HOSTS=list(settings.ALLOWED_HOSTS) + ['testserver']):
+            clients = {}
+            for role, member in members.items():
+                clients[role] = Client()
+                clients[role].force_login(member.department_member.user)
+
+            for path in routes:
+                scenario = SCENARIOS.get(path)
+                if scenario is None:
+                    result['skipped'][path] = SKIP_REASONS.get(path, 'chưa có kịch bản')
+                    continue
+                method, role, params = scenario
+                data = {key: value.format(**context) if isinstance(value, str) else value
+                        for key, value in params.items()}
+                result['endpoints'][path] = self.measure(clients[role], method, '/' + path, data, options)
+                result['endpoints'][path]['role'] = role
+        return result
+
+    @staticmethod
+    def get_members(username=None):
+        """
+        Nhân viên có KPI, task, bình luận và giờ làm việc; trưởng phòng của nhân viên đó và giám đốc.
+        Task và KPI mẫu phải chưa hoàn thành để các API chỉnh sửa không bị từ chối.
+        """
+        tasks = Task.objects.filter(removed=False, tag__removed=False, user__removed=False,
+                                    user__department__isnull=False, user__department_member__role='EM') \
+            .exclude(state='CO').exclude(tag__state='CO')
+        if username:
+            tasks = tasks.filter(user__department_member__user__username=username)
+        task = tasks.select_related('user__department_member__user').order_by('id').first()
+        if task is None:
+            raise CommandError('Chưa đủ dữ liệu mẫu, hãy chạy seed_data trước.')
+
+        employee = task.user
+        manager = DepartmentMember.objects.filter(department_id=employee.department_id, is_leader=True,
+                                                  removed=False).select_related('department_member__user').first()
+        director = DepartmentMember.objects.filter(department_member__role='DR', removed=False) \
+            .select_related('department_member__user').first()
+        if manager is None or director is None:
+            raise CommandError('Chưa có trưởng phòng hoặc giám đốc, hãy chạy seed_data trước.')
+
+        employee.benchmark_task = task
+        return {'director': director, 'manager': manager, 'employee': employee}
+
+    @staticmethod
+    def get_context(members):
+        employee = members['employee']
+        task = employee.benchmark_task
+        work_time = WorkTime.objects.filter(user=employee, removed=False).order_by('id').first()
+        comment = Comment.objects.filter(task__user=employee, user_id=employee.department_member_id,
+                                         removed=False).order_by('id').first()
+        if work_time is None or comment is None:
+            raise CommandError('Nhân viên mẫu chưa có giờ làm việc hoặc bình luận, hãy chạy seed_data trước.')
+
+        now = arrow.now(settings.TIME_ZONE)
+        return {
+            'user_id': employee.department_member.user_id,
+            'profile_id': employee.department_member_id,
+            'department_id': employee.department_id,
+            'tag_id': task.tag_id,
+            'task_id': task.id,
+            'comment_id': comment.id,
+            'work_time_id': work_time.id,
+            'now': now.isoformat(),
+            'next_week': now.shift(weeks=1).isoformat(),
+            'start_in_day': now.replace(hour=8, minute=0).isoformat(),
+            'end_in_day': now.replace(hour=17, minute=0).isoformat(),
+            'batch_tasks': json.dumps([{'task_name': 'Task đo hiệu năng %s' % i, 'target_value': 5}
+                                       for i in range(20)]),
+        }
+
+    @staticmethod
+    def call(client, method, path, data):
+        if method == 'POST':
+            # Không để lại dữ liệu sau khi đo
+            with transaction.atomic():
+                response = client.post(path, data)
+                transaction.set_rollback(True)
+            return response
+        response = client.get(path, data)
+        if response.streaming:
+            # Tính cả thời gian tạo nội dung của file xuất
+            b''.join(response.streaming_content)
+        return response
+
+    def measure(self, client, method, path, data, options):
+        self.call(client, method, path, data)  # Làm nóng
+
+        timings, queries, response = [], [], None
+        for _ in range(max(options['repeat'], 1)):
+            if options['cold_cache']:
+                caching.bump_version(caching.DEPARTMENTS, caching.PROFILES)
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = self.call(client, method, path, data)
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(len(captured.captured_queries))
+
+        body = response.json() if response.get('Content-Type', '').startswith('application/json') else None
+        return {
+            'method': method,
+            'status': response.status_code,
+            'ok': body.get('ok') if isinstance(body, dict) else None,
+            'queries': max(queries),
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'mean_ms': round(sum(timings) / len(timings), 2),
+        }
+
+    def report(self, result):
+        self.stdout.write('%-45s %6s %6s %8s %10s %10s' % ('route', 'method', 'status', 'queries', 'p50 (ms)',
+                                                            'p95 (ms)'))
+        for path, item in result['endpoints'].items():
+            self.stdout.write('%-45s %6s %6s %8s %10.1f %10.1f' % (
+                '/' + path, item['method'], item['status'], item['queries'], item['p50_ms'], item['p95_ms']))
+
+    def compare(self, baseline, result, threshold):
+        """
+        So sánh với kết quả cũ: tăng số câu truy vấn hoặc p95 tăng quá threshold phần trăm.
+        :return: số route bị chậm đi
+        """
+        regressions = 0
+        self.stdout.write('\nSo sánh với kết quả lúc %s:' % baseline.get('created_at'))
+        for path, item in result['endpoints'].items():
+            old = baseline.get('endpoints', {}).get(path)
+            if old is None:
+                continue
+            slower = old['p95_ms'] and (item['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 > threshold
+            more_queries = item['queries'] > old['queries']
+            if slower or more_queries:
+                regressions += 1
+                self.stdout.write(self.style.ERROR('%-45s queries %s -> %s, p95 %.1f -> %.1f ms' % (
+                    '/' + path, old['queries'], item['queries'], old['p95_ms'], item['p95_ms'])))
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS('Không có route nào chậm đi.'))
+        return regressions
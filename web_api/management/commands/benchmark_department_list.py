@@ -0,0 +1,77 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from kpi_manager.models import Profile, Department, DepartmentMember
+from web_api import caching
+from web_api.members import resolve_acting_member
+from web_api.views.department import GetDepartmentListView
+
+
+class Command(BaseCommand):
+    help = 'Đo số câu truy vấn và thời gian của API danh sách phòng ban với 10/100/1000 phòng ban ' \
+           '(dữ liệu mẫu được tạo trong transaction rồi hoàn tác).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--repeat', type=int, default=5, help='Số lần gọi API cho mỗi kích thước')
+
+    def handle(self, *args, **options):
+        self.stdout.write('%10s %10s %12s %12s' % ('departments', 'queries', 'min (ms)', 'avg (ms)'))
+        for size in options['sizes']:
+            with transaction.atomic():
+                user = self.create_departments(size)
+                queries, timings = self.measure(user, size, options['repeat'])
+                transaction.set_rollback(True)
+
+            self.stdout.write('%10s %10s %12.1f %12.1f' % (size, queries, min(timings) * 1000,
+                                                           sum(timings) / len(timings) * 1000))
+
+    @staticmethod
+    def create_departments(size):
+        user = User.objects.create_user('benchmark-director', password=None)
+        director = Profile.objects.create(user=user, full_name='Benchmark Director', role='DR', sex='M')
+
+        departments = Department.objects.bulk_create(
+            Department(department_name='Benchmark %s' % i, department_level=i) for i in range(size))
+        if not all(item.id for item in departments):
+            departments = Department.objects.filter(department_name__startswith='Benchmark ')
+
+        users = User.objects.bulk_create(User(username='benchmark-leader-%s' % item.id) for item in departments)
+        if not all(item.id for item in users):
+            users = User.objects.filter(username__startswith='benchmark-leader-').order_by('id')
+        profiles = Profile.objects.bulk_create(
+            Profile(user=item, full_name=item.username, role='MG', sex='F') for item in users)
+        if not all(item.id for item in profiles):
+            profiles = Profile.objects.filter(user__username__startswith='benchmark-leader-').order_by('id')
+
+        DepartmentMember.objects.bulk_create(
+            DepartmentMember(department=department, department_member=profile, position='Trưởng Phòng', is_leader=True)
+            for department, profile in zip(departments, profiles))
+        DepartmentMember.objects.create(department_member=director, department=departments[0])
+        return user
+
+    @staticmethod
+    def measure(user, size, repeat):
+        factory = APIRequestFactory()
+        view = GetDepartmentListView.as_view()
+        queries, timings = 0, []
+        for _ in range(repeat):
+            # Bỏ qua cache để đo truy vấn thật
+            caching.bump_version(caching.DEPARTMENTS)
+            request = factory.get('/web-api/department/list/', {'page_size': size})
+            force_authenticate(request, user)
+            request.member = resolve_acting_member(user)
+
+            start = time.perf_counter()
+            with CaptureQueriesContext(connection) as context:
+                response = view(request)
+                response.render()
+            timings.append(time.perf_counter() - start)
+            queries = len(context.captured_queries)
+            assert response.data['count'] == size, response.data
+        return queries, timings
@@ -0,0 +1,154 @@
+import re
+
+import arrow
+from django.contrib.auth.models import User
+from django.core.exceptions import EmptyResultSet
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models.query import QuerySet
+from django.urls import resolve
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from kpi_manager.models import Profile, Tag, Task
+from web_api.members import resolve_acting_member
+
+# (đường dẫn API, tham số GET) - {member}, {tag}, {task} được thay bằng dữ liệu mẫu
+LIST_ENDPOINTS = (
+    ('/web-api/tag/list/', {'query': 'all'}),
+    ('/web-api/tag/list/', {'query': 'current'}),
+    ('/web-api/tag/list/', {'query': 'tmonth'}),
+    ('/web-api/tag/list/', {'query': 'outdated'}),
+    ('/web-api/tag/member/', {'user_id': '{member}', 'query': 'all'}),
+    ('/web-api/tag/member/', {'user_id': '{member}', 'query': 'current'}),
+    ('/web-api/my-tag/list/', {'query': 'all'}),
+    ('/web-api/task/list/', {'user_id': '{member}', 'tag_id': '{tag}'}),
+    ('/web-api/my-task/list/', {'tag_id': '{tag}'}),
+    ('/web-api/task/comment/list/', {'task_id': '{task}'}),
+    ('/web-api/my-task/comment/list/', {'task_id': '{task}'}),
+    ('/web-api/work-time/member/list/', {'user_id': '{member}'}),
+    ('/web-api/work-time/member/list/', {'user_id': '{member}', 'month_request': '{month}', 'year_request': '{year}'}),
+    ('/web-api/my-work-time/list/', {}),
+    ('/web-api/my-work-time/list/', {'month_request': '{month}', 'year_request': '{year}'}),
+    ('/web-api/members/list/', {}),
+    ('/web-api/department/list/', {}),
+)
+
+SEQ_SCAN_PATTERNS = (
+    re.compile(r'Seq Scan on (\w+)'),  # PostgreSQL
+    re.compile(r'^SCAN (?:TABLE )?(\w+)(?!.*USING (?:COVERING )?INDEX)'),  # SQLite
+)
+
+
+def explain_queryset(queryset):
+    """
+    Chạy EXPLAIN cho câu truy vấn của QuerySet.
+    :return: danh sách dòng kế hoạch thực thi, danh sách bảng bị quét tuần tự
+    """
+    sql, params = queryset.query.sql_with_params()
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        plan = [str(row[-1]) for row in cursor.fetchall()]
+
+    seq_scans = []
+    for line in plan:
+        for pattern in SEQ_SCAN_PATTERNS:
+            match = pattern.search(line.strip())
+            if match and match.group(1) not in seq_scans:
+                seq_scans.append(match.group(1))
+    return plan, seq_scans
+
+
+class Command(BaseCommand):
+    help = 'Chạy EXPLAIN cho truy vấn của từng API danh sách và báo cáo các bảng bị quét tuần tự (Seq Scan).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='Tài khoản gọi API (mặc định: Giám đốc đầu tiên)')
+        parser.add_argument('--member', type=int, help='user_id của nhân viên được xem (mặc định: chính tài khoản gọi API)')
+        parser.add_argument('--force-index', action='store_true',
+                            help='PostgreSQL: tắt enable_seqscan để kiểm tra chỉ mục có dùng được khi bảng còn ít dữ liệu')
+        parser.add_argument('--plan', action='store_true', help='In toàn bộ kế hoạch thực thi')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['username'])
+        member_user_id = options['member'] or user.id
+        tag = Tag.objects.filter(user__department_member__user_id=member_user_id, removed=False).first()
+        task = Task.objects.filter(tag=tag, removed=False).first() if tag else None
+        now = arrow.now()
+        sample = {
+            'member': member_user_id,
+            'tag': tag.id if tag else None,
+            'task': task.id if task else None,
+            'month': now.month,
+            'year': now.year,
+        }
+
+        with transaction.atomic():
+            if options['force_index'] and connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            total = self.explain_endpoints(user, sample, options['plan'])
+
+        if total:
+            self.stdout.write(self.style.WARNING('%s truy vấn có quét tuần tự.' % total))
+        else:
+            self.stdout.write(self.style.SUCCESS('Không có truy vấn nào quét tuần tự.'))
+
+    def get_user(self, username):
+        try:
+            if username:
+                return User.objects.get(username=username)
+            return Profile.objects.filter(role='DR', removed=False).select_related('user').earliest('id').user
+        except (User.DoesNotExist, Profile.DoesNotExist):
+            raise CommandError('Không tìm thấy tài khoản để gọi API!')
+
+    def explain_endpoints(self, user, sample, show_plan):
+        factory = APIRequestFactory()
+        total = 0
+        for path, params in LIST_ENDPOINTS:
+            params = {key: value.format(**sample) for key, value in params.items()}
+            label = '%s?%s' % (path, '&'.join('%s=%s' % item for item in sorted(params.items())))
+            if 'None' in params.values():
+                self.stdout.write('%s: bỏ qua (không có dữ liệu mẫu)' % label)
+                continue
+
+            queryset = self.get_list_queryset(factory, user, path, params)
+            if not isinstance(queryset, QuerySet):
+                self.stdout.write('%s: bỏ qua (API không trả về QuerySet)' % label)
+                continue
+
+            try:
+                plan, seq_scans = explain_queryset(queryset)
+            except EmptyResultSet:
+                self.stdout.write('%s: bỏ qua (ngoài phạm vi của tài khoản gọi API, không truy vấn)' % label)
+                continue
+            if seq_scans:
+                total += 1
+                self.stdout.write(self.style.WARNING('%s: Seq Scan %s' % (label, ', '.join(seq_scans))))
+            else:
+                self.stdout.write('%s: OK' % label)
+            if show_plan:
+                for line in plan:
+                    self.stdout.write('    %s' % line)
+        return total
+
+    def get_list_queryset(self, factory, user, path, params):
+        """
+        Lấy QuerySet mà API danh sách sẽ phân trang, giống như khi gọi API thật (kể cả filter_backends lọc theo
+        phạm vi của người gọi).
+        """
+        match = resolve(path)
+        request = factory.get(path, params)
+        force_authenticate(request, user)
+        request.member = resolve_acting_member(user)
+
+        view = match.func.cls(**match.func.initkwargs)
+        view.args, view.kwargs = match.args, match.kwargs
+        view.format_kwarg = None
+        view.request = view.initialize_request(request)
+        queryset = view.get_queryset()
+        if isinstance(queryset, QuerySet):
+            queryset = view.filter_queryset(queryset)
+        if isinstance(queryset, QuerySet) and view.paginator is not None:
+            return queryset[:view.paginator.get_page_size(view.request)]
+        return queryset
@@ -0,0 +1,42 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kpi_manager.models import DepartmentMember
+from web_api.members import member_queryset
+from web_api.work_times import WorkTimeImport
+
+
+class Command(BaseCommand):
+    help = 'Nhập giờ làm việc từ file CSV (cột date, start, end, rest và username nếu không dùng --username). ' \
+           'Ngày đã có giờ làm việc được bỏ qua.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Đường dẫn file CSV')
+        parser.add_argument('--username', help='Nhập toàn bộ file cho nhân viên này')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Số dòng mỗi lần bulk_create')
+        parser.add_argument('--encoding', default='utf-8-sig')
+        parser.add_argument('--dry-run', action='store_true', help='Chỉ kiểm tra, không ghi dữ liệu')
+
+    def handle(self, *args, **options):
+        member = None
+        if options['username']:
+            try:
+                member = member_queryset().get(department_member__user__username=options['username'], removed=False)
+            except DepartmentMember.DoesNotExist:
+                raise CommandError('Không tồn tại nhân viên %s!' % options['username'])
+
+        importer = WorkTimeImport(member=member, chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+        try:
+            with open(options['path'], encoding=options['encoding'], newline='') as f:
+                result = importer.run(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        except csv.Error as e:
+            raise CommandError('File CSV không hợp lệ: %s' % e)
+
+        for error in result['errors']:
+            self.stdout.write(self.style.WARNING('Dòng %s: %s' % (error['line'], error['msg'])))
+        self.stdout.write(self.style.SUCCESS(
+            '%s%s dòng, nhập %s, trùng %s, lỗi %s.' % ('(Chạy thử) ' if options['dry_run'] else '', result['rows'],
+                                                  result['created'], result['duplicates'], result['error_count'])))
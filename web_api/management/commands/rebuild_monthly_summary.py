@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from web_api.summary import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = 'Dựng lại bảng số liệu tháng của nhân viên (MemberMonthlySummary) từ Tag và WorkTime.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--member', type=int, nargs='*', dest='member_ids',
+                            help='Chỉ dựng lại cho các DepartmentMember này')
+
+    def handle(self, *args, **options):
+        count = rebuild_summaries(member_ids=options['member_ids'] or None)
+        self.stdout.write(self.style.SUCCESS('Đã dựng lại %s dòng số liệu tháng.' % count))
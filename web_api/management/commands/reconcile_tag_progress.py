@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from kpi_manager.models import Tag
+from web_api.rollup import reconcile_tags
+
+
+class Command(BaseCommand):
+    help = 'Đếm lại Tag.finished/progress từ các Task đã hoàn thành, sửa những KPI bị lệch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tag', type=int, nargs='*', dest='tag_ids', help='Chỉ đối soát các KPI này')
+        parser.add_argument('--include-removed', action='store_true', help='Đối soát cả KPI đã xóa')
+
+    def handle(self, *args, **options):
+        tags = Tag.objects.all()
+        if not options['include_removed']:
+            tags = tags.filter(removed=False)
+        if options['tag_ids']:
+            tags = tags.filter(id__in=options['tag_ids'])
+
+        updated = reconcile_tags(tags)
+        self.stdout.write(self.style.SUCCESS('Đã cập nhật %s KPI.' % updated))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from kpi_manager.content_processors import DESCRIPTION_FIELDS, render_markdown
+from kpi_manager.models import Tag, Task
+
+MODELS = {'tag': Tag, 'task': Task}
+
+
+class Command(BaseCommand):
+    help = 'Render lại HTML mô tả của KPI và Task (chạy sau khi đổi WEBSITE_WHITELIST hoặc cấu hình cleaner). ' \
+           'Chỉ ghi những dòng có HTML thay đổi.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=sorted(MODELS), nargs='*', help='Mặc định: tag và task')
+        parser.add_argument('--missing', action='store_true', help='Chỉ render những dòng chưa có HTML')
+        parser.add_argument('--batch-size', type=int, default=500, help='Số dòng ghi trong một transaction')
+
+    def handle(self, *args, **options):
+        render_markdown.cache_clear()
+        for name in options['model'] or sorted(MODELS):
+            updated = self.render(MODELS[name], options['missing'], options['batch_size'])
+            self.stdout.write(self.style.SUCCESS('%s: đã cập nhật %s dòng.' % (name, updated)))
+
+    @staticmethod
+    def render(model, missing, batch_size):
+        source, target = DESCRIPTION_FIELDS[model._meta.model_name]
+        rows = model.objects.order_by('id')
+        if missing:
+            rows = rows.filter(**{target + '__isnull': True}).exclude(**{source + '__isnull': True})
+
+        changed, updated = [], 0
+        for pk, description, html in rows.values_list('id', source, target).iterator():
+            rendered = render_markdown(description)
+            if rendered != html:
+                changed.append((pk, rendered))
+            # Ghi ngay khi đủ một lô, không giữ toàn bộ thay đổi trong bộ nhớ
+            if len(changed) >= batch_size:
+                updated += Command.write(model, target, changed)
+                changed = []
+        return updated + Command.write(model, target, changed)
+
+    @staticmethod
+    def write(model, target, changed):
+        # update() không đổi updated_at và không gửi signal
+        with transaction.atomic():
+            for pk, rendered in changed:
+                model.objects.filter(pk=pk).update(**{target: rendered})
+        return len(changed)
@@ -0,0 +1,67 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from web_api import jobs
+
+
+def run_in_thread(job_id):
+    try:
+        return jobs.run(job_id)
+    finally:
+        # Mỗi thread có kết nối CSDL riêng, đóng lại khi xong việc
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Worker chạy các công việc trong hàng đợi (web_api.Job) bằng một nhóm thread. ' \
+           'Có thể chạy nhiều worker cùng lúc: mỗi công việc chỉ được một worker nhận.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Số thread chạy song song; 0: chạy lần lượt trong tiến trình hiện tại')
+        parser.add_argument('--poll', type=float, default=2.0, help='Số giây chờ khi hàng đợi trống')
+        parser.add_argument('--once', action='store_true', help='Dừng khi không còn công việc đến hạn')
+        parser.add_argument('--worker-id', default=None, help='Tên worker, mặc định host:pid')
+
+    def handle(self, *args, **options):
+        worker_id = options['worker_id'] or jobs.default_worker_id()
+        if options['workers'] <= 0:
+            return self.run_inline(worker_id, options)
+
+        done = 0
+        running = set()
+        executor = ThreadPoolExecutor(max_workers=options['workers'])
+        try:
+            while True:
+                jobs.requeue_stale()
+                job_ids = jobs.claim(worker_id, options['workers'] - len(running))
+                running.update(executor.submit(run_in_thread, job_id) for job_id in job_ids)
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll'])
+                    continue
+
+                finished, running = wait(running, timeout=options['poll'], return_when=FIRST_COMPLETED)
+                done += len(finished)
+        except KeyboardInterrupt:
+            self.stdout.write('Đang chờ các công việc đang chạy...')
+        finally:
+            executor.shutdown(wait=True)
+        self.stdout.write(self.style.SUCCESS('Đã chạy %s công việc.' % (done + len(running))))
+
+    def run_inline(self, worker_id, options):
+        done = 0
+        while True:
+            jobs.requeue_stale()
+            count = jobs.run_pending(worker_id)
+            done += count
+            if not count:
+                if options['once']:
+                    break
+                time.sleep(options['poll'])
+        self.stdout.write(self.style.SUCCESS('Đã chạy %s công việc.' % done))
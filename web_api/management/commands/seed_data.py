@@ -0,0 +1,202 @@
+import random
+from datetime import datetime, date, time, timedelta
+
+import arrow
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from kpi_manager.content_processors import render_description
+from kpi_manager.models import Profile, Department, DepartmentMember, Tag, Task, WorkTime, Comment
+from web_api import caching
+from web_api.rollup import compute_progress, reconcile_tags
+from web_api.summary import rebuild_summaries
+
+STATES = ('NF', 'PR', 'CO')
+
+
+def bulk_create(model, objects, **lookup):
+    """
+    bulk_create và trả về các đối tượng đã có id.
+    SQLite không trả id sau bulk_create nên phải đọc lại theo lookup (thứ tự chèn = thứ tự id).
+    """
+    objects = model.objects.bulk_create(objects, batch_size=500)
+    if objects and not all(item.pk for item in objects):
+        objects = list(model.objects.filter(**lookup).order_by('id'))
+    return objects
+
+
+class Command(BaseCommand):
+    help = 'Tạo dữ liệu mẫu (phòng ban, nhân viên, KPI, task, bình luận, giờ làm việc) để đo hiệu năng. ' \
+           'Cùng --seed sẽ cho cùng bộ dữ liệu.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--departments', type=int, default=5, help='Số phòng ban')
+        parser.add_argument('--members', type=int, default=20, help='Số nhân viên mỗi phòng ban (kể cả trưởng phòng)')
+        parser.add_argument('--tags', type=int, default=10, help='Số KPI mỗi nhân viên')
+        parser.add_argument('--tasks', type=int, default=3, help='Số task mỗi KPI')
+        parser.add_argument('--comments', type=int, default=2, help='Số bình luận mỗi task')
+        parser.add_argument('--work-days', type=int, default=20, help='Số ngày làm việc mỗi nhân viên')
+        parser.add_argument('--months', type=int, default=3, help='Rải ngày tạo KPI trong bấy nhiêu tháng gần nhất')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='seed', help='Tiền tố tên tài khoản và tên phòng ban')
+        parser.add_argument('--password', default=None, help='Mật khẩu chung, bỏ trống thì không đăng nhập được')
+        parser.add_argument('--clear', action='store_true', help='Xóa dữ liệu mẫu cũ cùng tiền tố trước khi tạo')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.prefix = options['prefix']
+        self.now = arrow.now(settings.TIME_ZONE)
+
+        with transaction.atomic():
+            if options['clear']:
+                self.clear()
+            elif User.objects.filter(username__startswith='%s-' % self.prefix).exists():
+                raise CommandError('Đã có dữ liệu mẫu với tiền tố "%s", dùng --clear để tạo lại.' % self.prefix)
+
+            members = self.create_members(options['departments'], options['members'], options['password'])
+            tags = self.create_tags(members, options['tags'], options['months'])
+            tasks = self.create_tasks(tags, options['tasks'])
+            comments = self.create_comments(tasks, members, options['comments'])
+            work_times = self.create_work_times(members, options['work_days'])
+
+            # bulk_create không gửi signal: tự đếm lại tiến độ KPI, số liệu tháng và làm mới cache
+            member_ids = [member.id for member in members]
+            reconcile_tags(Tag.objects.filter(user_id__in=member_ids))
+            rebuild_summaries(member_ids)
+        caching.bump_version(caching.DEPARTMENTS, caching.PROFILES)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Đã tạo %s phòng ban, %s nhân viên, %s KPI, %s task, %s bình luận, %s giờ làm việc.' % (
+                options['departments'], len(members), len(tags), len(tasks), comments, work_times)))
+
+    def clear(self):
+        Department.objects.filter(department_name__startswith='%s ' % self.prefix).delete()
+        User.objects.filter(username__startswith='%s-' % self.prefix).delete()
+
+    def create_members(self, departments, members, password):
+        """
+        Một giám đốc, mỗi phòng ban một trưởng phòng (MG) và các nhân viên (EM).
+        :return: danh sách DepartmentMember
+        """
+        password = make_password(password)
+        usernames = ['%s-director' % self.prefix]
+        roles = ['DR']
+        for department in range(departments):
+            for member in range(members):
+                usernames.append('%s-%s-%s' % (self.prefix, department, member))
+                roles.append('MG' if member == 0 else 'EM')
+
+        users = bulk_create(User, [User(username=username, password=password) for username in usernames],
+                            username__startswith='%s-' % self.prefix)
+        profiles = bulk_create(Profile, [
+            Profile(user=user, full_name='Nhân Viên %s' % user.username, role=role,
+                    sex=self.random.choice('MF'), id_number=str(self.random.randint(10 ** 8, 10 ** 9)),
+                    birth_day=date(self.random.randint(1970, 2000), self.random.randint(1, 12),
+                                   self.random.randint(1, 28)))
+            for user, role in zip(users, roles)], user__username__startswith='%s-' % self.prefix)
+
+        department_list = bulk_create(Department, [
+            Department(department_name='%s Phòng %s' % (self.prefix, i), department_level=i + 1,
+                       department_desc='Phòng ban mẫu %s' % i)
+            for i in range(departments)], department_name__startswith='%s ' % self.prefix)
+
+        # Giám đốc thuộc phòng ban đầu tiên
+        department_of = [department_list[0] if department_list else None]
+        for department in department_list:
+            department_of.extend([department] * members)
+
+        return bulk_create(DepartmentMember, [
+            DepartmentMember(department_member=profile, department=department, is_leader=profile.role == 'MG',
+                             position='Trưởng Phòng' if profile.role == 'MG' else
+                             'Giám Đốc' if profile.role == 'DR' else 'Nhân Viên')
+            for profile, department in zip(profiles, department_of)], department_member__in=profiles)
+
+    def created_at(self, months):
+        day = self.random.randint(0, max(months, 1) * 30 - 1)
+        return self.now.shift(days=-day).replace(hour=self.random.randint(7, 18), minute=0, second=0,
+                                                 microsecond=0).datetime
+
+    def create_tags(self, members, count, months):
+        leaders = {member.department_id: member.department_member_id for member in members if member.is_leader}
+        director = members[0].department_member_id
+
+        tags, created = [], []
+        for number, member in enumerate(members):
+            creator = director if member.is_leader or member.department_member_id == director \
+                else leaders.get(member.department_id, director)
+            for i in range(count):
+                created_at = self.created_at(months)
+                tag = Tag(user=member, tag_name='KPI %s của nhân viên %s' % (i + 1, number),
+                          tag_description='Mô tả **KPI** số %s' % (i + 1),
+                          period_start=created_at,
+                          period_end=created_at + timedelta(days=self.random.randint(7, 45)),
+                          weight=self.random.randint(1, 5), quantity=self.random.randint(5, 20),
+                          state=self.random.choice(STATES), created_by_id=creator)
+                # bulk_create không gửi signal: tự render mô tả
+                tags.append(render_description(tag))
+                created.append(created_at)
+
+        tags = bulk_create(Tag, tags, user__in=members)
+        self.set_created_at(Tag, tags, created)
+        return tags
+
+    def create_tasks(self, tags, count):
+        tasks = []
+        for tag in tags:
+            for i in range(count):
+                target = self.random.randint(1, 10)
+                state = self.random.choice(STATES)
+                result = target if state == 'CO' else self.random.randint(0, target)
+                task = Task(user_id=tag.user_id, tag=tag, task_name='Task %s' % (i + 1),
+                            task_description='Mô tả task %s' % (i + 1),
+                            period_start=tag.period_start, period_end=tag.period_end,
+                            unit_of_measure='Lần', target_value=target, result_value=result,
+                            progress=compute_progress(result, target), weight=self.random.randint(1, 3),
+                            state=state, is_finished=state == 'CO')
+                tasks.append(render_description(task))
+        return bulk_create(Task, tasks, tag__in=tags)
+
+    def create_comments(self, tasks, members, count):
+        profile_of = {member.id: member.department_member_id for member in members}
+        leaders = {member.department_id: member.department_member_id for member in members if member.is_leader}
+        department_of = {member.id: member.department_id for member in members}
+
+        comments = []
+        for task in tasks:
+            authors = (profile_of[task.user_id], leaders.get(department_of[task.user_id], profile_of[task.user_id]))
+            for i in range(count):
+                comments.append(Comment(task=task, user_id=authors[i % 2], content='Bình luận %s' % (i + 1)))
+        Comment.objects.bulk_create(comments, batch_size=500)
+        return len(comments)
+
+    def create_work_times(self, members, days):
+        work_times = []
+        for member in members:
+            work_date = self.now.date()
+            for _ in range(days):
+                # Bỏ qua thứ Bảy, Chủ Nhật
+                while work_date.weekday() >= 5:
+                    work_date -= timedelta(days=1)
+                start = time(self.random.randint(7, 9), self.random.choice((0, 15, 30, 45)))
+                end = time(self.random.randint(16, 19), self.random.choice((0, 15, 30, 45)))
+                rest = 1.0
+                total = (datetime.combine(work_date, end) - datetime.combine(work_date, start)).total_seconds()
+                work_times.append(WorkTime(user=member, date=work_date, start_in_day=start, end_in_day=end,
+                                           rest_time=rest, time_total=float(total) / 3600.0 - rest))
+                work_date -= timedelta(days=1)
+        WorkTime.objects.bulk_create(work_times, batch_size=500)
+        return len(work_times)
+
+    @staticmethod
+    def set_created_at(model, objects, created):
+        """
+        auto_now_add ghi đè created_at khi bulk_create: cập nhật lại theo từng nhóm cùng thời điểm.
+        """
+        groups = {}
+        for item, created_at in zip(objects, created):
+            groups.setdefault(created_at, []).append(item.pk)
+        for created_at, ids in groups.items():
+            model.objects.filter(pk__in=ids).update(created_at=created_at)
@@ -0,0 +1,64 @@
+from kpi_manager.models import Profile, DepartmentMember
+
+
+class ActingMember(object):
+    """
+    Thông tin người dùng đang gọi API: hồ sơ, thành viên phòng ban, phòng ban và quyền.
+    Được tạo một lần cho mỗi request bởi ActingMemberMiddleware (request.member).
+    """
+
+    def __init__(self, profile=None, department_member=None):
+        self.profile = profile
+        self.department_member = department_member
+        self.department = department_member.department if department_member else None
+        self.role = profile.role if profile else None
+
+    def __bool__(self):
+        return self.profile is not None
+
+    def get_profile(self):
+        if self.profile is None:
+            raise Profile.DoesNotExist
+        return self.profile
+
+    def get_department_member(self):
+        if self.department_member is None:
+            raise DepartmentMember.DoesNotExist
+        return self.department_member
+
+    def get_role(self):
+        return self.profile.get_role() if self.profile else None
+
+
+def member_queryset():
+    """
+    DepartmentMember kèm hồ sơ, tài khoản và phòng ban trong một câu truy vấn.
+    """
+    return DepartmentMember.objects.select_related('department_member__user', 'department')
+
+
+def get_member(**lookup):
+    """
+    Lấy thành viên phòng ban (chưa bị xóa) của một hồ sơ (chưa bị xóa) bằng một câu truy vấn.
+    :param lookup: vd. department_member__user_id=1, department_member_id=2
+    :raise DepartmentMember.DoesNotExist:
+    """
+    return member_queryset().get(removed=False, department_member__removed=False, **lookup)
+
+
+def resolve_acting_member(user):
+    """
+    Lấy Profile, DepartmentMember, Department và quyền của người dùng.
+    Thường chỉ tốn một câu truy vấn; thêm một câu nếu người dùng chưa thuộc phòng ban nào.
+    :rtype: ActingMember
+    """
+    if not user or not user.is_authenticated:
+        return ActingMember()
+
+    dpm = member_queryset().filter(department_member__user_id=user.id,
+                                   department_member__removed=False).first()
+    if dpm is not None:
+        return ActingMember(dpm.department_member, None if dpm.removed else dpm)
+
+    profile = Profile.objects.select_related('user').filter(user_id=user.id, removed=False).first()
+    return ActingMember(profile)
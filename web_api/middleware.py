@@ -0,0 +1,82 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.functional import SimpleLazyObject
+
+from utils.devices import is_desktop
+
+from . import instrumentation
+from .members import resolve_acting_member
+
+
+def get_acting_member(request):
+    if not hasattr(request, '_cached_member'):
+        request._cached_member = resolve_acting_member(request.user)
+    return request._cached_member
+
+
+class ActingMemberMiddleware(object):
+    """
+    Gắn request.member (ActingMember) vào mỗi request.
+    Chỉ truy vấn khi view dùng đến, và sau khi DRF đã xác thực (JWT/Session) người dùng.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.member = SimpleLazyObject(lambda: get_acting_member(request))
+        return self.get_response(request)
+
+
+class DeviceMiddleware(object):
+    """
+    Gắn request.is_desktop (máy tính hay điện thoại) vào mỗi request để chọn template, kết quả phân loại
+    User-Agent được nhớ trong utils.devices.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.is_desktop = is_desktop(request.META.get('HTTP_USER_AGENT'))
+        return self.get_response(request)
+
+
+class InstrumentationMiddleware(object):
+    """
+    Đo thời gian phản hồi, số câu truy vấn và thời gian truy vấn của từng API web_api (bật bằng
+    API_INSTRUMENTATION). Xem số liệu qua /web-api/instrumentation/stats/ hoặc lệnh api_stats.
+    Request chậm hơn API_SLOW_REQUEST_MS được ghi log kèm các câu SQL tốn thời gian nhất.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'API_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as context:
+            response = self.get_response(request)
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        key = instrumentation.endpoint_key(request)
+        if key is None:
+            return response
+
+        queries = context.captured_queries
+        db_ms = sum(float(query['time']) for query in queries) * 1000
+        instrumentation.stats.record(key, latency_ms, len(queries), db_ms)
+
+        if latency_ms >= getattr(settings, 'API_SLOW_REQUEST_MS', 500):
+            entry = instrumentation.slow_request_entry(request, key, response.status_code, latency_ms, queries)
+            instrumentation.stats.record_slow(entry)
+            instrumentation.logger.warning('Request chậm %s %s: %.0f ms, %s câu truy vấn (%.0f ms)\n%s',
+                                           entry['method'], entry['path'], latency_ms, len(queries), db_ms,
+                                           '\n'.join('%8.1f ms  %s' % (item['time_ms'], item['sql'])
+                                                     for item in entry['top_sql']))
+        return response
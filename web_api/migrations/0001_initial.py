@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 12:22
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_monthly_summary(apps, schema_editor):
+    from web_api.summary import rebuild_summaries
+    rebuild_summaries(tag_model=apps.get_model('kpi_manager', 'Tag'),
+                      work_time_model=apps.get_model('kpi_manager', 'WorkTime'),
+                      summary_model=apps.get_model('web_api', 'MemberMonthlySummary'))
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('kpi_manager', '0036_live_row_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemberMonthlySummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Tháng')),
+                ('total_time', models.FloatField(blank=True, null=True)),
+                ('total_tag', models.IntegerField(default=0)),
+                ('count_finished', models.IntegerField(default=0)),
+                ('count_progress', models.IntegerField(default=0)),
+                ('count_un_finished', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='kpi_manager.DepartmentMember')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='membermonthlysummary',
+            unique_together=set([('member', 'month')]),
+        ),
+        migrations.RunPython(backfill_monthly_summary, migrations.RunPython.noop),
+    ]
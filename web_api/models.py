@@ -1,3 +1,59 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+from kpi_manager.models import Profile, DepartmentMember
+
+
+class MemberMonthlySummary(models.Model):
+    # SỐ LIỆU THÁNG CỦA NHÂN VIÊN: GIỜ LÀM VIỆC, SỐ KPI THEO TRẠNG THÁI (KPI TẠO TRONG THÁNG)
+    # Được cập nhật từ web_api.signals khi Tag/WorkTime thay đổi, dựng lại bằng lệnh rebuild_monthly_summary
+    member = models.ForeignKey(DepartmentMember, related_name='+', on_delete=models.CASCADE)
+    month = models.DateField(verbose_name='Tháng')  # ngày đầu tháng
+    total_time = models.FloatField(null=True, blank=True)
+    total_tag = models.IntegerField(default=0)
+    count_finished = models.IntegerField(default=0)
+    count_progress = models.IntegerField(default=0)
+    count_un_finished = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '%s - %s' % (self.member_id, self.month.strftime('%m/%Y'))
+
+    class Meta:
+        unique_together = ('member', 'month')
+
+
+class Job(models.Model):
+    # CÔNG VIỆC CHẠY NỀN: TÊN (ĐĂNG KÝ TRONG web_api.jobs), THAM SỐ, TRẠNG THÁI, KẾT QUẢ, SỐ LẦN THỬ
+    # Được lệnh run_jobs lấy ra và chạy, không cần broker bên ngoài
+    PENDING = 'PE'
+    RUNNING = 'RU'
+    DONE = 'CO'
+    FAILED = 'FA'
+    STATE_CHOICE = (
+        (PENDING, 'Đang Chờ'),
+        (RUNNING, 'Đang Chạy'),
+        (DONE, 'Hoàn Thành'),
+        (FAILED, 'Thất Bại'),
+    )
+
+    name = models.CharField(max_length=100)
+    params = models.TextField(default='{}')  # JSON
+    state = models.CharField(max_length=2, choices=STATE_CHOICE, default=PENDING, verbose_name='Trạng Thái')
+    result = models.TextField(null=True, blank=True)  # JSON
+    error = models.TextField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=200, null=True, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_by = models.ForeignKey(Profile, related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return '%s #%s' % (self.name, self.id)
+
+    class Meta:
+        index_together = ('state', 'run_at')
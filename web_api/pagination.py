@@ -0,0 +1,156 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import F, Q
+from django.db.models.query import QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+
+
+def approximate_count(queryset):
+    """
+    Số dòng ước lượng từ kế hoạch thực thi của PostgreSQL, không chạy COUNT(*).
+    Các CSDL khác vẫn đếm chính xác.
+    """
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+# Cột được dùng làm khóa con trỏ: không bị sửa sau khi tạo (updated_at thay đổi mỗi lần sửa Task nên
+# dòng vừa sửa sẽ nhảy qua con trỏ và bị bỏ sót)
+KEYSET_FIELDS = ('created_at', 'date')
+
+
+def get_keyset_ordering(queryset):
+    """
+    Khóa phân trang: (created_at, id) hoặc (date, id), chiều sắp xếp theo cột sắp xếp đầu tiên của QuerySet.
+    Cột sắp xếp đầu tiên không phải created_at/date (vd. -updated_at) thì dùng created_at của model.
+    :return: [(tên trường, giảm dần)]
+    """
+    ordering = queryset.query.order_by or queryset.model._meta.ordering
+    first = ordering[0] if ordering and isinstance(ordering[0], str) else ''
+    descending = first.startswith('-')
+    names = {field.name for field in queryset.model._meta.get_fields()}
+
+    keys = []
+    name = first.lstrip('-')
+    if name not in KEYSET_FIELDS:
+        name = next((item for item in KEYSET_FIELDS if item in names), None)
+    if name:
+        keys.append((name, descending))
+    keys.append(('id', descending))
+    return keys
+
+
+class KeysetPage(object):
+    """
+    Một trang theo con trỏ: lọc WHERE (key, id) < (giá trị cuối trang trước) thay cho OFFSET.
+    Các dòng có key NULL được xếp sau cùng (theo id) ở cả hai chiều.
+    """
+
+    def __init__(self, queryset, cursor, page_size):
+        self.keys = get_keyset_ordering(queryset)
+        self.fields = [queryset.model._meta.get_field(name) for name, _ in self.keys]
+        self.queryset = queryset.order_by(*[F(name).desc(nulls_last=True) if desc else F(name).asc(nulls_last=True)
+                                            for name, desc in self.keys])
+        self.page_size = page_size
+        if cursor:
+            self.queryset = self.queryset.filter(self.after(self.decode(cursor)))
+
+        rows = list(self.queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.object_list = rows[:page_size]
+
+    def after(self, values):
+        # (a, b) < (x, y)  <=>  a < x OR (a = x AND b < y); a NULL đứng sau mọi giá trị khác
+        id_after = Q(**{'id__lt' if self.keys[-1][1] else 'id__gt': values[-1]})
+        if len(self.keys) == 1:
+            return id_after
+
+        name, desc = self.keys[0]
+        is_null = Q(**{'%s__isnull' % name: True})
+        if values[0] is None:
+            return is_null & id_after
+        return Q(**{'%s__%s' % (name, 'lt' if desc else 'gt'): values[0]}) | \
+            (Q(**{name: values[0]}) & id_after) | is_null
+
+    def decode(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError
+            values = [field.to_python(value) for field, value in zip(self.fields, values)]
+            if values[-1] is None or any(value is None and not field.null
+                                         for field, value in zip(self.fields, values)):
+                raise ValueError
+            return values
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound('Con trỏ phân trang không hợp lệ!')
+
+    def next_cursor(self):
+        if not self.has_next or not self.object_list:
+            return None
+        last = self.object_list[-1]
+        values = [None if field.value_from_object(last) is None else field.value_to_string(last)
+                  for field in self.fields]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    """
+    Phân trang theo số trang (mặc định). Thêm ?cursor= để phân trang theo con trỏ:
+    không COUNT(*), không OFFSET, tốc độ như nhau ở mọi trang (cuộn vô hạn).
+    Với con trỏ, ?count=approx trả về số dòng ước lượng, ?count=exact trả về số dòng chính xác.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.cursor_query_param in request.query_params and isinstance(queryset, QuerySet):
+            self.request = request
+            self.count = self.get_keyset_count(queryset, request)
+            self.keyset = KeysetPage(queryset, request.query_params[self.cursor_query_param],
+                                     self.get_page_size(request))
+            return self.keyset.object_list
+        return super(StandardResultsSetPagination, self).paginate_queryset(queryset, request, view)
+
+    def get_keyset_count(self, queryset, request):
+        count = request.query_params.get(self.count_query_param)
+        if count == 'approx':
+            return approximate_count(queryset)
+        if count == 'exact':
+            return queryset.count()
+        return None
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return Response({
+                'count': self.count,
+                'page_size': self.keyset.page_size,
+                'next': self.keyset.next_cursor(),
+                'results': data
+            })
+
+        return Response({
+            'count': self.page.paginator.count,
+            'page_size': self.page_size,
+            'current': self.page.number,
+            'results': data
+        })
@@ -0,0 +1,125 @@
+import arrow
+from django.conf import settings
+from django.db.models import Count, Exists, FloatField, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from kpi_manager.models import Department, DepartmentMember, Tag, Task, Comment
+from .models import MemberMonthlySummary
+from .summary import month_of
+
+
+def tag_list_queryset():
+    """
+    Tag kèm nhân viên, hồ sơ, tài khoản, phòng ban và người tạo,
+    đủ cho GetTagOfMemberSerializer mà không phát sinh truy vấn theo từng dòng.
+    """
+    return Tag.objects.select_related('user__department_member__user', 'user__department', 'created_by')
+
+
+def tag_period_q(query):
+    """
+    Điều kiện lọc KPI theo tham số query của các API danh sách:
+    current (mặc định) chưa hết hạn, all tất cả, tmonth tạo và bắt đầu trong tháng này và chưa hết hạn,
+    outdated đã hết hạn.
+    :return: Q, None nếu query không hợp lệ
+    """
+    now = arrow.now().to(settings.TIME_ZONE)
+    if not query or query == 'current':
+        return Q(period_end__gt=now.datetime)
+    if query == 'all':
+        return Q()
+    if query == 'tmonth':
+        start, end = now.floor('month').datetime, now.ceil('month').datetime
+        return Q(period_start__range=(start, end), period_end__gt=now.datetime, created_at__range=(start, end))
+    if query == 'outdated':
+        return Q(period_end__lt=now.datetime)
+    return None
+
+
+def member_list_queryset():
+    """
+    Nhân viên kèm hồ sơ, tài khoản, phòng ban và số liệu tháng này (month_total_time, month_total_tag,
+    month_total_tag_finished) đọc từ MemberMonthlySummary, đủ cho GetMemberInDepartmentSerializer.
+    """
+    summary = MemberMonthlySummary.objects.filter(member=OuterRef('pk'), month=month_of(arrow.now().datetime))
+    return DepartmentMember.objects.select_related('department_member__user', 'department').annotate(
+        month_total_time=Subquery(summary.values('total_time'), output_field=FloatField()),
+        month_total_tag=Coalesce(Subquery(summary.values('total_tag'), output_field=IntegerField()), Value(0)),
+        month_total_tag_finished=Coalesce(Subquery(summary.values('count_finished'), output_field=IntegerField()),
+                                          Value(0)),
+    )
+
+
+def department_list_queryset():
+    """
+    Phòng ban kèm số nhân viên (total_member) trong cùng một câu truy vấn.
+    """
+    members = DepartmentMember.objects.filter(department=OuterRef('pk'), removed=False)\
+        .order_by().values('department').annotate(total=Count('id')).values('total')
+    return Department.objects.annotate(total_member=Coalesce(Subquery(members, output_field=IntegerField()), Value(0)))
+
+
+def prefetch_department_leaders(departments):
+    """
+    Gắn trưởng phòng (department.leader, None nếu chưa có) cho danh sách phòng ban bằng một câu truy vấn.
+    DepartmentMember.department khai báo related_name='+' nên không dùng được Prefetch(to_attr=...).
+    """
+    departments = list(departments)
+    leaders = {}
+    members = DepartmentMember.objects.filter(department__in=[item.id for item in departments], is_leader=True,
+                                              removed=False).select_related('department_member').order_by('id')
+    for member in members:
+        leaders.setdefault(member.department_id, member)
+    for item in departments:
+        item.leader = leaders.get(item.id)
+    return departments
+
+
+def comment_list_queryset():
+    """
+    Bình luận kèm hồ sơ người viết và cờ trưởng phòng (user_is_leader), đủ cho GetCommentOfTaskSerializer.
+    """
+    leader = DepartmentMember.objects.filter(department_member=OuterRef('user'), is_leader=True)
+    return Comment.objects.select_related('user').annotate(user_is_leader=Exists(leader))
+
+
+def tag_comment_count():
+    """
+    Tổng số bình luận trên các Task (chưa xóa) của mỗi KPI, dùng với Tag.objects.annotate(comment_count=...).
+    """
+    comments = Comment.objects.filter(task__tag=OuterRef('pk'), task__removed=False, removed=False)\
+        .order_by().values('task__tag').annotate(total=Count('id')).values('total')
+    return Coalesce(Subquery(comments, output_field=IntegerField()), Value(0))
+
+
+def task_comment_count():
+    """
+    Số bình luận của mỗi Task, dùng với Task.objects.annotate(comment_count=...).
+    """
+    comments = Comment.objects.filter(task=OuterRef('pk'), removed=False)\
+        .order_by().values('task').annotate(total=Count('id')).values('total')
+    return Coalesce(Subquery(comments, output_field=IntegerField()), Value(0))
+
+
+def prefetch_tag_tasks(tags, comment_count=False):
+    """
+    Gắn các Task chưa xóa (tag.included_tasks, mới tạo trước) cho danh sách KPI bằng một câu truy vấn,
+    đủ cho GetTaskOfMemberDependOnTagSerializer. Task.tag khai báo related_name='+' nên không dùng được Prefetch.
+    :param comment_count: kèm số bình luận của từng Task (task.comment_count)
+    """
+    tags = list(tags)
+    by_id = {}
+    for tag in tags:
+        tag.included_tasks = []
+        by_id[tag.id] = tag
+    if not by_id:
+        return tags
+
+    tasks = Task.objects.filter(tag_id__in=list(by_id), removed=False)\
+        .select_related('user__department_member__user', 'user__department').order_by('-created_at')
+    if comment_count:
+        tasks = tasks.annotate(comment_count=task_comment_count())
+    for task in tasks:
+        task.tag = by_id[task.tag_id]
+        task.tag.included_tasks.append(task)
+    return tags
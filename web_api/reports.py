@@ -0,0 +1,77 @@
+import arrow
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from . import caching
+
+
+def is_past_month(year, month):
+    now = arrow.now(settings.TIME_ZONE)
+    return (year, month) < (now.year, now.month)
+
+
+def invalidate_member_reports(*member_ids):
+    """
+    Bỏ các trang in đã lưu của nhân viên, gọi khi Tag/WorkTime/Task của nhân viên thay đổi.
+    """
+    caching.bump_version(*[caching.member_reports(member_id) for member_id in member_ids if member_id])
+
+
+def report_key(member_id, template_name, year, month):
+    """
+    Khóa theo (nhân viên, mẫu trang, năm, tháng) và phiên bản dữ liệu: dữ liệu của nhân viên,
+    hồ sơ/phòng ban (tên, chức vụ hiển thị trên trang in) và lần dựng lại toàn bộ gần nhất.
+    """
+    return caching.make_key(caching.member_reports(member_id), template_name, year, month,
+                            caching.get_version(caching.PROFILES), caching.get_version(caching.DEPARTMENTS),
+                            caching.get_version(caching.REPORTS))
+
+
+def get_or_render(member_id, template_name, year, month, render):
+    """
+    HTML của trang in báo cáo tháng, render() chỉ được gọi khi chưa có bản đã lưu.
+    Tháng đã qua được lưu không thời hạn (chỉ bị thay khi dữ liệu đổi phiên bản),
+    tháng hiện tại lưu API_CACHE_TIMEOUT giây.
+    """
+    key = report_key(member_id, template_name, year, month)
+    html = cache.get(key)
+    if html is None:
+        html = render()
+        cache.set(key, html, None if is_past_month(year, month) else settings.API_CACHE_TIMEOUT)
+    return html
+
+
+class CachedReportMixin(object):
+    """
+    Lưu HTML đã render của trang in báo cáo tháng, lần xem sau không truy vấn và render lại.
+    get_report_member() trả về None khi không lưu (không có quyền xem, tham số không hợp lệ...).
+    """
+    report_template = None
+
+    def get_report_member(self):
+        # View con trả về nhân viên của báo cáo; mặc định không lưu cache
+        return None
+
+    def get_report_month(self):
+        year_request = self.kwargs['year_request']
+        month_request = self.kwargs['month_request']
+        try:
+            year, month = int(year_request), int(month_request)
+        except ValueError:
+            return None
+        if month < 1 or month > 12 or year < 1990 or year > arrow.now().year:
+            return None
+        return year, month
+
+    def get(self, request, *args, **kwargs):
+        report_month = self.get_report_month()
+        member = self.get_report_member() if report_month else None
+        if member is None or self.get_template_names() != [self.report_template]:
+            return super(CachedReportMixin, self).get(request, *args, **kwargs)
+
+        def render():
+            return super(CachedReportMixin, self).get(request, *args, **kwargs).render().content.decode()
+
+        year, month = report_month
+        return HttpResponse(get_or_render(member.id, self.report_template, year, month, render))
@@ -0,0 +1,87 @@
+from django.db.models import (F, Func, Case, When, Value, Sum, ExpressionWrapper, FloatField, IntegerField,
+                              OuterRef, Subquery)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from kpi_manager.models import Tag, Task
+from .reports import invalidate_member_reports
+
+
+class RoundProgress(Func):
+    """
+    ROUND(x, 2) cho phần trăm tiến độ, giống round(percent, 2) trong các view.
+    """
+    function = 'ROUND'
+    template = '%(function)s(CAST(%(expressions)s AS NUMERIC), 2)'
+    output_field = FloatField()
+
+
+def task_contribution(task):
+    """
+    Kết quả một Task đóng góp vào Tag.finished: result_value nếu Task đã hoàn thành và chưa bị xóa.
+    """
+    if task.removed or task.state != 'CO':
+        return 0
+    return int(task.result_value or 0)
+
+
+def compute_progress(finished, quantity):
+    return round(float(finished) / float(quantity) * 100.0, 2)
+
+
+def apply_finished_delta(tag_id, delta):
+    """
+    Cộng dồn thay đổi vào Tag.finished và tính lại Tag.progress trong một câu UPDATE.
+    """
+    if not tag_id or not delta:
+        return 0
+
+    finished = Coalesce(F('finished'), 0) + delta
+    percent = ExpressionWrapper(finished * 100.0 / F('quantity'), output_field=FloatField())
+    return Tag.objects.filter(pk=tag_id).update(
+        finished=finished,
+        progress=Case(When(quantity__gt=0, then=RoundProgress(percent)), default=F('progress'),
+                      output_field=FloatField()),
+        updated_at=timezone.now(),
+    )
+
+
+def finished_of_tag_subquery():
+    return Subquery(Task.objects.filter(tag=OuterRef('pk'), state='CO', removed=False)
+                    .order_by().values('tag').annotate(total=Sum('result_value')).values('total'),
+                    output_field=IntegerField())
+
+
+def reconcile_tag(tag):
+    """
+    Đếm lại Tag.finished từ các Task bằng một câu truy vấn tổng hợp.
+    :return: True nếu Tag có thay đổi
+    """
+    finished = Task.objects.filter(tag=tag, state='CO', removed=False).aggregate(
+        total=Coalesce(Sum('result_value'), Value(0)))['total']
+    return _update_if_changed(tag, finished)
+
+
+def reconcile_tags(tags):
+    """
+    Đếm lại Tag.finished cho cả một QuerySet, chỉ ghi những Tag bị lệch.
+    :return: số Tag đã được cập nhật
+    """
+    updated = 0
+    tags = tags.annotate(real_finished=Coalesce(finished_of_tag_subquery(), Value(0)))
+    for tag in tags.iterator():
+        if _update_if_changed(tag, tag.real_finished):
+            updated += 1
+    return updated
+
+
+def _update_if_changed(tag, finished):
+    progress = compute_progress(finished, tag.quantity) if tag.quantity else tag.progress
+    if tag.finished == finished and tag.progress == progress:
+        return False
+
+    tag.finished = finished
+    tag.progress = progress
+    Tag.objects.filter(pk=tag.pk).update(finished=finished, progress=progress, updated_at=timezone.now())
+    invalidate_member_reports(tag.user_id)
+    return True
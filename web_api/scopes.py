@@ -0,0 +1,79 @@
+from django.db.models import Q
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.permissions import BasePermission
+
+DIRECTOR = 'DR'
+MANAGER = 'MG'
+
+# Không được xem bản ghi nào: Django không chạy truy vấn cho pk__in=[]
+NOTHING = Q(pk__in=[])
+
+
+def scope_q(member, path='user', include_self=False):
+    """
+    Điều kiện lọc các bản ghi người gọi API được xem, dựa vào quyền và phòng ban đã có trong request.member
+    nên không tốn thêm truy vấn: Giám đốc xem tất cả, trưởng phòng xem phòng ban của mình.
+    :param member: ActingMember
+    :param path: đường dẫn từ model tới DepartmentMember, vd. 'user' (Tag, Task, WorkTime), '' (DepartmentMember)
+    :param include_self: nhân viên được xem bản ghi của chính mình
+    :rtype: Q
+    """
+    prefix = path + '__' if path else ''
+    if not member:
+        return NOTHING
+    if member.role == DIRECTOR:
+        return Q()
+
+    q = NOTHING
+    # Trưởng phòng chưa thuộc phòng ban nào: department_id IS NULL không phải phòng ban của ai
+    if member.role == MANAGER and member.department_member is not None \
+            and member.department_member.department_id is not None:
+        q = Q(**{prefix + 'department_id': member.department_member.department_id})
+    if include_self and member.department_member is not None:
+        q |= Q(**{prefix + 'pk': member.department_member.id})
+    return q
+
+
+def in_scope(member, department_member, include_self=False):
+    """
+    Kiểm tra như scope_q cho một DepartmentMember đã lấy ra (không truy vấn).
+    """
+    if not member or department_member is None:
+        return False
+    if member.role == DIRECTOR:
+        return True
+    me = member.department_member
+    if me is None:
+        return False
+    if include_self and me.id == department_member.id:
+        return True
+    return member.role == MANAGER and me.department_id is not None \
+        and me.department_id == department_member.department_id
+
+
+class ScopeFilterBackend(BaseFilterBackend):
+    """
+    Áp scope_q(request.member) lên queryset của view danh sách.
+    View khai báo scope_path (mặc định 'user') và scope_include_self (mặc định False).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if isinstance(queryset, list):
+            return queryset
+        return queryset.filter(scope_q(request.member, getattr(view, 'scope_path', 'user'),
+                                       getattr(view, 'scope_include_self', False)))
+
+
+class ScopePermission(BasePermission):
+    """
+    Quyền mặc định của API (DEFAULT_PERMISSION_CLASSES).
+    View khai báo scope_roles (vd. (DIRECTOR, MANAGER)) thì chỉ các quyền đó được gọi,
+    view không khai báo thì không chặn. Bản ghi trong view vẫn được lọc bởi ScopeFilterBackend.
+    """
+    message = 'Không đủ quyền để thao tác!'
+
+    def has_permission(self, request, view):
+        roles = getattr(view, 'scope_roles', None)
+        if roles is None:
+            return True
+        return bool(request.member) and request.member.role in roles
@@ -1,16 +1,37 @@
 import arrow
-import markdown2
 from django.conf import settings
 from datetime import datetime, date
 # from django.db import models
-from django.db.models import Sum, Count
+from django.db.models import Manager
 
 from rest_framework import serializers
 
+from kpi_manager.content_processors import render_markdown
 from kpi_manager.models import Department, DepartmentMember, Tag, Task, WorkTime, Comment
+from web_api.querysets import prefetch_department_leaders
 from web_api.utils import build_absolute_url
 
 
+def description_html(description, rendered):
+    """
+    HTML đã lưu của mô tả; dòng chưa được render (dữ liệu cũ) thì render ngay, kết quả được nhớ theo nội dung.
+    """
+    if rendered is None and description:
+        return render_markdown(description)
+    return rendered
+
+
+class DepartmentListSerializer(serializers.ListSerializer):
+    """
+    Lấy trưởng phòng của cả trang bằng một câu truy vấn trước khi serialize từng phòng ban
+    """
+
+    def to_representation(self, data):
+        if isinstance(data, Manager):
+            data = data.all()
+        return super(DepartmentListSerializer, self).to_representation(prefetch_department_leaders(data))
+
+
 class GetDepartmentListSerializer(serializers.ModelSerializer):
     """
     Get department list
@@ -22,27 +43,21 @@ class GetDepartmentListSerializer(serializers.ModelSerializer):
     departmentLeader = serializers.SerializerMethodField()
     departmentLeaderTitle = serializers.SerializerMethodField()
     avatarUrl = serializers.SerializerMethodField()
-    totalMember = serializers.SerializerMethodField()
+    totalMember = serializers.IntegerField(source='total_member', read_only=True)
 
     @staticmethod
     def get_departmentLeader(obj):
-        member = DepartmentMember.objects.get(department=obj, is_leader=True, removed=False)
-        return member.department_member.full_name
+        return obj.leader.department_member.full_name if obj.leader else None
 
     @staticmethod
     def get_departmentLeaderTitle(obj):
-        member = DepartmentMember.objects.get(department=obj, is_leader=True, removed=False)
-        return member.position
+        return obj.leader.position if obj.leader else None
 
     @staticmethod
     def get_avatarUrl(obj):
-        member = DepartmentMember.objects.get(department=obj, is_leader=True, removed=False)
-        return build_absolute_url(member.department_member.get_avatar_url()) if member.department_member else None
-
-    @staticmethod
-    def get_totalMember(obj):
-        member = DepartmentMember.objects.filter(department=obj, removed=False)
-        return len(member)
+        if obj.leader and obj.leader.department_member:
+            return build_absolute_url(obj.leader.department_member.get_avatar_url())
+        return None
 
     def create(self, validated_data):
         pass
@@ -54,6 +69,7 @@ class GetDepartmentListSerializer(serializers.ModelSerializer):
         model = Department
         fields = ('departmentId', 'departmentName', 'departmentDesc', 'departmentLevel',
                   'departmentLeader', 'departmentLeaderTitle', 'avatarUrl', 'totalMember')
+        list_serializer_class = DepartmentListSerializer
 
 
 class GetMemberInDepartmentSerializer(serializers.ModelSerializer):
@@ -70,9 +86,10 @@ class GetMemberInDepartmentSerializer(serializers.ModelSerializer):
     position = serializers.CharField()
     isLeader = serializers.BooleanField(source='is_leader')
     department = serializers.CharField()
-    totalTime = serializers.SerializerMethodField()
-    totalTag = serializers.SerializerMethodField()
-    totalTagFinished = serializers.SerializerMethodField()
+    # Các số liệu tháng được annotate sẵn trong querysets.member_list_queryset()
+    totalTime = serializers.FloatField(source='month_total_time', read_only=True)
+    totalTag = serializers.IntegerField(source='month_total_tag', read_only=True)
+    totalTagFinished = serializers.IntegerField(source='month_total_tag_finished', read_only=True)
 
     class Meta:
         model = DepartmentMember
@@ -87,30 +104,6 @@ class GetMemberInDepartmentSerializer(serializers.ModelSerializer):
     def get_avatarUrl(obj):
         return build_absolute_url(obj.department_member.get_avatar_url()) if obj.department_member else None
 
-    @staticmethod
-    def get_totalTime(obj):
-        start = arrow.now().to(settings.TIME_ZONE).floor('month').datetime
-        end = arrow.now().to(settings.TIME_ZONE).ceil('month').datetime
-        wt = WorkTime.objects.filter(user=obj, removed=False,
-                                     date__range=(start, end)).aggregate(value=Sum('time_total'))['value']
-        return wt
-
-    @staticmethod
-    def get_totalTag(obj):
-        start = arrow.now().to(settings.TIME_ZONE).floor('month').datetime
-        end = arrow.now().to(settings.TIME_ZONE).ceil('month').datetime
-        t = Tag.objects.filter(user=obj, removed=False,
-                               created_at__range=(start, end)).count()
-        return t
-
-    @staticmethod
-    def get_totalTagFinished(obj):
-        start = arrow.now().to(settings.TIME_ZONE).floor('month').datetime
-        end = arrow.now().to(settings.TIME_ZONE).ceil('month').datetime
-        tf = Tag.objects.filter(user=obj, removed=False, state='CO',
-                                created_at__range=(start, end)).count()
-        return tf
-
     @staticmethod
     def get_sex(obj):
         if obj.department_member.sex == 'M':
@@ -141,6 +134,7 @@ class GetTagOfMemberSerializer(serializers.ModelSerializer):
     tagId = serializers.IntegerField(source='pk', read_only=True)
     tagName = serializers.CharField(source='tag_name')
     tagDescription = serializers.CharField(source='tag_description')
+    tagDescriptionHtml = serializers.SerializerMethodField()
     periodStart = serializers.DateTimeField(source='period_start')
     periodEnd = serializers.DateTimeField(source='period_end')
     weight = serializers.IntegerField()
@@ -156,8 +150,8 @@ class GetTagOfMemberSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = ('userId', 'profileId', 'fullName', 'avatarUrl', 'sex', 'position', 'department', 'tagId', 'tagName',
-                  'tagDescription', 'periodStart', 'periodEnd', 'weight', 'quantity', 'finished', 'progress',
-                  'tagState', 'createdBy', 'createdAvatarUrl', 'createdAt', 'updatedAt')
+                  'tagDescription', 'tagDescriptionHtml', 'periodStart', 'periodEnd', 'weight', 'quantity',
+                  'finished', 'progress', 'tagState', 'createdBy', 'createdAvatarUrl', 'createdAt', 'updatedAt')
 
     @staticmethod
     def get_sex(obj):
@@ -187,6 +181,19 @@ class GetTagOfMemberSerializer(serializers.ModelSerializer):
         else:
             return ''
 
+    @staticmethod
+    def get_tagDescriptionHtml(obj):
+        return description_html(obj.tag_description, obj.tag_description_html)
+
+    def to_representation(self, instance):
+        data = super(GetTagOfMemberSerializer, self).to_representation(instance)
+        # Chỉ có khi danh sách được gọi với include=tasks,commentCount (views.tag.TagIncludeMixin)
+        if hasattr(instance, 'included_tasks'):
+            data['tasks'] = GetTaskOfMemberDependOnTagSerializer(instance.included_tasks, many=True).data
+        if hasattr(instance, 'comment_count'):
+            data['commentCount'] = instance.comment_count
+        return data
+
     # @staticmethod
     # def get_tagDescription(obj):
     #     if obj.tag_description:
@@ -216,6 +223,7 @@ class GetTaskOfMemberDependOnTagSerializer(serializers.ModelSerializer):
     taskName = serializers.CharField(source='task_name')
     # taskDescription = serializers.SerializerMethodField()
     taskDescription = serializers.CharField(source='task_description')
+    taskDescriptionHtml = serializers.SerializerMethodField()
     periodStart = serializers.DateTimeField(source='period_start')
     periodEnd = serializers.DateTimeField(source='period_end')
     unitOfMeasure = serializers.CharField(source='unit_of_measure')
@@ -231,7 +239,7 @@ class GetTaskOfMemberDependOnTagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Task
         fields = ('userId', 'fullName', 'avatarUrl', 'sex', 'position', 'department', 'tagId', 'taskId',
-                  'taskName', 'taskDescription', 'periodStart', 'periodEnd', 'unitOfMeasure', 'targetValue',
+                  'taskName', 'taskDescription', 'taskDescriptionHtml', 'periodStart', 'periodEnd', 'unitOfMeasure', 'targetValue',
                   'resultValue', 'progress', 'weight', 'taskState', 'isFinished', 'createdAt', 'updatedAt')
 
     @staticmethod
@@ -247,6 +255,16 @@ class GetTaskOfMemberDependOnTagSerializer(serializers.ModelSerializer):
         else:
             return ''
 
+    @staticmethod
+    def get_taskDescriptionHtml(obj):
+        return description_html(obj.task_description, obj.task_description_html)
+
+    def to_representation(self, instance):
+        data = super(GetTaskOfMemberDependOnTagSerializer, self).to_representation(instance)
+        if hasattr(instance, 'comment_count'):
+            data['commentCount'] = instance.comment_count
+        return data
+
     # @staticmethod
     # def get_taskDescription(obj):
     #     if obj.task_description:
@@ -316,7 +334,8 @@ class GetCommentOfTaskSerializer(serializers.ModelSerializer):
     commentId = serializers.IntegerField(source='pk', read_only=True)
     fullName = serializers.CharField(source='user')
     avatarUrl = serializers.SerializerMethodField()
-    isLeader = serializers.SerializerMethodField()
+    # Được annotate sẵn trong querysets.comment_list_queryset()
+    isLeader = serializers.BooleanField(source='user_is_leader', read_only=True)
     commentContent = serializers.CharField(source='content')
     createdAt = serializers.DateTimeField(source='created_at')
     updateAt = serializers.DateTimeField(source='updated_at')
@@ -329,15 +348,6 @@ class GetCommentOfTaskSerializer(serializers.ModelSerializer):
     def get_avatarUrl(obj):
         return build_absolute_url(obj.user.get_avatar_url()) if obj.user else None
 
-    @staticmethod
-    def get_isLeader(obj):
-        try:
-            dpm = DepartmentMember.objects.get(department_member=obj.user)
-            leader = dpm.is_leader
-            return leader
-        except DepartmentMember.DoesNotExist:
-            return False
-
     def update(self, instance, validated_data):
         pass
 
@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+# Thời điểm (giây) session được ghi gần nhất, lưu trong dữ liệu session
+REFRESHED_AT = '_refreshed_at'
+
+
+class SessionStore(CachedDBStore):
+    """
+    Session đọc qua cache (cached_db), chỉ ghi xuống CSDL khi dữ liệu session thay đổi.
+    Hạn dùng không được gia hạn ở mỗi request mà chỉ khi lần ghi gần nhất đã quá SESSION_REFRESH_INTERVAL giây,
+    nên người dùng đang hoạt động vẫn không bị đăng xuất.
+    Dùng bằng SESSION_ENGINE = 'web_api.sessions'.
+    """
+
+    def load(self):
+        data = super(SessionStore, self).load()
+        if data and time.time() - data.get(REFRESHED_AT, 0) >= settings.SESSION_REFRESH_INTERVAL:
+            # SessionMiddleware sẽ lưu lại session và gửi cookie với hạn dùng mới
+            self.modified = True
+        return data
+
+    def save(self, must_create=False):
+        self._get_session(no_load=must_create)[REFRESHED_AT] = int(time.time())
+        super(SessionStore, self).save(must_create)
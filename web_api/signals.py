@@ -0,0 +1,123 @@
+from django.contrib.auth.models import User
+from django.dispatch import receiver
+from django.db.models.signals import post_init, pre_save, post_save, post_delete
+
+from kpi_manager import content_processors
+from kpi_manager.models import Profile, Department, DepartmentMember, Tag, Task, WorkTime
+from . import caching, reports, rollup, summary
+
+
+def _snapshot(instance):
+    # Chỉ đọc các trường đã được nạp, tránh truy vấn thêm với .only()/.defer()
+    loaded = instance.__dict__
+    if not all(name in loaded for name in ('tag_id', 'state', 'result_value', 'removed')):
+        return None
+    return instance.tag_id, rollup.task_contribution(instance)
+
+
+@receiver(post_init, sender=Task)
+def remember_task_contribution(sender, instance, **kwargs):
+    instance._rollup_snapshot = _snapshot(instance) if instance.pk else (None, 0)
+
+
+@receiver(pre_save, sender=Task)
+def reload_task_contribution(sender, instance, raw=False, **kwargs):
+    # Lấy giá trị cũ từ bản ghi đang lưu: instance nạp trước một lần lưu khác (cũ) không làm lệch Tag.finished
+    if raw or instance._state.adding or not instance.pk:
+        return
+    stored = Task.objects.filter(pk=instance.pk).values('tag_id', 'state', 'result_value', 'removed').first()
+    if stored is not None:
+        instance._rollup_snapshot = stored['tag_id'], rollup.task_contribution(Task(**stored))
+
+
+@receiver(post_save, sender=Task)
+def rollup_task_contribution(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+
+    old_tag_id, old_value = (None, 0) if created else instance._rollup_snapshot or (None, None)
+    if old_value is None:
+        # Task được nạp thiếu trường, không biết giá trị cũ -> đếm lại toàn bộ Tag
+        if instance.tag_id:
+            rollup.reconcile_tag(instance.tag)
+    else:
+        new_value = rollup.task_contribution(instance)
+        if old_tag_id == instance.tag_id:
+            rollup.apply_finished_delta(instance.tag_id, new_value - old_value)
+        else:
+            rollup.apply_finished_delta(old_tag_id, -old_value)
+            rollup.apply_finished_delta(instance.tag_id, new_value)
+
+    instance._rollup_snapshot = _snapshot(instance)
+    # Kết quả đạt được của KPI hiển thị trên trang in báo cáo tháng
+    reports.invalidate_member_reports(instance.user_id)
+
+
+@receiver(post_delete, sender=Task)
+def rollup_deleted_task(sender, instance, **kwargs):
+    old_tag_id, old_value = instance._rollup_snapshot or (instance.tag_id, rollup.task_contribution(instance))
+    rollup.apply_finished_delta(old_tag_id, -old_value)
+    reports.invalidate_member_reports(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Department)
+def invalidate_department_cache(sender, **kwargs):
+    caching.bump_version(caching.DEPARTMENTS)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_principal_cache(sender, instance, update_fields=None, **kwargs):
+    # Tài khoản bị khóa/đổi thông tin: bỏ thông tin đã lưu của token JWT
+    caching.bump_version(caching.principals(instance.id))
+    # Trang in báo cáo tháng hiển thị email, đăng nhập (chỉ lưu last_login) thì không cần bỏ
+    if update_fields is None or 'email' in update_fields:
+        reports.invalidate_member_reports(*DepartmentMember.objects.filter(
+            department_member__user_id=instance.id).values_list('id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=DepartmentMember)
+@receiver([post_save, post_delete], sender=Profile)
+def invalidate_member_cache(sender, **kwargs):
+    # Danh sách phòng ban cũng hiển thị trưởng phòng và số nhân viên
+    caching.bump_version(caching.DEPARTMENTS, caching.PROFILES)
+
+
+def _summary_key(instance):
+    # (nhân viên, tháng) mà bản ghi được tính vào MemberMonthlySummary
+    loaded = instance.__dict__
+    field = 'created_at' if isinstance(instance, Tag) else 'date'
+    if 'user_id' not in loaded or field not in loaded:
+        return None
+    return loaded['user_id'], summary.month_of(loaded[field])
+
+
+@receiver(post_init, sender=Tag)
+@receiver(post_init, sender=WorkTime)
+def remember_summary_key(sender, instance, **kwargs):
+    instance._summary_key = _summary_key(instance) if instance.pk else None
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=WorkTime)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=WorkTime)
+def refresh_monthly_summary(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    keys = {instance._summary_key, _summary_key(instance)}
+    for key in keys:
+        if key:
+            summary.refresh_member_month(*key)
+    instance._summary_key = _summary_key(instance)
+
+
+@receiver(pre_save, sender=Tag)
+@receiver(pre_save, sender=Task)
+def render_description(sender, instance, raw=False, **kwargs):
+    # Render mô tả một lần khi lưu, API đọc HTML đã lưu
+    if raw:
+        return
+    source, _ = content_processors.DESCRIPTION_FIELDS[instance._meta.model_name]
+    if source in instance.__dict__:
+        content_processors.render_description(instance)
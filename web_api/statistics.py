@@ -0,0 +1,40 @@
+from django.db.models import Count, Case, When, IntegerField, Sum
+
+from kpi_manager.models import WorkTime
+
+
+def _count_state(state):
+    return Count(Case(When(state=state, then=1), output_field=IntegerField()))
+
+
+def count_tags_by_state(tags):
+    """
+    Đếm tổng số KPI và số KPI theo từng trạng thái trong một câu truy vấn.
+    :param tags: QuerySet của Tag đã lọc sẵn
+    :return: total_tag, count_finished, count_progress, count_un_finished
+    """
+    return tags.order_by().aggregate(
+        total_tag=Count('id'),
+        count_finished=_count_state('CO'),
+        count_progress=_count_state('PR'),
+        count_un_finished=_count_state('NF'),
+    )
+
+
+def sum_work_time(member, start, end):
+    """
+    Tổng số giờ làm việc của một nhân viên trong khoảng thời gian (None nếu chưa có).
+    """
+    return WorkTime.objects.filter(user=member,
+                                   date__range=(start, end),
+                                   removed=False).aggregate(totalTime=Sum('time_total'))['totalTime']
+
+
+def member_tag_statistics(member, tags, start, end):
+    """
+    Số liệu thống kê KPI và giờ làm việc của một nhân viên.
+    :return: total_time, total_tag, count_finished, count_progress, count_un_finished
+    """
+    data = {'total_time': sum_work_time(member, start, end)}
+    data.update(count_tags_by_state(tags))
+    return data
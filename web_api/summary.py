@@ -0,0 +1,116 @@
+import datetime
+
+import arrow
+from django.conf import settings
+from django.db import transaction
+
+from kpi_manager.models import Tag, WorkTime
+from . import caching
+from .models import MemberMonthlySummary
+from .reports import invalidate_member_reports
+from .statistics import member_tag_statistics
+
+SUMMARY_FIELDS = ('total_time', 'total_tag', 'count_finished', 'count_progress', 'count_un_finished')
+STATE_FIELDS = {'CO': 'count_finished', 'PR': 'count_progress', 'NF': 'count_un_finished'}
+
+
+def month_of(value):
+    """
+    Ngày đầu tháng (theo TIME_ZONE) của một ngày hoặc thời điểm.
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        value = arrow.get(value).to(settings.TIME_ZONE).date()
+    return value.replace(day=1)
+
+
+def month_range(month):
+    """
+    Thời điểm bắt đầu và kết thúc của tháng, giống floor('month')/ceil('month') trong các view.
+    """
+    month = arrow.get(month).replace(tzinfo=settings.TIME_ZONE)
+    return month.floor('month').datetime, month.ceil('month').datetime
+
+
+def empty_summary():
+    return {'total_time': None, 'total_tag': 0, 'count_finished': 0, 'count_progress': 0, 'count_un_finished': 0}
+
+
+def get_member_month_summary(member, month):
+    """
+    Số liệu tháng của một nhân viên: total_time, total_tag, count_finished, count_progress, count_un_finished.
+    :param month: ngày bất kỳ trong tháng
+    """
+    data = MemberMonthlySummary.objects.filter(member=member, month=month_of(month)).values(*SUMMARY_FIELDS).first()
+    return data or empty_summary()
+
+
+def refresh_member_month(member_id, month):
+    """
+    Tính lại số liệu một tháng của một nhân viên từ Tag và WorkTime.
+    """
+    if not member_id or not month:
+        return
+
+    invalidate_member_reports(member_id)
+    start, end = month_range(month)
+    tags = Tag.objects.filter(user_id=member_id, created_at__range=(start, end), removed=False)
+    data = member_tag_statistics(member_id, tags, start, end)
+    if data['total_time'] is None and not data['total_tag']:
+        MemberMonthlySummary.objects.filter(member_id=member_id, month=month).delete()
+    else:
+        MemberMonthlySummary.objects.update_or_create(member_id=member_id, month=month, defaults=data)
+
+
+def collect_summaries(tags, work_times):
+    """
+    Gom số liệu tháng trong một lượt duyệt.
+    :param tags: các bộ (user_id, created_at, state) của Tag chưa xóa
+    :param work_times: các bộ (user_id, date, time_total) của WorkTime chưa xóa
+    :return: {(member_id, month): số liệu}
+    """
+    summaries = {}
+    for member_id, created_at, state in tags:
+        key = (member_id, month_of(created_at))
+        if None in key:
+            continue
+        data = summaries.setdefault(key, empty_summary())
+        data['total_tag'] += 1
+        if state in STATE_FIELDS:
+            data[STATE_FIELDS[state]] += 1
+
+    for member_id, date, time_total in work_times:
+        key = (member_id, month_of(date))
+        if None in key:
+            continue
+        data = summaries.setdefault(key, empty_summary())
+        if time_total is not None:
+            data['total_time'] = (data['total_time'] or 0) + time_total
+    return summaries
+
+
+def rebuild_summaries(member_ids=None, tag_model=Tag, work_time_model=WorkTime, summary_model=MemberMonthlySummary):
+    """
+    Dựng lại toàn bộ bảng số liệu tháng (hoặc của một số nhân viên).
+    Các tham số model cho phép migration truyền vào model lịch sử.
+    :return: số dòng đã tạo
+    """
+    tags = tag_model.objects.filter(removed=False, user__isnull=False)
+    work_times = work_time_model.objects.filter(removed=False, user__isnull=False)
+    summaries = summary_model.objects.all()
+    if member_ids is not None:
+        tags = tags.filter(user_id__in=member_ids)
+        work_times = work_times.filter(user_id__in=member_ids)
+        summaries = summaries.filter(member_id__in=member_ids)
+
+    collected = collect_summaries(tags.values_list('user_id', 'created_at', 'state').iterator(),
+                                  work_times.values_list('user_id', 'date', 'time_total').iterator())
+    caching.bump_version(*[caching.member_reports(member_id) for member_id in member_ids]
+                         if member_ids is not None else [caching.REPORTS])
+    with transaction.atomic():
+        summaries.delete()
+        summary_model.objects.bulk_create(
+            (summary_model(member_id=member_id, month=month, **data) for (member_id, month), data in collected.items()),
+            batch_size=500)
+    return len(collected)
@@ -1,3 +1,1359 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+from io import BytesIO, StringIO
 
-# Create your tests here.
+import arrow
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APITestCase as BaseAPITestCase
+from rest_framework_jwt.settings import api_settings
+
+from kpi_manager.models import Profile, Department, DepartmentMember, Tag, Task, Comment, WorkTime
+from utils import devices
+from web_api import caching, instrumentation, jobs, rollup, scopes
+from web_api.members import resolve_acting_member
+from web_api.middleware import get_acting_member
+from web_api.models import Job, MemberMonthlySummary
+from web_api.summary import get_member_month_summary, month_of
+
+jwt_payload_handler = api_settings.JWT_PAYLOAD_HANDLER
+jwt_encode_handler = api_settings.JWT_ENCODE_HANDLER
+
+
+# Test luôn dùng cache trong tiến trình, không phụ thuộc biến môi trường hay cách chạy test (manage.py test, pytest)
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'kpi-manager-tests',
+    },
+}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class APITestCase(BaseAPITestCase):
+    pass
+
+
+def create_member(username, role, department, is_leader=False):
+    user = User.objects.create_user(username, password='123456')
+    profile = Profile.objects.create(user=user, full_name=username, role=role, sex='M',
+                                     birth_day=arrow.now().date())
+    member = DepartmentMember.objects.create(department_member=profile, department=department, is_leader=is_leader)
+    return user, profile, member
+
+
+def create_tags(member, created_by, count):
+    now = arrow.now()
+    for i in range(count):
+        Tag.objects.create(user=member, tag_name='KPI %s' % i, quantity=10, weight=1, state='PR',
+                           period_start=now.shift(days=-1).datetime, period_end=now.shift(days=7).datetime,
+                           created_by=created_by)
+
+
+class ActingMemberTest(APITestCase):
+    """
+    resolve_acting_member: hồ sơ, thành viên phòng ban, phòng ban và quyền của người gọi trong một câu truy vấn.
+    """
+
+    def setUp(self):
+        self.department = Department.objects.create(department_name='Phòng Kỹ Thuật')
+        self.user, self.profile, self.member = create_member('manager', 'MG', self.department)
+
+    def test_member_in_one_query(self):
+        with self.assertNumQueries(1):
+            member = resolve_acting_member(self.user)
+            self.assertTrue(member)
+            self.assertEqual((member.profile.id, member.department_member.id), (self.profile.id, self.member.id))
+            self.assertEqual((member.department.department_name, member.role), ('Phòng Kỹ Thuật', 'MG'))
+            self.assertEqual(member.get_role(), 'Manager')
+            self.assertEqual(member.department_member.department_member.user.username, 'manager')
+
+    def test_anonymous_user(self):
+        with self.assertNumQueries(0):
+            member = resolve_acting_member(AnonymousUser())
+        self.assertFalse(member)
+        self.assertIsNone(member.get_role())
+        self.assertRaises(Profile.DoesNotExist, member.get_profile)
+        self.assertRaises(DepartmentMember.DoesNotExist, member.get_department_member)
+
+    def test_removed_profile(self):
+        Profile.objects.filter(id=self.profile.id).update(removed=True)
+        with self.assertNumQueries(2):
+            member = resolve_acting_member(self.user)
+        self.assertFalse(member)
+        self.assertRaises(Profile.DoesNotExist, member.get_profile)
+
+    def test_profile_without_department_member(self):
+        DepartmentMember.objects.filter(id=self.member.id).delete()
+        with self.assertNumQueries(2):
+            member = resolve_acting_member(self.user)
+        self.assertEqual(member.get_profile().id, self.profile.id)
+        self.assertIsNone(member.department)
+        self.assertRaises(DepartmentMember.DoesNotExist, member.get_department_member)
+
+    def test_removed_department_member(self):
+        DepartmentMember.objects.filter(id=self.member.id).update(removed=True)
+        with self.assertNumQueries(1):
+            member = resolve_acting_member(self.user)
+        self.assertEqual(member.get_profile().id, self.profile.id)
+        self.assertRaises(DepartmentMember.DoesNotExist, member.get_department_member)
+
+    def test_resolved_once_per_request(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        with self.assertNumQueries(1):
+            self.assertIs(get_acting_member(request), get_acting_member(request))
+
+
+class TagListQueryCountTest(APITestCase):
+    """
+    Số câu truy vấn của các API danh sách KPI không phụ thuộc vào số dòng trả về.
+    """
+
+    def setUp(self):
+        department = Department.objects.create(department_name='Phòng Kỹ Thuật')
+        self.director = create_member('director', 'DR', department, is_leader=True)
+        self.manager = create_member('manager', 'MG', department)
+        self.employee = create_member('employee', 'EM', department)
+
+    def count_queries(self, url, user):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response.data
+
+    def assertConstantQueries(self, url, user, member):
+        create_tags(member, self.director[1], 2)
+        small, data = self.count_queries(url, user)
+        self.assertEqual(data['count'], 2)
+
+        create_tags(member, self.director[1], 50)
+        large, data = self.count_queries(url + '&page_size=100', user)
+        self.assertEqual(data['count'], 52)
+        self.assertEqual(small, large)
+
+    def test_tag_list_director(self):
+        self.assertConstantQueries('/web-api/tag/list/?query=all', self.director[0], self.employee[2])
+
+    def test_tag_list_manager(self):
+        self.assertConstantQueries('/web-api/tag/list/?query=current', self.manager[0], self.employee[2])
+
+    def test_tag_of_member(self):
+        url = '/web-api/tag/member/?query=all&user_id=%s' % self.employee[0].id
+        self.assertConstantQueries(url, self.manager[0], self.employee[2])
+
+    def test_my_tag(self):
+        self.assertConstantQueries('/web-api/my-tag/list/?query=all', self.employee[0], self.employee[2])
+
+
+class TagRollupTest(APITestCase):
+    """
+    Tag.finished/progress được cộng dồn theo thay đổi của Task, không đếm lại toàn bộ.
+    """
+
+    def setUp(self):
+        department = Department.objects.create(department_name='Phòng Kỹ Thuật')
+        self.user, self.profile, self.member = create_member('employee', 'EM', department)
+        create_tags(self.member, self.profile, 1)
+        self.tag = Tag.objects.get()
+        self.tasks = [Task.objects.create(user=self.member, tag=self.tag, task_name='Task %s' % i, target_value=5,
+                                          result_value=0, state='PR') for i in range(3)]
+        self.client.force_authenticate(self.user)
+
+    def edit_task(self, task, **data):
+        data.update(tag_id=self.tag.id, task_id=task.id)
+        response = self.client.post('/web-api/my-task/edit/', data, format='json')
+        self.assertTrue(response.data['ok'], response.data)
+        self.tag.refresh_from_db()
+
+    def test_complete_and_remove_task(self):
+        self.edit_task(self.tasks[0], edit_task='compact', result_value=4, task_state='Hoàn Thành')
+        self.assertEqual((self.tag.finished, self.tag.progress), (4, 40.0))
+
+        with CaptureQueriesContext(connection) as context:
+            self.edit_task(self.tasks[1], edit_task='compact', result_value=3, task_state='Hoàn Thành')
+        self.assertEqual((self.tag.finished, self.tag.progress), (7, 70.0))
+        self.assertFalse(any('SUM' in query['sql'] for query in context.captured_queries))
+
+        self.edit_task(self.tasks[0], edit_task='remove')
+        self.assertEqual((self.tag.finished, self.tag.progress), (3, 30.0))
+
+    def test_task_in_progress_does_not_count(self):
+        self.edit_task(self.tasks[0], edit_task='compact', result_value=4, task_state='Đang Thực Hiện')
+        self.assertEqual(self.tag.finished, 0)
+
+    def test_stale_instances(self):
+        # Hai lần lưu cùng một Task từ hai instance nạp trước đó (vd. bấm lưu hai lần)
+        first, second = Task.objects.get(id=self.tasks[0].id), Task.objects.get(id=self.tasks[0].id)
+        first.state, first.result_value = 'CO', 4
+        first.save()
+        second.state, second.result_value = 'CO', 3
+        second.save()
+
+        self.tag.refresh_from_db()
+        self.assertEqual(self.tag.finished, 3)
+        self.assertFalse(rollup.reconcile_tag(self.tag))
+
+    def test_reconcile_command(self):
+        Task.objects.filter(id=self.tasks[2].id).update(state='CO', result_value=5)
+        Tag.objects.filter(id=self.tag.id).update(finished=1, progress=10)
+
+        call_command('reconcile_tag_progress', stdout=StringIO())
+        self.tag.refresh_from_db()
+        self.assertEqual((self.tag.finished, self.tag.progress), (5, 50.0))
+
+
+class ExplainListQueriesTest(APITestCase):
+    """
+    Lệnh explain_list_queries chạy EXPLAIN cho các API danh sách.
+    """
+
+    def test_explain_member_lists(self):
+        department = Department.objects.create(department_name='Phòng Kỹ Thuật')
+        manager = create_member('manager', 'MG', department, is_leader=True)
+        employee = create_member('employee', 'EM', department)
+        create_tags(employee[2], manager[1], 2)
+        Task.objects.create(user=employee[2], tag=Tag.objects.first(), task_name='Task', state='PR')
+
+        out = StringIO()
+        call_command('explain_list_queries', username='manager', member=employee[0].id, stdout=out)
+        output = out.getvalue()
+        self.assertIn('/web-api/tag/member/?query=all&user_id=%s: OK' % employee[0].id, output)
+        self.assertIn('/web-api/task/list/?tag_id=%s&user_id=%s: OK' % (Tag.objects.first().id, employee[0].id), output)
+
+        # EXPLAIN đúng câu truy vấn API chạy: đã lọc theo phạm vi (ScopeFilterBackend)
+        from rest_framework.test import APIRequestFactory
+        from web_api.management.commands.explain_list_queries import Command
+
+        queryset = Command().get_list_queryset(APIRequestFactory(), manager[0], '/web-api/tag/list/', {'query': 'all'})
+        self.assertIn('"department_id" = %s' % department.id, str(queryset.query))
+
+        out = StringIO()
+        call_command('explain_list_queries', username='employee', stdout=out)
+        self.assertIn('/web-api/tag/list/?query=all: bỏ qua (ngoài phạm vi', out.getvalue())
+
+
+class CursorPaginationTest(APITestCase):
+    """
+    ?cursor= phân trang theo (created_at, id) mà không chạy COUNT(*).
+    """
+
+    def setUp(self):
+        department = Department.objects.create(department_name='Phòng Kỹ Thuật')
+        self.user, self.profile, self.member = create_member('employee', 'EM', department)
+        create_tags(self.member, self.profile, 25)
+        # Một số KPI trùng created_at để kiểm tra khóa phụ id
+        Tag.objects.filter(id__in=Tag.objects.values_list('id', flat=True)[:10]).update(created_at=arrow.now().datetime)
+        self.client.force_authenticate(self.user)
+
+    def test_walk_all_pages(self):
+        url = '/web-api/my-tag/list/?query=all&page_size=7'
+        expected = [tag['tagId'] for tag in self.client.get('/web-api/my-tag/list/?query=all&page_size=100').data['results']]
+
+        seen, cursor = [], ''
+        while cursor is not None:
+            with CaptureQueriesContext(connection) as context:
+                data = self.client.get(url + '&cursor=' + cursor).data
+            self.assertFalse(any('COUNT(' in query['sql'] for query in context.captured_queries))
+            self.assertIsNone(data['count'])
+            seen.extend(tag['tagId'] for tag in data['results'])
+            cursor = data['next']
+
+        self.assertEqual(sorted(seen), sorted(expected))
+        self.assertEqual(len(seen), 25)
+
+    def walk(self, url):
+        seen, cursor = [], ''
+        while cursor is not None:
+            data = self.client.get(url + '&cursor=' + cursor).data
+            seen.extend(tag['tagId'] for tag in data['results'])
+            cursor = data['next']
+            yield seen
+
+    def test_null_keys(self):
+        # Trang kết thúc ở dòng created_at NULL vẫn đọc tiếp được, các dòng NULL nằm cuối danh sách
+        null_ids = list(Tag.objects.order_by('id').values_list('id', flat=True)[:8])
+        Tag.objects.filter(id__in=null_ids).update(created_at=None)
+
+        seen = list(self.walk('/web-api/my-tag/list/?query=all&page_size=3'))[-1]
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+        self.assertEqual(seen[-8:], sorted(null_ids, reverse=True))
+
+    def test_cursor_ignores_updated_at(self):
+        # Danh sách của trưởng phòng sắp xếp theo -updated_at: con trỏ vẫn dùng created_at nên KPI được sửa
+        # trong lúc cuộn không bị bỏ sót
+        manager = create_member('manager', 'MG', self.member.department)[0]
+        self.client.force_authenticate(manager)
+        pages = self.walk('/web-api/tag/list/?query=all&page_size=5')
+        seen = next(pages)
+        unseen = Tag.objects.exclude(id__in=seen).order_by('id')
+        Tag.objects.filter(id__in=unseen.values_list('id', flat=True)[:3])\
+            .update(updated_at=arrow.now().shift(days=1).datetime)
+        for seen in pages:
+            pass
+        self.assertEqual(sorted(seen), sorted(Tag.objects.values_list('id', flat=True)))
+
+    def test_count_and_invalid_cursor(self):
+        data = self.client.get('/web-api/my-tag/list/?query=all&cursor=&count=approx').data
+        self.assertEqual(data['count'], 25)
+        self.assertEqual(len(data['results']), 20)
+
+        response = self.client.get('/web-api/my-tag/list/?query=all&cursor=abc')
+        self.assertEqual(response.status_code, 404)
+
+
+class OrganizationCacheTest(APITestCase):
+    """
+    Danh sách phòng ban / hồ sơ được cache và làm mới khi dữ liệu thay đổi.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.department = Department.objects.create(department_name='Phòng Kỹ Thuật')
+        self.director = create_member('director', 'DR', self.department, is_leader=True)
+        self.manager = create_member('manager', 'MG', self.department)
+
+    def get(self, url, user):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as context:
+            data = self.client.get(url).data
+        return data, len(context.captured_queries)
+
+    def test_profile_list_is_cached_per_department(self):
+        url = '/web-api/profile/list/no-pagination/'
+        data, _ = self.get(url, self.manager[0])
+        self.assertEqual(len(data), 2)
+
+        cached, queries = self.get(url, self.manager[0])
+        self.assertEqual(cached, data)
+        self.assertEqual(queries, 1)  # chỉ còn truy vấn request.member
+
+        other = Department.objects.create(department_name='Phòng Kế Toán')
+        create_member('accountant', 'EM', other)
+        self.assertEqual(len(self.get(url, self.manager[0])[0]), 2)
+        self.assertEqual(len(self.get(url, self.director[0])[0]), 3)
+
+    def test_department_list_invalidated_by_signal(self):
+        url = '/web-api/department/list/?page=1'
+        self.assertEqual(self.get(url, self.director[0])[0]['results'][0]['departmentName'], 'Phòng Kỹ Thuật')
+        self.assertEqual(self.get(url, self.director[0])[1], 0)
+
+        self.department.department_name = 'Phòng Công Nghệ'
+        self.department.save()
+        self.assertEqual(self.get(url, self.director[0])[0]['results'][0]['departmentName'], 'Phòng Công Nghệ')
+
+
+class MemberListQueryCountTest(APITestCase):
+    """
+    Danh sách nhân viên kèm số liệu tháng chạy số câu truy vấn cố định.
+    """
+
+    def setUp(self):
+        self.department = Department.objects.create(department_name='Phòng Kỹ Thuật')
+        self.director = create_member('director', 'DR', self.department, is_leader=True)
+        self.client.force_authenticate(self.director[0])
+
+    def get_members(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/web-api/members/list/?page_size=100')
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), {item['userId']: item for item in response.data['results']}
+
+    def test_month_statistics(self):
+        user, profile, member = create_member('employee', 'EM', self.department)
+        create_tags(member, profile, 3)
+        Tag.objects.filter(id=Tag.objects.first().id).update(state='CO')
+        WorkTime.objects.create(user=member, date=arrow.now().date(), time_total=7.5)
+        WorkTime.objects.create(user=member, date=arrow.now().date(), time_total=1, removed=True)
+
+        small, data = self.get_members()
+        self.assertEqual((data[user.id]['totalTime'], data[user.id]['totalTag'], data[user.id]['totalTagFinished']),
+                         (7.5, 3, 1))
+        self.assertEqual((data[self.director[0].id]['totalTime'], data[self.director[0].id]['totalTag']), (None, 0))
+
+        for i in range(20):
+            create_member('employee%s' % i, 'EM', self.department)
+        large, data = self.get_members()
+        self.assertEqual(len(data), 22)
+        self.assertEqual(small, large)
+
+
+class DepartmentListQueryCountTest(APITestCase):
+    """
+    Danh sách phòng ban lấy trưởng phòng và số nhân viên với số câu truy vấn cố định.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.department = Department.objects.create(department_name='Phòng Kỹ Thuật', department_level=2)
+        self.director = create_member('director', 'DR', self.department, is_leader=True)
+        create_member('employee', 'EM', self.department)
+        self.client.force_authenticate(self.director[0])
+
+    def get_departments(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            data = self.client.get('/web-api/department/list/?page_size=100').data
+        return len(context.captured_queries), {item['departmentName']: item for item in data['results']}
+
+    def test_leader_and_total_member(self):
+        small, data = self.get_departments()
+        self.assertEqual(data['Phòng Kỹ Thuật']['departmentLeader'], 'director')
+        self.assertEqual(data['Phòng Kỹ Thuật']['totalMember'], 2)
+
+        for i in range(10):
+            department = Department.objects.create(department_name='Phòng %s' % i)
+            create_member('leader%s' % i, 'MG', department, is_leader=True)
+        Department.objects.create(department_name='Phòng Chưa Có Trưởng Phòng')
+
+        large, data = self.get_departments()
+        self.assertEqual(len(data), 12)
+        self.assertEqual(data['Phòng 3']['departmentLeader'], 'leader3')
+        self.assertEqual(data['Phòng 3']['totalMember'], 1)
+        self.assertIsNone(data['Phòng Chưa Có Trưởng Phòng']['departmentLeader'])
+        self.assertEqual(data['Phòng Chưa Có Trưởng Phòng']['totalMember'], 0)
+        self.assertEqual(small, large)
+
+
+class CommentListQueryCountTest(APITestCase):
+    """
+    Danh sách bình luận của task không truy vấn theo từng bình luận.
+    """
+
+    def setUp(self):
+        department = Department.objects.create(department_name='Phòng Kỹ Thuật')
+        self.manager = create_member('manager', 'MG', department, is_leader=True)
+        self.employee = create_member('employee', 'EM', department)
+        create_tags(self.employee[2], self.manager[1], 1)
+        self.task = Task.objects.create(user=self.employee[2], tag=Tag.objects.get(), task_name='Task', state='PR')
+
+    def add_comments(self, count):
+        for i in range(count):
+            Comment.objects.create(task=self.task, user=self.manager[1], content='Góp ý %s' % i)
+            Comment.objects.create(task=self.task, user=self.employee[1], content='Trả lời %s' % i)
+
+    def get_comments(self, url, user):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as context:
+            data = self.client.get(url).data
+        return len(context.captured_queries), data
+
+    def test_comment_lists(self):
+        for url, user in (('/web-api/task/comment/list/?page_size=100&task_id=%s', self.manager[0]),
+                          ('/web-api/my-task/comment/list/?page_size=100&task_id=%s', self.employee[0])):
+            Comment.objects.all().delete()
+            self.add_comments(1)
+            small, data = self.get_comments(url % self.task.id, user)
+            self.assertEqual({(item['fullName'], item['isLeader']) for item in data['results']},
+                             {('manager', True), ('employee', False)})
+
+            self.add_comments(20)
+            large, data = self.get_comments(url % self.task.id, user)
+            self.assertEqual(data['count'], 42)
+            self.assertEqual(small, large)
+
+
+class MemberMonthlySummaryTest(APITestCase):
+    """
+    MemberMonthlySummary được cập nhật khi Tag/WorkTime thay đổi và dựng lại được bằng lệnh.
+    """
+
+    def setUp(self):
+        department = Department.objects.create(department_name='Phòng Kỹ Thuật')
+        self.director = create_member('director', 'DR', department, is_leader=True)
+        self.user, self.profile, self.member = create_member('employee', 'EM', department)
+        self.month = month_of(arrow.now().datetime)
+
+    def summary(self):
+        return get_member_month_summary(self.member, self.month)
+
+    def test_signals_keep_summary_in_sync(self):
+        create_tags(self.member, self.profile, 3)
+        work_time = WorkTime.objects.create(user=self.member, date=arrow.now().date(), time_total=8)
+        WorkTime.objects.create(user=self.member, date=arrow.now().shift(months=-2).date(), time_total=4)
+        self.assertEqual(self.summary(), {'total_time': 8, 'total_tag': 3, 'count_finished': 0,
+                                          'count_progress': 3, 'count_un_finished': 0})
+
+        tag = Tag.objects.first()
+        tag.state = 'CO'
+        tag.save()
+        work_time.time_total = 6.5
+        work_time.save()
+        self.assertEqual((self.summary()['total_time'], self.summary()['count_finished']), (6.5, 1))
+
+        tag.removed = True
+        tag.save()
+        work_time.delete()
+        self.assertEqual(self.summary(), {'total_time': None, 'total_tag': 2, 'count_finished': 0,
+                                          'count_progress': 2, 'count_un_finished': 0})
+        self.assertEqual(MemberMonthlySummary.objects.count(), 2)
+
+    def test_rebuild_command(self):
+        create_tags(self.member, self.profile, 2)
+        WorkTime.objects.create(user=self.member, date=arrow.now().date(), time_total=3)
+        expected = self.summary()
+
+        MemberMonthlySummary.objects.all().delete()
+        call_command('rebuild_monthly_summary', stdout=StringIO())
+        self.assertEqual(self.summary(), expected)
+
+    def test_member_statistics_reads_summary(self):
+        create_tags(self.member, self.profile, 2)
+        self.client.force_authenticate(self.director[0])
+        with CaptureQueriesContext(connection) as context:
+            data = self.client.get('/web-api/tag/member/list/statistics/?user_id=%s' % self.user.id).data
+        self.assertEqual(data['total_tag'], 2)
+        self.assertEqual(sum('web_api_membermonthlysummary' in query['sql'] for query in context.captured_queries), 1)
+        self.assertFalse(any('kpi_manager_tag' in query['sql'] for query in context.captured_queries))
+
+
+class SeedDataBenchmarkTest(APITestCase):
+    """
+    seed_data tạo dữ liệu giống nhau với cùng seed; benchmark_api đo được mọi route trên dữ liệu đó.
+    """
+
+    def seed(self, **options):
+        call_command('seed_data', departments=2, members=3, tags=2, tasks=2, comments=2, work_days=3,
+                     stdout=StringIO(), **options)
+        return list(Tag.objects.order_by('id').values_list('tag_name', 'quantity', 'state', 'finished'))
+
+    def test_seed_is_deterministic(self):
+        tags = self.seed(seed=1)
+        self.assertEqual(DepartmentMember.objects.count(), 7)
+        self.assertEqual(len(tags), 14)
+        self.assertEqual(Task.objects.count(), 28)
+        self.assertEqual(Comment.objects.count(), 56)
+        self.assertEqual(WorkTime.objects.count(), 21)
+        self.assertTrue(MemberMonthlySummary.objects.exists())
+
+        self.assertEqual(self.seed(seed=1, clear=True), tags)
+        self.assertEqual(DepartmentMember.objects.count(), 7)
+
+    def test_benchmark_covers_all_routes(self):
+        import json
+        import tempfile
+
+        self.seed()
+        with tempfile.NamedTemporaryFile(suffix='.json') as f:
+            call_command('benchmark_api', repeat=1, output=f.name, stdout=StringIO())
+            result = json.load(open(f.name))
+
+        self.assertEqual(sorted(result['skipped']), ['web-api/avatar/upload/', 'web-api/my-work-time/import/'])
+        for path, item in result['endpoints'].items():
+            self.assertEqual(item['status'], 200, path)
+            self.assertNotEqual(item['ok'], False, path)
+        # POST chạy trong transaction rồi hoàn tác
+        self.assertFalse(Tag.objects.filter(tag_name='KPI đo hiệu năng').exists())
+
+
+@override_settings(API_INSTRUMENTATION=True, API_SLOW_REQUEST_MS=0, API_SLOW_REQUEST_TOP_SQL=2)
+class InstrumentationTest(APITestCase):
+    """
+    InstrumentationMiddleware ghi số liệu theo từng API; chỉ giám đốc xem được qua API.
+    """
+
+    def setUp(self):
+        instrumentation.reset()
+        department = Department.objects.create(department_name='Phòng Kỹ Thuật')
+        self.director = create_member('director', 'DR', department, is_leader=True)
+        self.manager = create_member('manager', 'MG', department)
+        create_tags(self.manager[2], self.director[1], 3)
+
+    def tearDown(self):
+        instrumentation.reset()
+
+    def test_records_per_endpoint(self):
+        self.client.force_authenticate(self.manager[0])
+        with self.assertLogs('web_api.slow_requests', 'WARNING') as logs:
+            for _ in range(3):
+                self.assertEqual(self.client.get('/web-api/tag/list/statistics/').status_code, 200)
+            self.client.get('/web-api/my-tag/list/?query=all')
+        self.assertEqual(len(logs.output), 4)
+
+        data = instrumentation.collect()
+        self.assertEqual(data['endpoints']['tag/list/statistics']['count'], 3)
+        self.assertEqual(data['endpoints']['my-tag/list']['count'], 1)
+        self.assertGreater(data['endpoints']['my-tag/list']['max_queries'], 0)
+
+        slow = data['slow_requests'][0]
+        self.assertEqual(slow['key'], 'my-tag/list')
+        self.assertEqual(len(slow['top_sql']), 2)
+
+        out = StringIO()
+        call_command('api_stats', slow=True, stdout=out)
+        self.assertIn('tag/list/statistics', out.getvalue())
+
+    @override_settings(API_SLOW_REQUEST_MS=60000)
+    def test_stats_endpoint_is_director_only(self):
+        self.client.force_authenticate(self.manager[0])
+        self.assertFalse(self.client.get('/web-api/instrumentation/stats/').data['ok'])
+
+        self.client.force_authenticate(self.director[0])
+        data = self.client.get('/web-api/instrumentation/stats/').data
+        self.assertTrue(data['ok'])
+        self.assertIn('instrumentation/stats', data['endpoints'])
+
+
+class BatchTaskCreateTest(APITestCase):
+    """
+    Tạo nhiều task cho một KPI trong một request với số câu truy vấn cố định.
+    """
+    url = '/web-api/new-task/batch-add/'
+
+    def setUp(self):
+        department = Department.objects.create(department_name='Phòng Kỹ Thuật')
+        self.director = create_member('director', 'DR', department, is_leader=True)
+        self.employee = create_member('employee', 'EM', department)
+        create_tags(self.employee[2], self.director[1], 1)
+        self.tag = Tag.objects.get(user=self.employee[2])
+        self.client.force_authenticate(self.employee[0])
+
+    def test_create_tasks_in_one_insert(self):
+        now = arrow.now()
+        tasks = [{'task_name': 'Task %s' % i, 'target_value': i + 1, 'weight': 2,
+                  'period_start': now.isoformat(), 'period_end': now.shift(days=2).isoformat()} for i in range(30)]
+
+        with CaptureQueriesContext(connection) as context:
+            data = self.client.post(self.url, {'tag_id': self.tag.id, 'tasks': tasks}, format='json').data
+        self.assertTrue(data['ok'], data)
+        self.assertEqual(len(data['results']), 30)
+        self.assertLessEqual(len(context.captured_queries), 5)
+
+        self.assertEqual(Task.objects.filter(tag=self.tag, user=self.employee[2], state='PR').count(), 30)
+        self.assertEqual(Task.objects.get(task_name='Task 4').target_value, 5)
+
+    def test_member_reports_refreshed(self):
+        # bulk_create không gửi signal: view tự bỏ trang in đã lưu của nhân viên
+        version = caching.get_version(caching.member_reports(self.employee[2].id))
+        tasks = [{'task_name': 'Task', 'target_value': 5}]
+        data = self.client.post(self.url, {'tag_id': self.tag.id, 'tasks': tasks}, format='json').data
+        self.assertTrue(data['ok'], data)
+        self.assertNotEqual(caching.get_version(caching.member_reports(self.employee[2].id)), version)
+
+    def test_invalid_item_creates_nothing(self):
+        tasks = [{'task_name': 'Task 1', 'target_value': 5},
+                 {'task_name': 'Task 2', 'target_value': 5, 'weight': 11},
+                 {'target_value': 5}]
+        data = self.client.post(self.url, {'tag_id': self.tag.id, 'tasks': tasks}, format='json').data
+        self.assertFalse(data['ok'])
+        self.assertEqual([item['ok'] for item in data['results']], [True, False, False])
+        self.assertEqual(data['results'][1]['msg'], 'Trọng số phải có giá trị từ 1 đến 10!')
+        self.assertFalse(Task.objects.exists())
+
+    def test_finished_tag_is_rejected(self):
+        Tag.objects.filter(pk=self.tag.pk).update(state='CO')
+        tasks = '[{"task_name": "Task", "target_value": 1}]'  # dạng form: danh sách task là chuỗi JSON
+        data = self.client.post(self.url, {'tag_id': self.tag.id, 'tasks': tasks}).data
+        self.assertEqual(data['msg'], 'KPI này đã hoàn thành nên không thể tạo Task!')
+        self.assertFalse(Task.objects.exists())
+
+
+class WorkTimeImportTest(APITestCase):
+    """
+    Nhập giờ làm việc từ CSV: tính tổng giờ như API thêm giờ làm việc, bỏ qua ngày trùng.
+    """
+
+    def setUp(self):
+        department = Department.objects.create(department_name='Phòng Kỹ Thuật')
+        self.employee = create_member('employee', 'EM', department)
+        self.other = create_member('other', 'EM', department)
+        WorkTime.objects.create(user=self.employee[2], date=arrow.get('2020-03-02').date(), time_total=8)
+
+    def test_import_endpoint(self):
+        rows = ['date,start,end,rest', '2020-03-02,08:00,17:00,1', '03/03/2020,08:00,17:30,1',
+                '2020-03-03,08:00,17:00,1', '2020-03-04,09:00,08:00,', '2020-03-05,,17:00,1', '2020-03-06,8:30,,']
+        csv_file = SimpleUploadedFile('work_time.csv', '\n'.join(rows).encode(), content_type='text/csv')
+
+        self.client.force_authenticate(self.employee[0])
+        data = self.client.post('/web-api/my-work-time/import/', {'file': csv_file}, format='multipart').data
+        self.assertTrue(data['ok'], data)
+        self.assertEqual((data['rows'], data['created'], data['duplicates'], data['error_count']), (6, 2, 2, 2))
+        self.assertEqual([error['line'] for error in data['errors']], [5, 6])
+
+        work_time = WorkTime.objects.get(user=self.employee[2], date=arrow.get('2020-03-03').date())
+        self.assertEqual(work_time.time_total, 8.5)
+        self.assertEqual(WorkTime.objects.get(user=self.employee[2], date=arrow.get('2020-03-06').date()).time_total, 0)
+        self.assertEqual(get_member_month_summary(self.employee[2], arrow.get('2020-03-01').date())['total_time'], 16.5)
+
+    def test_malformed_csv(self):
+        # Ô dài hơn csv.field_size_limit(): csv.Error, không ghi dòng nào
+        rows = ['date,start,end,rest', '2020-03-09,08:00,17:00,1', '2020-03-10,08:00,17:00,"%s"' % ('x' * 200000)]
+        csv_file = SimpleUploadedFile('work_time.csv', '\n'.join(rows).encode(), content_type='text/csv')
+
+        self.client.force_authenticate(self.employee[0])
+        data = self.client.post('/web-api/my-work-time/import/', {'file': csv_file}, format='multipart').data
+        self.assertEqual(data, {'ok': False, 'msg': 'File CSV không hợp lệ!'})
+        self.assertFalse(WorkTime.objects.filter(date=arrow.get('2020-03-09').date()).exists())
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+            f.write('\n'.join(rows))
+            f.flush()
+            with self.assertRaisesMessage(CommandError, 'File CSV không hợp lệ'):
+                call_command('import_work_time', f.name, username='other', stdout=StringIO())
+
+    def test_import_command_by_username(self):
+        import tempfile
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+            f.write('username,date,start_in_day,end_in_day,rest_time\n')
+            for day in range(1, 29):
+                f.write('other,2020-02-%02d,08:00,17:00,1\n' % day)
+            f.write('nobody,2020-02-01,08:00,17:00,1\n')
+            f.flush()
+            out = StringIO()
+            call_command('import_work_time', f.name, chunk_size=10, stdout=out)
+
+        self.assertIn('29 dòng, nhập 28, trùng 0, lỗi 1', out.getvalue())
+        self.assertEqual(WorkTime.objects.filter(user=self.other[2]).count(), 28)
+        self.assertEqual(MemberMonthlySummary.objects.get(member=self.other[2]).total_time, 28 * 8)
+
+
+class ExportTest(APITestCase):
+    """
+    Xuất CSV/XLSX theo cùng phân quyền với các API danh sách, đọc dữ liệu bằng values_list().
+    """
+
+    def setUp(self):
+        self.department = Department.objects.create(department_name='Phòng Kỹ Thuật')
+        other = Department.objects.create(department_name='Phòng Kinh Doanh')
+        self.director = create_member('director', 'DR', self.department, is_leader=True)
+        self.manager = create_member('manager', 'MG', self.department)
+        self.employee = create_member('employee', 'EM', self.department)
+        self.outsider = create_member('outsider', 'EM', other)
+        for member in (self.employee, self.outsider):
+            create_tags(member[2], self.director[1], 3)
+            tag = Tag.objects.filter(user=member[2]).first()
+            Task.objects.create(user=member[2], tag=tag, task_name='=SUM(A1)', target_value=5, state='PR')
+            WorkTime.objects.create(user=member[2], date=arrow.now().date(), time_total=8)
+
+    def export(self, user, url):
+        import csv
+
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+            content = b''.join(response.streaming_content).decode('utf-8-sig')
+        return list(csv.reader(content.splitlines())), len(context.captured_queries)
+
+    def test_tag_export_follows_role(self):
+        rows, queries = self.export(self.director[0], '/web-api/tag/export/?query=all')
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[0][:3], ['Mã KPI', 'Nhân viên', 'Phòng ban'])
+        self.assertEqual(rows[1][11], 'Đang Thực Hiện')
+        self.assertLessEqual(queries, 2)
+
+        rows, _ = self.export(self.manager[0], '/web-api/tag/export/?query=all')
+        self.assertEqual({row[1] for row in rows[1:]}, {'employee'})
+
+        rows, _ = self.export(self.employee[0], '/web-api/tag/export/?query=all')
+        self.assertEqual(len(rows), 1)
+
+    def test_task_and_work_time_export(self):
+        rows, _ = self.export(self.manager[0], '/web-api/task/export/?query=all')
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][5], "'=SUM(A1)")
+
+        rows, _ = self.export(self.director[0], '/web-api/work-time/export/')
+        self.assertEqual(len(rows), 3)
+        rows, _ = self.export(self.manager[0], '/web-api/work-time/export/?user_id=%s' % self.outsider[0].id)
+        self.assertEqual(len(rows), 1)
+
+    def test_xlsx_export(self):
+        import io
+        import zipfile
+
+        self.client.force_authenticate(self.director[0])
+        response = self.client.get('/web-api/tag/export/?query=all&file_type=xlsx')
+        self.assertIn('.xlsx', response['Content-Disposition'])
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(sheet.count('<row>'), 7)
+        self.assertIn('Phòng Kinh Doanh', sheet)
+
+
+class JobQueueTest(APITestCase):
+    """
+    Hàng đợi công việc chạy nền: thêm công việc, worker chạy, chạy lại khi lỗi và phân quyền xem kết quả.
+    """
+
+    def setUp(self):
+        department = Department.objects.create(department_name='Phòng Kỹ Thuật')
+        self.director = create_member('director', 'DR', department, is_leader=True)
+        self.employee = create_member('employee', 'EM', department)
+        self.other = create_member('other', 'EM', department)
+        create_tags(self.employee[2], self.director[1], 1)
+        self.tag = Tag.objects.get()
+        Task.objects.create(user=self.employee[2], tag=self.tag, task_name='Task', target_value=5, result_value=5,
+                            state='CO')
+        Tag.objects.filter(id=self.tag.id).update(finished=1, progress=10)
+        self.client.force_authenticate(self.employee[0])
+
+    def test_background_computation(self):
+        data = self.client.post('/web-api/my-tag/computation/', {
+            'profile_id': self.employee[1].id, 'tag_id': self.tag.id, 'background': 'true'}).data
+        self.assertTrue(data['ok'], data)
+        job_id = data['jobId']
+        self.assertEqual(Tag.objects.get().finished, 1)
+
+        data = self.client.get('/web-api/job/result/', {'job_id': job_id}).data
+        self.assertEqual((data['ok'], data['state']), (False, Job.PENDING))
+
+        call_command('run_jobs', once=True, workers=0, stdout=StringIO())
+        self.assertEqual(Tag.objects.get().finished, 5)
+
+        data = self.client.get('/web-api/job/status/', {'job_id': job_id}).data
+        self.assertEqual((data['state'], data['attempts']), (Job.DONE, 1))
+        data = self.client.get('/web-api/job/result/', {'job_id': job_id}).data
+        self.assertEqual(data['result'], {'tagId': self.tag.id, 'finished': 5, 'progress': 50.0})
+
+    def test_retry_then_fail(self):
+        job = jobs.enqueue('reconcile_tag', {'tag_id': 0})
+        self.assertEqual(job.max_attempts, 3)
+
+        with self.assertLogs('web_api.jobs', 'ERROR'):
+            for attempt in range(1, 4):
+                self.assertEqual(jobs.run_pending(), 1)
+                job.refresh_from_db()
+                self.assertEqual(job.attempts, attempt)
+                if attempt < 3:
+                    # Chưa đến hạn chạy lại
+                    self.assertEqual(job.state, Job.PENDING)
+                    self.assertEqual(jobs.run_pending(), 0)
+                    Job.objects.filter(id=job.id).update(run_at=arrow.now().datetime)
+
+        self.assertEqual(job.state, Job.FAILED)
+        self.assertIn('DoesNotExist', job.error)
+        self.assertEqual(jobs.run_pending(), 0)
+
+    def test_claim_is_exclusive(self):
+        job = jobs.enqueue('reconcile_tags')
+        self.assertEqual(jobs.claim('worker-1', 5), [job.id])
+        self.assertEqual(jobs.claim('worker-2', 5), [])
+
+        # Worker bị dừng giữa chừng: công việc được đưa lại vào hàng đợi
+        Job.objects.filter(id=job.id).update(locked_at=arrow.now().shift(hours=-1).datetime)
+        self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual(jobs.claim('worker-2', 5), [job.id])
+
+    def test_permissions(self):
+        data = self.client.post('/web-api/job/add/', {'name': 'reconcile_tags'}, format='json').data
+        self.assertEqual(data['msg'], 'Không đủ quyền để thao tác!')
+
+        data = self.client.post('/web-api/job/add/', {
+            'name': 'monthly_report',
+            'params': {'profile_id': self.employee[1].id, 'year': arrow.now().year, 'month': arrow.now().month}},
+            format='json').data
+        self.assertTrue(data['ok'], data)
+        job_id = data['jobId']
+
+        self.client.force_authenticate(self.other[0])
+        data = self.client.get('/web-api/job/status/', {'job_id': job_id}).data
+        self.assertEqual(data['msg'], 'Không đủ quyền để thao tác!')
+        data = self.client.post('/web-api/job/add/', {
+            'name': 'monthly_report', 'params': {'profile_id': self.employee[1].id, 'year': 2020, 'month': 1}},
+            format='json').data
+        self.assertFalse(data['ok'])
+
+        self.client.force_authenticate(self.director[0])
+        jobs.run_pending()
+        data = self.client.get('/web-api/job/result/', {'job_id': job_id}).data
+        self.assertTrue(data['ok'], data)
+        self.assertEqual(data['result']['total_tag'], 1)
+        self.assertEqual(data['result']['tags'][0]['tagId'], self.tag.id)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CachedPrintReportTest(APITestCase):
+    """
+    Trang in báo cáo tháng được lưu lại, làm mới khi KPI, Task hoặc giờ làm việc của nhân viên thay đổi.
+    """
+    user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) ' \
+                 'Chrome/70.0.3538.77 Safari/537.36'
+
+    def setUp(self):
+        cache.clear()
+        department = Department.objects.create(department_name='Phòng Kỹ Thuật')
+        other_department = Department.objects.create(department_name='Phòng Kinh Doanh')
+        self.director = create_member('director', 'DR', department, is_leader=True)
+        self.manager = create_member('manager', 'MG', other_department, is_leader=True)
+        self.employee = create_member('employee', 'EM', department)
+        create_tags(self.employee[2], self.director[1], 1)
+        self.tag = Tag.objects.get()
+        now = arrow.now()
+        self.my_url = '/my-kpi/print/%s/%s/' % (now.year, now.month)
+        self.member_url = '/kpi/print/%s/%s/%s/' % (self.employee[1].id, now.year, now.month)
+
+    def get(self, user, url):
+        self.client.force_login(user)
+        response = self.client.get(url, HTTP_USER_AGENT=self.user_agent)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_cached_until_data_changes(self):
+        html = self.get(self.employee[0], self.my_url)
+        self.assertIn('KPI 0', html)
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.get(self.employee[0], self.my_url), html)
+        self.assertFalse(any('kpi_manager_tag' in query['sql'] for query in context.captured_queries))
+
+        self.tag.tag_name = 'KPI đã sửa'
+        self.tag.save()
+        self.assertIn('KPI đã sửa', self.get(self.employee[0], self.my_url))
+
+        Task.objects.create(user=self.employee[2], tag=self.tag, task_name='Task', target_value=5, result_value=4,
+                            state='CO')
+        self.assertIn('40,0%', self.get(self.employee[0], self.my_url))
+
+        WorkTime.objects.create(user=self.employee[2], date=arrow.now().date(), time_total=7.5)
+        self.assertIn('7,5 giờ', self.get(self.employee[0], self.my_url))
+
+        # Email trên trang in đọc từ tài khoản
+        self.employee[0].email = 'employee@example.com'
+        self.employee[0].save()
+        self.assertIn('employee@example.com', self.get(self.employee[0], self.my_url))
+
+    def test_member_report_permissions(self):
+        self.assertIn('KPI 0', self.get(self.director[0], self.member_url))
+        # Trưởng phòng khác phòng ban không xem được bản đã lưu
+        self.assertNotIn('KPI 0', self.get(self.manager[0], self.member_url))
+
+    def test_past_month_stored_without_timeout(self):
+        last_month = arrow.now().shift(months=-1)
+        Tag.objects.filter(id=self.tag.id).update(created_at=last_month.datetime)
+        call_command('rebuild_monthly_summary', stdout=StringIO())
+
+        with self.settings(API_CACHE_TIMEOUT=-1):
+            url = '/my-kpi/print/%s/%s/' % (last_month.year, last_month.month)
+            html = self.get(self.employee[0], url)
+            self.assertIn('KPI 0', html)
+            with CaptureQueriesContext(connection) as context:
+                self.get(self.employee[0], url)
+            self.assertFalse(any('kpi_manager_tag' in query['sql'] for query in context.captured_queries))
+
+
+class DeviceDetectionTest(APITestCase):
+    """
+    Phân loại User-Agent một lần cho mỗi request, kết quả được nhớ theo chuỗi User-Agent.
+    """
+    desktop = CachedPrintReportTest.user_agent
+    mobile = 'Mozilla/5.0 (iPhone; CPU iPhone OS 12_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) ' \
+             'Version/12.0 Mobile/15E148 Safari/604.1'
+
+    def test_template_selection(self):
+        response = self.client.get('/login/', HTTP_USER_AGENT=self.desktop)
+        self.assertTrue(response.wsgi_request.is_desktop)
+        self.assertTemplateUsed(response, 'registration/login.html')
+
+        response = self.client.get('/login/', HTTP_USER_AGENT=self.mobile)
+        self.assertFalse(response.wsgi_request.is_desktop)
+        self.assertTemplateUsed(response, 'registration/mobile/login.html')
+
+        # Không có User-Agent: giao diện điện thoại
+        response = self.client.get('/login/')
+        self.assertTemplateUsed(response, 'registration/mobile/login.html')
+
+    def test_classification_is_cached(self):
+        devices.classify.cache_clear()
+        for _ in range(3):
+            self.assertTrue(devices.is_desktop(self.desktop))
+        self.assertFalse(devices.is_desktop(self.mobile))
+        self.assertEqual(devices.cache_stats()['hits'], 2)
+        self.assertEqual(devices.cache_stats()['misses'], 2)
+
+
+class DescriptionRenderTest(APITestCase):
+    """
+    Mô tả KPI/Task được render Markdown và lọc HTML một lần khi lưu, API trả về HTML đã lưu.
+    """
+
+    def setUp(self):
+        department = Department.objects.create(department_name='Phòng Kỹ Thuật')
+        self.director = create_member('director', 'DR', department, is_leader=True)
+        self.employee = create_member('employee', 'EM', department)
+        create_tags(self.employee[2], self.director[1], 1)
+        self.tag = Tag.objects.get()
+        self.client.force_authenticate(self.director[0])
+
+    def test_rendered_on_save(self):
+        self.tag.tag_description = 'Mô tả **KPI** <script>alert(1)</script>'
+        self.tag.save()
+        self.tag.refresh_from_db()
+        self.assertEqual(self.tag.tag_description_html, '<p>Mô tả <strong>KPI</strong> </p>\n')
+
+        task = Task.objects.create(user=self.employee[2], tag=self.tag, task_name='Task', task_description='- Một')
+        self.assertIn('<li>Một</li>', Task.objects.get(id=task.id).task_description_html)
+
+        Tag.objects.filter(id=self.tag.id).update(tag_description_html='<p>Đã lưu</p>')
+        data = self.client.get('/web-api/tag/list/', {'query': 'all'}).data
+        self.assertEqual(data['results'][0]['tagDescriptionHtml'], '<p>Đã lưu</p>')
+        self.assertEqual(data['results'][0]['tagDescription'], self.tag.tag_description)
+
+    def test_render_command(self):
+        Tag.objects.filter(id=self.tag.id).update(tag_description='*Cũ*', tag_description_html=None)
+
+        call_command('render_descriptions', missing=True, stdout=StringIO())
+        self.assertEqual(Tag.objects.get().tag_description_html, '<p><em>Cũ</em></p>\n')
+
+        out = StringIO()
+        call_command('render_descriptions', stdout=out)
+        self.assertIn('tag: đã cập nhật 0 dòng.', out.getvalue())
+
+    def test_render_command_in_batches(self):
+        for i in range(4):
+            Task.objects.create(user=self.tag.user, tag=self.tag, task_name='Task %s' % i, state='PR')
+        Task.objects.update(task_description='**Mới**', task_description_html=None)
+
+        # Lô cuối chưa đủ batch_size vẫn được ghi
+        out = StringIO()
+        call_command('render_descriptions', model=['task'], batch_size=3, stdout=out)
+        self.assertIn('task: đã cập nhật 4 dòng.', out.getvalue())
+        self.assertEqual(set(Task.objects.values_list('task_description_html', flat=True)),
+                         {'<p><strong>Mới</strong></p>\n'})
+
+
+class CachedJWTAuthenticationTest(APITestCase):
+    """
+    Request dùng JWT không truy vấn lại User/Profile/DepartmentMember cho đến khi thông tin thay đổi.
+    """
+
+    def setUp(self):
+        cache.clear()
+        department = Department.objects.create(department_name='Phòng Kỹ Thuật')
+        self.user, self.profile, self.member = create_member('employee', 'EM', department)
+        self.client.credentials(HTTP_AUTHORIZATION='JWT %s' % jwt_encode_handler(jwt_payload_handler(self.user)))
+
+    def get_profile(self):
+        with CaptureQueriesContext(connection) as context:
+            data = self.client.get('/web-api/current-profile/get/').data
+        return data, [query['sql'] for query in context.captured_queries]
+
+    def test_principal_is_cached(self):
+        data, queries = self.get_profile()
+        self.assertEqual((data['ok'], data['permission']), (True, 'Employee'))
+        self.assertTrue(queries)
+
+        data, queries = self.get_profile()
+        self.assertEqual(data['fullName'], 'employee')
+        self.assertEqual(queries, [])
+
+        self.profile.full_name = 'Nhân viên mới'
+        self.profile.save()
+        data, queries = self.get_profile()
+        self.assertEqual(data['fullName'], 'Nhân viên mới')
+
+    def test_password_not_cached(self):
+        self.get_profile()
+        # Cache locmem khi chạy test: các giá trị là bytes đã pickle
+        cached = [value for value in cache._cache.values() if self.user.password.encode() in value]
+        self.assertEqual(cached, [])
+
+        data, queries = self.get_profile()
+        self.assertEqual((data['username'], queries), ('employee', []))
+
+    def test_disabled_user_is_rejected(self):
+        self.get_profile()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/web-api/current-profile/get/').status_code, 401)
+
+
+class CachedSessionTest(APITestCase):
+    """
+    Session đọc qua cache và chỉ được ghi lại khi thay đổi hoặc đến lúc gia hạn.
+    """
+
+    def setUp(self):
+        cache.clear()
+        department = Department.objects.create(department_name='Phòng Kỹ Thuật')
+        self.user = create_member('employee', 'EM', department)[0]
+        self.client.force_login(self.user)
+        now = arrow.now()
+        self.url = '/my-kpi/print/%s/%s/' % (now.year, now.month)
+
+    def session_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, HTTP_USER_AGENT=CachedPrintReportTest.user_agent)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in context.captured_queries if 'django_session' in query['sql']]
+
+    def test_session_read_from_cache(self):
+        self.assertEqual(self.session_queries(), [])
+
+        # Đến lúc gia hạn: ghi lại session một lần
+        with self.settings(SESSION_REFRESH_INTERVAL=0):
+            self.assertTrue(self.session_queries())
+        self.assertEqual(self.session_queries(), [])
+
+    def test_clear_expired_sessions(self):
+        expired = arrow.now().shift(days=-1).datetime
+        for i in range(5):
+            Session.objects.create(session_key='expired%s' % i, session_data='', expire_date=expired)
+
+        out = StringIO()
+        call_command('clear_expired_sessions', batch_size=2, stdout=out)
+        self.assertIn('Đã xóa 5 session hết hạn.', out.getvalue())
+        self.assertEqual(Session.objects.count(), 1)
+
+
+class AvatarProcessingTest(APITestCase):
+    """
+    Ảnh đại diện: API chỉ lưu ảnh gốc, worker tạo các kích thước AVATAR_SIZES.
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root, AVATAR_SIZES=(320, 96, 40))
+        override.enable()
+        self.addCleanup(override.disable)
+
+        department = Department.objects.create(department_name='Phòng Kỹ Thuật')
+        self.user, self.profile = create_member('employee', 'EM', department)[:2]
+        self.client.force_authenticate(self.user)
+
+    def upload(self, color):
+        buffer = BytesIO()
+        Image.new('RGB', (600, 400), color).save(buffer, 'PNG')
+        avatar = SimpleUploadedFile('avatar.png', buffer.getvalue(), content_type='image/png')
+        return self.client.post('/web-api/avatar/upload/', {'avatar': avatar}, format='multipart').data
+
+    def test_sizes_generated_by_worker(self):
+        data = self.upload('red')
+        self.assertTrue(data['ok'], data)
+        self.assertEqual(Profile.objects.get(id=self.profile.id).avatar_sizes, None)
+
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(Job.objects.get(id=data['jobId']).state, Job.DONE)
+
+        profile = Profile.objects.get(id=self.profile.id)
+        urls = profile.get_avatar_urls()
+        self.assertEqual(sorted(urls), [40, 96, 320])
+        for size, name in json.loads(profile.avatar_sizes).items():
+            with Image.open(default_storage.path(name)) as image:
+                self.assertEqual(image.size, (int(size), int(size)))
+        self.assertEqual(profile.get_avatar_url(64), urls[96])
+        self.assertEqual(profile.get_avatar_url(), urls[320])
+        self.assertEqual(profile.avatar.name, json.loads(profile.avatar_sizes)['320'])
+
+        data = self.client.get('/web-api/current-profile/get/').data
+        self.assertEqual(sorted(data['avatarSizes']), [40, 96, 320])
+
+    def test_stale_job_skipped(self):
+        self.upload('red')
+        self.upload('blue')
+        self.assertEqual(jobs.run_pending(), 2)
+
+        results = [json.loads(job.result)['skipped'] for job in Job.objects.order_by('id')]
+        self.assertEqual(results, [True, False])
+        name = json.loads(Profile.objects.get(id=self.profile.id).avatar_sizes)['40']
+        with Image.open(default_storage.path(name)) as image:
+            red, _, blue = image.convert('RGB').getpixel((20, 20))
+            self.assertGreater(blue, red)
+
+    def profile_files(self):
+        return set(default_storage.listdir('profile')[1])
+
+    def test_superseded_files_deleted(self):
+        self.upload('red')
+        jobs.run_pending()
+        red = self.profile_files()
+        self.assertEqual(len(red), 3)  # ảnh gốc đã xử lý xong cũng được xóa
+
+        # Hồ sơ khác dùng chung ảnh (cùng nội dung cùng tên file): không xóa
+        other = create_member('other', 'EM', None)[1]
+        Profile.objects.filter(id=other.id).update(avatar_sizes=Profile.objects.get(id=self.profile.id).avatar_sizes)
+
+        self.upload('blue')
+        self.upload('green')
+        self.assertEqual(jobs.run_pending(), 2)
+        green = json.loads(Profile.objects.get(id=self.profile.id).avatar_sizes).values()
+        self.assertEqual(self.profile_files(), red | {name.split('/')[-1] for name in green})
+
+        Profile.objects.filter(id=other.id).update(avatar_sizes=None)
+        self.upload('red')
+        jobs.run_pending()
+        self.assertEqual(self.profile_files(), red)
+
+
+class ScopeTest(APITestCase):
+    """
+    Phân quyền theo phạm vi: Giám đốc xem tất cả, trưởng phòng xem phòng ban của mình, lọc ngay trong câu truy vấn.
+    """
+
+    def setUp(self):
+        department = Department.objects.create(department_name='Phòng Kỹ Thuật')
+        other = Department.objects.create(department_name='Phòng Kinh Doanh')
+        self.director = create_member('director', 'DR', department, is_leader=True)
+        self.manager = create_member('manager', 'MG', department)
+        self.employee = create_member('employee', 'EM', department)
+        self.outsider = create_member('outsider', 'EM', other)
+        for member in (self.employee, self.outsider):
+            create_tags(member[2], self.director[1], 2)
+            WorkTime.objects.create(user=member[2], date=arrow.now().date(), time_total=8)
+
+    def get(self, user, url, **params):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as context:
+            data = self.client.get(url, params).data
+        return data, len(context.captured_queries)
+
+    def test_scope_q(self):
+        director, manager, employee = (resolve_acting_member(item[0])
+                                       for item in (self.director, self.manager, self.employee))
+        self.assertEqual(Tag.objects.filter(scopes.scope_q(director)).count(), 4)
+        self.assertEqual(Tag.objects.filter(scopes.scope_q(manager)).count(), 2)
+        self.assertEqual(Tag.objects.filter(scopes.scope_q(employee)).count(), 0)
+        self.assertEqual(Tag.objects.filter(scopes.scope_q(employee, include_self=True)).count(), 2)
+        self.assertEqual(DepartmentMember.objects.filter(scopes.scope_q(manager, '')).count(), 3)
+
+        self.assertTrue(scopes.in_scope(manager, self.employee[2]))
+        self.assertFalse(scopes.in_scope(manager, self.outsider[2]))
+        self.assertTrue(scopes.in_scope(employee, self.employee[2], include_self=True))
+        self.assertFalse(scopes.in_scope(employee, self.employee[2]))
+
+    def test_lists_follow_scope(self):
+        data, _ = self.get(self.manager[0], '/web-api/tag/list/', query='all')
+        self.assertEqual(data['count'], 2)
+        data, _ = self.get(self.employee[0], '/web-api/tag/list/', query='all')
+        self.assertEqual(data['count'], 0)
+        data, _ = self.get(self.director[0], '/web-api/tag/list/', query='nope')
+        self.assertEqual(data['count'], 0)
+
+        data, _ = self.get(self.manager[0], '/web-api/members/list/')
+        self.assertEqual({item['fullName'] for item in data['results']}, {'director', 'manager', 'employee'})
+        data, _ = self.get(self.manager[0], '/web-api/members/list/', department_id=self.outsider[2].department_id)
+        self.assertEqual(data['count'], 0)
+
+        data, _ = self.get(self.manager[0], '/web-api/work-time/member/list/', user_id=self.employee[0].id)
+        self.assertEqual(data['count'], 1)
+        data, _ = self.get(self.manager[0], '/web-api/work-time/member/list/', user_id=self.outsider[0].id)
+        self.assertEqual(data['count'], 0)
+
+        data, _ = self.get(self.manager[0], '/web-api/tag/list/statistics/', query='all')
+        self.assertEqual(data['total'], 2)
+        data, _ = self.get(self.employee[0], '/web-api/tag/list/statistics/', query='all')
+        self.assertEqual(data, {})
+
+    def test_member_tags_without_member_lookup(self):
+        # Danh sách KPI của một nhân viên: chỉ đếm và lấy dữ liệu, không truy vấn nhân viên hay phòng ban
+        data, queries = self.get(self.manager[0], '/web-api/tag/member/', query='all', user_id=self.employee[0].id)
+        self.assertEqual(data['count'], 2)
+        _, outside_queries = self.get(self.manager[0], '/web-api/tag/member/', query='all',
+                                      user_id=self.outsider[0].id)
+        self.assertEqual(outside_queries, queries - 1)
+
+        tag = Tag.objects.filter(user=self.outsider[2]).first()
+        data, _ = self.get(self.manager[0], '/web-api/tag/member/detail/', user_id=self.outsider[0].id,
+                           tag_id=tag.id)
+        self.assertEqual(data, {})
+        data, _ = self.get(self.director[0], '/web-api/tag/member/detail/', user_id=self.outsider[0].id,
+                           tag_id=tag.id)
+        self.assertEqual(data['tagId'], tag.id)
+
+        data, _ = self.get(self.manager[0], '/web-api/profile/info/specific/', user_id=self.outsider[0].id)
+        self.assertEqual(data, {})
+
+
+    def test_member_lists_need_manager(self):
+        # ScopePermission: danh sách theo nhân viên chỉ dành cho Giám đốc và trưởng phòng
+        for url, params in (('/web-api/members/list/', {}),
+                            ('/web-api/tag/member/', {'query': 'all', 'user_id': self.employee[0].id}),
+                            ('/web-api/work-time/member/list/', {'user_id': self.employee[0].id})):
+            self.client.force_authenticate(self.employee[0])
+            self.assertEqual(self.client.get(url, params).status_code, 403)
+            self.client.force_authenticate(self.director[0])
+            self.assertEqual(self.client.get(url, params).status_code, 200)
+
+    def test_task_reads_follow_scope(self):
+        for member in (self.employee, self.outsider):
+            task = Task.objects.create(user=member[2], tag=Tag.objects.filter(user=member[2]).first(),
+                                       task_name='Task', state='PR')
+            Comment.objects.create(task=task, user=member[1], content='Góp ý')
+
+        for user, owner, visible in ((self.employee, self.employee, True), (self.employee, self.outsider, False),
+                                     (self.manager, self.employee, True), (self.manager, self.outsider, False)):
+            task = Task.objects.get(user=owner[2])
+            data, _ = self.get(user[0], '/web-api/task/list/', user_id=owner[0].id, tag_id=task.tag_id)
+            self.assertEqual(data['count'], int(visible))
+            data, _ = self.get(user[0], '/web-api/task/comment/list/', task_id=task.id)
+            self.assertEqual(data['count'], int(visible))
+            data, _ = self.get(user[0], '/web-api/task/member/detail/', user_id=owner[0].id, task_id=task.id)
+            self.assertEqual(data.get('taskId'), task.id if visible else None)
+
+    def test_manager_without_department(self):
+        # department_id NULL không được coi là cùng phòng ban với nhân viên chưa có phòng ban
+        homeless = create_member('homeless', 'EM', None)
+        create_tags(homeless[2], self.director[1], 1)
+        manager = resolve_acting_member(create_member('lonely', 'MG', None)[0])
+        self.assertEqual(Tag.objects.filter(scopes.scope_q(manager)).count(), 0)
+        self.assertEqual(DepartmentMember.objects.filter(scopes.scope_q(manager, '')).count(), 0)
+        self.assertFalse(scopes.in_scope(manager, homeless[2]))
+
+class TagIncludeTest(APITestCase):
+    """
+    Danh sách KPI với include=tasks,commentCount trả về Task và số bình luận với số câu truy vấn cố định.
+    """
+
+    def setUp(self):
+        department = Department.objects.create(department_name='Phòng Kỹ Thuật')
+        self.director = create_member('director', 'DR', department, is_leader=True)
+        self.employee = create_member('employee', 'EM', department)
+        self.client.force_authenticate(self.employee[0])
+
+    def add_tags(self, count):
+        create_tags(self.employee[2], self.director[1], count)
+        for tag in Tag.objects.filter(user=self.employee[2], removed=False):
+            if Task.objects.filter(tag=tag).exists():
+                continue
+            for i in range(2):
+                task = Task.objects.create(user=self.employee[2], tag=tag, task_name='Task %s' % i, target_value=5)
+                Comment.objects.create(task=task, user=self.director[1], content='Bình luận')
+            Task.objects.create(user=self.employee[2], tag=tag, task_name='Đã xóa', removed=True)
+
+    def get(self, include):
+        with CaptureQueriesContext(connection) as context:
+            data = self.client.get('/web-api/my-tag/list/', {'query': 'all', 'include': include,
+                                                              'page_size': 100}).data
+        return data, len(context.captured_queries)
+
+    def test_include_tasks_and_comment_count(self):
+        self.add_tags(2)
+        data, small = self.get('tasks,commentCount')
+        tag = data['results'][0]
+        self.assertEqual(tag['commentCount'], 2)
+        self.assertEqual(len(tag['tasks']), 2)
+        self.assertEqual({item['tagId'] for item in tag['tasks']}, {tag['tagId']})
+        self.assertEqual([item['commentCount'] for item in tag['tasks']], [1, 1])
+
+        self.add_tags(20)
+        data, large = self.get('tasks,commentCount')
+        self.assertEqual(data['count'], 22)
+        self.assertEqual(small, large)
+
+    def test_include_is_optional(self):
+        self.add_tags(1)
+        data, plain = self.get('')
+        self.assertNotIn('tasks', data['results'][0])
+        self.assertNotIn('commentCount', data['results'][0])
+
+        data, queries = self.get('commentCount')
+        self.assertEqual(data['results'][0]['commentCount'], 2)
+        self.assertNotIn('tasks', data['results'][0])
+        self.assertEqual(queries, plain)
+
+        data, _ = self.get('tasks')
+        self.assertNotIn('commentCount', data['results'][0]['tasks'][0])
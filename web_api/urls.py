@@ -1,5 +1,5 @@
 from django.conf.urls import url, include
-from web_api.views import general_api, department, tag, task, work_time
+from web_api.views import general_api, department, export, job, tag, task, work_time
 
 from . import views
 
@@ -104,6 +104,10 @@ urlpatterns = [
         url(r'^new-task/add/$', task.add_new_task_api_view,
             name='task_add'),  # Xong
 
+        # POST: Thêm nhiều Task mới của tôi cho một KPI
+        url(r'^new-task/batch-add/$', task.add_new_task_batch_api_view,
+            name='task_batch_add'),
+
         # POST: Chỉnh sửa một Task của tôi
         url(r'^my-task/edit/$', task.edit_my_task_api_view,
             name='my_task_edit'),  # Xong
@@ -144,6 +148,10 @@ urlpatterns = [
         url(r'^my-work-time/add/$', work_time.add_my_work_time_api_view,
             name='my_work_time_add'),
 
+        # POST: Nhập giờ làm việc của tôi từ file CSV
+        url(r'^my-work-time/import/$', work_time.import_my_work_time_api_view,
+            name='my_work_time_import'),
+
         # POST: Chỉnh sửa hoặc xóa giờ làm việc của tôi
         url(r'^my-work-time/edit/$', work_time.edit_my_work_time_api_view,
             name='my_work_time_edit'),
@@ -156,6 +164,34 @@ urlpatterns = [
         url(r'^my-work-time/statistic/$', work_time.my_work_time_statistic_api_view,
             name='my_work_time_statistic'),
 
+        # GET: Số liệu hiệu năng của các API (Giám đốc)
+        url(r'^instrumentation/stats/$', general_api.get_instrumentation_stats_api_view,
+            name='instrumentation_stats'),
+
+        # GET: Xuất file CSV/XLSX danh sách KPI
+        url(r'^tag/export/$', export.ExportTagListView.as_view(),
+            name='tag_export'),
+
+        # GET: Xuất file CSV/XLSX danh sách Task
+        url(r'^task/export/$', export.ExportTaskListView.as_view(),
+            name='task_export'),
+
+        # GET: Xuất file CSV/XLSX giờ làm việc
+        url(r'^work-time/export/$', export.ExportWorkTimeListView.as_view(),
+            name='work_time_export'),
+
+        # POST: Thêm công việc chạy nền
+        url(r'^job/add/$', job.add_job_api_view,
+            name='job_add'),
+
+        # GET: Trạng thái công việc chạy nền
+        url(r'^job/status/$', job.get_job_status_api_view,
+            name='job_status'),
+
+        # GET: Kết quả công việc chạy nền
+        url(r'^job/result/$', job.get_job_result_api_view,
+            name='job_result'),
+
         # POST: Đổi ảnh đại diện
         url(r'^avatar/upload/$', general_api.upload_avatar_api_view,
             name='avatar_upload'),
@@ -1,39 +1,29 @@
 from rest_framework import generics
 from rest_framework.decorators import api_view
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
 from kpi_manager.models import Profile, Department, DepartmentMember
 from utils.common import can_be_integer
 from web_api.utils import build_absolute_url
+from ..members import get_member
+from ..querysets import department_list_queryset, member_list_queryset
+from .. import caching, scopes
+from ..pagination import StandardResultsSetPagination
 from .. import serializers as serializer_api
 
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 1000
-
-    def get_paginated_response(self, data):
-        return Response({
-            'count': self.page.paginator.count,
-            'page_size': self.page_size,
-            'current': self.page.number,
-            'results': data
-        })
-
-
-class GetDepartmentListView(generics.ListAPIView):
+class GetDepartmentListView(caching.CachedListMixin, generics.ListAPIView):
     """
     API lấy danh sách phòng ban
     """
     serializer_class = serializer_api.GetDepartmentListSerializer
     pagination_class = StandardResultsSetPagination
+    cache_namespace = caching.DEPARTMENTS
 
     def get_queryset(self):
         if self.request.user.is_authenticated:
             try:
-                department = Department.objects.filter(removed=False).order_by('-department_level')
+                department = department_list_queryset().filter(removed=False).order_by('-department_level')
                 return department
             except Department.DoesNotExist:
                 return []
@@ -46,41 +36,19 @@ class GetMemberInDepartmentListView(generics.ListAPIView):
     """
     serializer_class = serializer_api.GetMemberInDepartmentSerializer
     pagination_class = StandardResultsSetPagination
+    filter_backends = (scopes.ScopeFilterBackend,)
+    scope_roles = (scopes.DIRECTOR, scopes.MANAGER)
+    scope_path = ''
 
     def get_queryset(self):
         if self.request.user.is_authenticated:
             department_id = self.request.GET.get('department_id')
-            try:
-                my_profile = Profile.objects.get(user__id=self.request.user.id, removed=False)
-                if not department_id:
-                    if my_profile.get_role() == 'Director':
-                        return DepartmentMember.objects.filter(removed=False)
-                    elif my_profile.get_role() == 'Manager':
-                        me = DepartmentMember.objects.get(department_member=my_profile, removed=False)
-                        d_id = me.department.id
-                        department = Department.objects.get(pk=d_id)
-                        return DepartmentMember.objects.filter(department=department, removed=False)
-                    else:
-                        return []
-                if department_id:
-                    if not can_be_integer(department_id):
-                        return []
-
-                    if my_profile.get_role() == 'Director':
-                        department = Department.objects.get(pk=department_id)
-                        return DepartmentMember.objects.filter(department=department, removed=False)
-                    elif my_profile.get_role() == 'Manager':
-                        me = DepartmentMember.objects.get(department_member=my_profile, removed=False)
-                        d_id = me.department.id
-                        if int(d_id) == int(department_id):
-                            department = Department.objects.get(pk=department_id)
-                            return DepartmentMember.objects.filter(department=department, removed=False)
-                        else:
-                            return []
-                    else:
-                        return []
-            except (Profile.DoesNotExist, Department.DoesNotExist, Department.DoesNotExist):
-                return []
+            queryset = member_list_queryset().filter(removed=False)
+            if department_id:
+                if not can_be_integer(department_id):
+                    return []
+                queryset = queryset.filter(department_id=department_id)
+            return queryset
         return []
 
 
@@ -92,10 +60,8 @@ def get_my_profile_info_in_department(request):
     :return:
     """
     if request.user.is_authenticated:
-        user = request.user
         try:
-            profile = Profile.objects.get(user=user, removed=False)
-            member = DepartmentMember.objects.get(department_member=profile, removed=False)
+            member = request.member.get_department_member()
             return Response({
                 'userId': member.department_member.user.id,
                 'profileId': member.department_member.id,
@@ -124,53 +90,68 @@ def get_profile_info_specific_in_department(request):
     :return:
     """
     if request.user.is_authenticated:
-        pern = request.user.profile.get_role()
         user_id = request.GET.get('user_id')
         if not user_id:
             return Response({})
         if not can_be_integer(user_id):
             return Response({})
         try:
-            if pern == 'Director':
-                profile = Profile.objects.get(user__id=user_id, removed=False)
-                member = DepartmentMember.objects.get(department_member=profile, removed=False)
-                return Response({
-                    'userId': member.department_member.user.id,
-                    'profileId': member.department_member.id,
-                    'fullName': member.department_member.full_name,
-                    'sex': member.department_member.get_sex(),
-                    'avatarUrl': build_absolute_url(member.department_member.get_avatar_url()),
-                    'position': member.position,
-                    'departmentId': member.department.id,
-                    'department': member.department.department_name,
-                })
-            elif pern == 'Manager':
-                profile = Profile.objects.get(user__id=user_id, removed=False)
-                my_profile = Profile.objects.get(user__id=request.user.id, removed=False)
-
-                me = DepartmentMember.objects.get(department_member=my_profile, removed=False)
-                member = DepartmentMember.objects.get(department_member=profile, removed=False)
-                if int(me.department.id) == int(member.department.id):
-                    return Response({
-                        'userId': member.department_member.user.id,
-                        'profileId': member.department_member.id,
-                        'fullName': member.department_member.full_name,
-                        'sex': member.department_member.get_sex(),
-                        'avatarUrl': build_absolute_url(member.department_member.get_avatar_url()),
-                        'position': member.position,
-                        'departmentId': member.department.id,
-                        'department': member.department.department_name,
-                    })
-                else:
-                    return Response({})
-            else:
+            member = get_member(department_member__user_id=user_id)
+            if not scopes.in_scope(request.member, member):
                 return Response({})
 
+            return Response({
+                'userId': member.department_member.user.id,
+                'profileId': member.department_member.id,
+                'fullName': member.department_member.full_name,
+                'sex': member.department_member.get_sex(),
+                'avatarUrl': build_absolute_url(member.department_member.get_avatar_url()),
+                'position': member.position,
+                'departmentId': member.department.id,
+                'department': member.department.department_name,
+            })
+
         except (Profile.DoesNotExist, DepartmentMember.DoesNotExist):
             return Response({})
     return Response({})
 
 
+def get_profile_list_data(department_id=None):
+    """
+    Danh sách hồ sơ (userId, profileId, fullName) của toàn công ty hoặc của một phòng ban.
+    """
+    data = []
+    if department_id is None:
+        for item in Profile.objects.filter(removed=False).select_related('user'):
+            data.append({
+                'userId': item.user.id,
+                'profileId': item.id,
+                'fullName': item.full_name,
+            })
+        return data
+
+    profile = DepartmentMember.objects.filter(department__id=department_id,
+                                              removed=False).select_related('department_member__user')
+    for item in profile:
+        data.append({
+            'userId': item.department_member.user.id,
+            'profileId': item.department_member.id,
+            'fullName': item.department_member.full_name,
+        })
+    return data
+
+
+def get_department_list_data():
+    data = []
+    for item in Department.objects.filter(removed=False):
+        data.append({
+            'departmentId': item.id,
+            'departmentName': item.department_name,
+            'departmentLevel': item.department_level,
+        })
+    return data
+
+
 @api_view(['GET'])
 def get_profile_list_no_pagination_api_view(request):
     """
@@ -179,34 +160,19 @@ def get_profile_list_no_pagination_api_view(request):
     :return:
     """
     if request.user.is_authenticated:
-        pern = request.user.profile.get_role()
+        pern = request.member.get_role()
         department_id = request.GET.get('department_id')
-        data = []
         if not department_id:
             if pern != 'Director' and pern != 'Manager':
                 return Response([])
             try:
                 if pern == 'Director':
-                    profile = Profile.objects.filter(removed=False)
-                    for item in profile:
-                        data.append({
-                            'userId': item.user.id,
-                            'profileId': item.id,
-                            'fullName': item.full_name,
-                        })
-
-                    return Response(data)
+                    return Response(caching.get_or_set(caching.PROFILES, ('all',), get_profile_list_data))
                 if pern == 'Manager':
-                    dpm = DepartmentMember.objects.get(department_member=request.user.profile, removed=False)
-                    profile = DepartmentMember.objects.filter(department__id=dpm.department.id, removed=False)
-                    for item in profile:
-                        data.append({
-                            'userId': item.department_member.user.id,
-                            'profileId': item.department_member.id,
-                            'fullName': item.department_member.full_name,
-                        })
-
-                    return Response(data)
+                    dpm = request.member.get_department_member()
+                    d_id = dpm.department.id
+                    return Response(caching.get_or_set(caching.PROFILES, ('department', d_id),
+                                                       lambda: get_profile_list_data(d_id)))
             except (Profile.DoesNotExist,):
                 return Response([])
         elif department_id:
@@ -214,19 +180,13 @@ def get_profile_list_no_pagination_api_view(request):
                 return Response([])
             if pern != 'Director' and pern != 'Manager':
                 return Response([])
-            dpm = DepartmentMember.objects.get(department_member=request.user.profile, removed=False)
+            dpm = request.member.get_department_member()
             if pern != 'Director' and dpm.department.id != int(department_id):
                 return Response([])
             try:
-                profile = DepartmentMember.objects.filter(department__id=department_id, removed=False)
-                for item in profile:
-                    data.append({
-                        'userId': item.department_member.user.id,
-                        'profileId': item.department_member.id,
-                        'fullName': item.department_member.full_name,
-                    })
-
-                return Response(data)
+                d_id = int(department_id)
+                return Response(caching.get_or_set(caching.PROFILES, ('department', d_id),
+                                                   lambda: get_profile_list_data(d_id)))
 
             except (DepartmentMember.DoesNotExist,):
                 return Response([])
@@ -242,20 +202,11 @@ def get_department_list_no_pagination_api_view(request):
     :return:
     """
     if request.user.is_authenticated:
-        pern = request.user.profile.get_role()
-        data = []
+        pern = request.member.get_role()
         if pern != 'Director' and pern != 'Manager':
             return Response([])
         try:
-            department = Department.objects.filter(removed=False)
-            for item in department:
-                data.append({
-                    'departmentId': item.id,
-                    'departmentName': item.department_name,
-                    'departmentLevel': item.department_level,
-                })
-
-            return Response(data)
+            return Response(caching.get_or_set(caching.DEPARTMENTS, ('all',), get_department_list_data))
 
         except (Department.DoesNotExist,):
             return Response([])
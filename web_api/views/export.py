@@ -0,0 +1,93 @@
+import arrow
+from django.conf import settings
+
+from rest_framework.response import Response
+
+from kpi_manager.models import Task, WorkTime
+from utils.common import can_be_integer
+from ..exports import export_response, TAG_COLUMNS, TASK_COLUMNS, WORK_TIME_COLUMNS
+from .tag import GetTagListView
+from .work_time import GetWordTimeMemberListView
+
+
+class ExportMixin(object):
+    """
+    Xuất file CSV/XLSX (?file_type=csv|xlsx) từ get_queryset() của view danh sách tương ứng, nên cùng quy tắc
+    phân quyền. Dữ liệu được đọc và gửi dần, không qua serializer và không phân trang.
+    """
+    export_columns = ()
+    export_name = 'export'
+    pagination_class = None
+
+    def get_export_queryset(self):
+        return self.filter_queryset(self.get_queryset())
+
+    def list(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return Response({'ok': False, 'msg': 'Bạn chưa đăng nhập!'})
+
+        file_type = request.GET.get('file_type', 'csv')
+        if file_type not in ('csv', 'xlsx'):
+            return Response({'ok': False, 'msg': 'Định dạng file không hợp lệ!'})
+
+        return export_response(self.get_export_queryset(), self.export_columns, file_type, self.export_name)
+
+
+class ExportTagListView(ExportMixin, GetTagListView):
+    """
+    API xuất danh sách KPI của tất cả nhân viên (Director) hoặc của phòng ban (Manager), cùng tham số query
+    """
+    export_columns = TAG_COLUMNS
+    export_name = 'kpi'
+
+
+class ExportTaskListView(ExportMixin, GetTagListView):
+    """
+    API xuất các Task thuộc những KPI mà GetTagListView trả về
+    """
+    export_columns = TASK_COLUMNS
+    export_name = 'task'
+
+    def get_export_queryset(self):
+        tags = super(ExportTaskListView, self).get_export_queryset()
+        if isinstance(tags, list):
+            return []
+        return Task.objects.filter(tag__in=tags.order_by().values('id'), removed=False).order_by('tag_id', 'id')
+
+
+class ExportWorkTimeListView(ExportMixin, GetWordTimeMemberListView):
+    """
+    API xuất giờ làm việc. Có user_id: giống GetWordTimeMemberListView.
+    Không có user_id: giờ làm việc trong phạm vi của người gọi (ScopeFilterBackend).
+    Lọc theo tháng bằng month_request, year_request.
+    """
+    export_columns = WORK_TIME_COLUMNS
+    export_name = 'gio-lam-viec'
+
+    def get_export_queryset(self):
+        if self.request.GET.get('user_id'):
+            queryset = self.get_queryset()
+        else:
+            queryset = self.get_scope_queryset()
+        if isinstance(queryset, list):
+            return []
+        return self.filter_queryset(queryset).order_by('user_id', 'date')
+
+    def get_scope_queryset(self):
+        month_request = self.request.GET.get('month_request')
+        year_request = self.request.GET.get('year_request')
+        queryset = WorkTime.objects.filter(removed=False)
+
+        if month_request and year_request:
+            if not can_be_integer(month_request) or not can_be_integer(year_request):
+                return []
+
+            if int(month_request) < 1 or int(month_request) > 12:
+                return []
+
+            if int(year_request) < 1990 or int(year_request) > arrow.now().year:
+                return []
+
+            month = arrow.Arrow(int(year_request), int(month_request), 1, tzinfo=settings.TIME_ZONE)
+            queryset = queryset.filter(date__range=(month.floor('month').date(), month.ceil('month').date()))
+        return queryset
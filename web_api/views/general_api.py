@@ -9,6 +9,8 @@ from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
 
 from kpi_manager.models import Profile
+from utils import devices
+from web_api import avatars, instrumentation, jobs, scopes
 from web_api.utils import build_absolute_url
 
 
@@ -34,13 +36,14 @@ def get_user_api_view(request):
     if request.user.is_authenticated:
 
         try:
-            profile = Profile.objects.get(user=user, removed=False)
+            profile = request.member.get_profile()
             birthday = arrow.get(profile.birth_day).replace(tzinfo=settings.TIME_ZONE).datetime
 
             data = {
                'ok': True,
                'username': user.username,
-               'avatar': build_absolute_url(user.profile.get_avatar_url()),
+               'avatar': build_absolute_url(profile.get_avatar_url()),
+               'avatarSizes': {size: build_absolute_url(url) for size, url in profile.get_avatar_urls().items()},
                'userId': user.id,
                'permission': profile.get_role(),
                'fullName': profile.full_name,
@@ -54,6 +57,22 @@ def get_user_api_view(request):
     return Response(data)
 
 
+@api_view(['GET'])
+def get_instrumentation_stats_api_view(request):
+    """
+    API số liệu thời gian phản hồi, số câu truy vấn của từng API và các request chậm (chỉ Giám đốc)
+    """
+    if not request.user.is_authenticated:
+        return Response({'ok': False, 'msg': 'Bạn chưa đăng nhập!'})
+
+    if request.member.role != scopes.DIRECTOR:
+        return Response({'ok': False, 'msg': 'Không đủ quyền để thao tác!'})
+
+    data = instrumentation.collect()
+    data.update({'ok': True, 'enabled': settings.API_INSTRUMENTATION, 'user_agent_cache': devices.cache_stats()})
+    return Response(data)
+
+
 @api_view(['POST'])
 def update_profile(request):
     """
@@ -125,10 +144,14 @@ def upload_avatar_api_view(request):
     try:
         profile = Profile.objects.get(user=user, removed=False)
 
-        profile.avatar = avatar
-        profile.save()
+        # Chỉ lưu ảnh gốc, các kích thước được tạo bởi worker (run_jobs); trong lúc chờ vẫn dùng ảnh cũ
+        original = avatars.save_original(avatar)
+        profile.avatar_original = original
+        profile.save(update_fields=['avatar_original'])
+        job = jobs.enqueue('avatar_sizes', {'profile_id': profile.id, 'original': original},
+                           created_by=profile)
 
-        return Response({'ok': True, 'msg': 'Đổi ảnh đại diện thành công!'})
+        return Response({'ok': True, 'msg': 'Đổi ảnh đại diện thành công!', 'jobId': job.id})
     except (Profile.DoesNotExist, OSError):
         return Response({'ok': False, 'msg': 'Cập nhật thất bại!'})
 
@@ -0,0 +1,113 @@
+import json
+
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+
+from utils.common import can_be_integer
+from .. import jobs, scopes
+from ..models import Job
+
+
+def get_job_for_request(request):
+    """
+    Công việc theo job_id mà người dùng được xem: người tạo hoặc Giám đốc
+    :return: (Job, None) hoặc (None, thông báo lỗi)
+    """
+    job_id = request.GET.get('job_id')
+    if not job_id or not can_be_integer(job_id):
+        return None, 'Không tồn tại công việc!'
+
+    try:
+        job = Job.objects.get(id=job_id)
+    except Job.DoesNotExist:
+        return None, 'Không tồn tại công việc!'
+
+    if request.member.role != scopes.DIRECTOR and \
+            (not request.member.profile or job.created_by_id != request.member.profile.id):
+        return None, 'Không đủ quyền để thao tác!'
+    return job, None
+
+
+def job_data(job):
+    return {
+        'jobId': job.id,
+        'name': job.name,
+        'state': job.state,
+        'stateName': job.get_state_display(),
+        'attempts': job.attempts,
+        'maxAttempts': job.max_attempts,
+        'runAt': job.run_at,
+        'createdAt': job.created_at,
+        'finishedAt': job.finished_at,
+        # Chỉ trả về dòng cuối của traceback
+        'error': job.error.strip().splitlines()[-1] if job.error else None,
+    }
+
+
+@api_view(['POST'])
+def add_job_api_view(request):
+    """
+    API thêm một công việc chạy nền, trả về jobId để theo dõi bằng job/status/ và job/result/
+    :param request: name, params (object, hoặc chuỗi JSON nếu gửi dạng form)
+    """
+    name = request.data.get('name')
+    params = request.data.get('params') or {}
+
+    if not request.user.is_authenticated:
+        return Response({'ok': False, 'msg': 'Bạn chưa đăng nhập!'})
+
+    if name not in jobs.JOBS:
+        return Response({'ok': False, 'msg': 'Không tồn tại công việc!'})
+
+    if isinstance(params, str):
+        try:
+            params = json.loads(params)
+        except ValueError:
+            params = None
+
+    if not isinstance(params, dict):
+        return Response({'ok': False, 'msg': 'Tham số không hợp lệ!'})
+
+    if not jobs.JOBS[name].allowed(request.member, params):
+        return Response({'ok': False, 'msg': 'Không đủ quyền để thao tác!'})
+
+    job = jobs.enqueue(name, params, created_by=request.member.profile)
+    return Response({'ok': True, 'msg': 'Đã thêm công việc!', 'jobId': job.id})
+
+
+@api_view(['GET'])
+def get_job_status_api_view(request):
+    """
+    API trạng thái của công việc
+    :param request: job_id
+    """
+    if not request.user.is_authenticated:
+        return Response({'ok': False, 'msg': 'Bạn chưa đăng nhập!'})
+
+    job, msg = get_job_for_request(request)
+    if msg:
+        return Response({'ok': False, 'msg': msg})
+
+    data = job_data(job)
+    data['ok'] = True
+    return Response(data)
+
+
+@api_view(['GET'])
+def get_job_result_api_view(request):
+    """
+    API kết quả của công việc đã hoàn thành
+    :param request: job_id
+    """
+    if not request.user.is_authenticated:
+        return Response({'ok': False, 'msg': 'Bạn chưa đăng nhập!'})
+
+    job, msg = get_job_for_request(request)
+    if msg:
+        return Response({'ok': False, 'msg': msg})
+
+    if job.state != Job.DONE:
+        return Response({'ok': False, 'msg': 'Công việc chưa hoàn thành!', 'state': job.state,
+                         'stateName': job.get_state_display()})
+
+    return Response({'ok': True, 'jobId': job.id, 'result': json.loads(job.result)})
@@ -1,201 +1,92 @@
 import arrow
 from django.conf import settings
-from django.db.models import Sum
 
 from rest_framework import generics
 from rest_framework.decorators import api_view
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
-from kpi_manager.models import Profile, Tag, Task, DepartmentMember, WorkTime
+from kpi_manager.models import Profile, Tag, Task, DepartmentMember
 from utils.common import can_be_integer
+from .. import jobs, scopes
+from ..members import get_member
+from ..querysets import prefetch_tag_tasks, tag_comment_count, tag_list_queryset, tag_period_q
+from ..rollup import reconcile_tag
+from ..statistics import count_tags_by_state
+from ..summary import get_member_month_summary
+from ..pagination import StandardResultsSetPagination
 from .. import serializers as serializer_api
 
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 1000
+# Các giá trị của tham số include của danh sách KPI
+TAG_INCLUDES = ('tasks', 'commentCount')
 
-    def get_paginated_response(self, data):
-        return Response({
-            'count': self.page.paginator.count,
-            'page_size': self.page_size,
-            'current': self.page.number,
-            'results': data
-        })
 
+class TagIncludeMixin(object):
+    """
+    Danh sách KPI với include=tasks,commentCount: kèm các Task của mỗi KPI (tasks) và số bình luận
+    (commentCount của KPI và của từng Task), thay cho việc gọi my-task/list/ và comment/list/ cho từng KPI.
+    Số câu truy vấn không phụ thuộc vào số KPI trong trang.
+    """
+
+    def get_includes(self):
+        return {item.strip() for item in self.request.GET.get('include', '').split(',')} & set(TAG_INCLUDES)
 
-class GetTagListView(generics.ListAPIView):
+    def filter_queryset(self, queryset):
+        queryset = super(TagIncludeMixin, self).filter_queryset(queryset)
+        if 'commentCount' in self.get_includes() and not isinstance(queryset, list):
+            queryset = queryset.annotate(comment_count=tag_comment_count())
+        return queryset
+
+    def paginate_queryset(self, queryset):
+        page = super(TagIncludeMixin, self).paginate_queryset(queryset)
+        includes = self.get_includes()
+        if page is not None and 'tasks' in includes:
+            page = prefetch_tag_tasks(page, comment_count='commentCount' in includes)
+        return page
+
+
+class GetTagListView(TagIncludeMixin, generics.ListAPIView):
     """
     API lấy danh sách các Tag của tất cả nhân viên (Direct) và thuộc phòng ban (Manager)
     """
     serializer_class = serializer_api.GetTagOfMemberSerializer
     pagination_class = StandardResultsSetPagination
+    filter_backends = (scopes.ScopeFilterBackend,)
 
     def get_queryset(self):
-        user_id = self.request.user.id
-        query = self.request.GET.get('query')
-        if self.request.user.is_authenticated:
-            try:
-                profile = Profile.objects.get(user__id=user_id, removed=False)
-                if profile.get_role() == 'Director':
-                    if not query:
-                        # lấy theo query=current
-                        return Tag.objects.filter(period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime,
-                                                  removed=False).order_by('-created_at')
-                    elif query == 'all':
-                        return Tag.objects.filter(removed=False).order_by('-created_at')
-                    elif query == 'current':
-                        # kpi chưa hết hạn
-                        return Tag.objects.filter(period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime,
-                                                  removed=False).order_by('-created_at')
-                    elif query == 'tmonth':
-                        # kpi được tạo trong tháng này, bắt đầu trong tháng này, kết thúc sau hôm nay
-                        start = arrow.now().to(settings.TIME_ZONE).floor('month').datetime
-                        end = arrow.now().to(settings.TIME_ZONE).ceil('month').datetime
-                        return Tag.objects.filter(period_start__range=(start, end),
-                                                  period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime,
-                                                  created_at__range=(start, end),
-                                                  removed=False).order_by('-created_at')
-                    elif query == 'outdated':
-                        return Tag.objects.filter(period_end__lt=arrow.now().to(settings.TIME_ZONE).datetime,
-                                                  removed=False).order_by('-created_at')
-                    else:
-                        return []
-
-                elif profile.get_role() == 'Manager':
-                    member = DepartmentMember.objects.get(department_member=profile, removed=False)
-                    d_id = member.department.id
-                    if not query:
-                        # lấy theo query=current
-                        return Tag.objects.filter(user__department__id=d_id,
-                                                  period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime,
-                                                  removed=False).order_by('-updated_at')
-                    elif query == 'all':
-                        return Tag.objects.filter(user__department__id=d_id,
-                                                  removed=False).order_by('-updated_at')
-                    elif query == 'current':
-                        # kpi chưa hết hạn
-                        return Tag.objects.filter(user__department__id=d_id,
-                                                  period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime,
-                                                  removed=False).order_by('-updated_at')
-                    elif query == 'tmonth':
-                        # kpi được tạo trong tháng này, bắt đầu trong tháng này, kết thúc sau hôm nay
-                        start = arrow.now().to(settings.TIME_ZONE).floor('month').datetime
-                        end = arrow.now().to(settings.TIME_ZONE).ceil('month').datetime
-                        return Tag.objects.filter(user__department__id=d_id,
-                                                  period_start__range=(start, end),
-                                                  period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime,
-                                                  created_at__range=(start, end),
-                                                  removed=False).order_by('-updated_at')
-                    elif query == 'outdated':
-                        return Tag.objects.filter(user__department__id=d_id,
-                                                  period_end__lt=arrow.now().to(settings.TIME_ZONE).datetime,
-                                                  removed=False).order_by('-updated_at')
-                    else:
-                        return []
-                else:
-                    return []
+        period = tag_period_q(self.request.GET.get('query'))
+        if not self.request.user.is_authenticated or period is None:
+            return []
 
-            except (Profile.DoesNotExist, DepartmentMember.DoesNotExist, Tag.DoesNotExist):
-                return []
-        return []
+        # Giám đốc xem KPI mới tạo trước, trưởng phòng xem KPI mới cập nhật trước
+        ordering = '-created_at' if self.request.member.role == scopes.DIRECTOR else '-updated_at'
+        return tag_list_queryset().filter(period, removed=False).order_by(ordering)
 
 
-class GetAllTagOfMemberView(generics.ListAPIView):
+class GetAllTagOfMemberView(TagIncludeMixin, generics.ListAPIView):
     """
     API lấy danh sách các Tag của một nhân viên
     """
     serializer_class = serializer_api.GetTagOfMemberSerializer
     pagination_class = StandardResultsSetPagination
+    filter_backends = (scopes.ScopeFilterBackend,)
+    scope_roles = (scopes.DIRECTOR, scopes.MANAGER)
 
     def get_queryset(self):
         user_id = self.request.GET.get('user_id')
-        query = self.request.GET.get('query')
-        if self.request.user.is_authenticated:
-            if user_id:
-                if not can_be_integer(user_id):
-                    return []
-
-                try:
-                    profile = Profile.objects.get(user__id=user_id, removed=False)
-                    my_profile = Profile.objects.get(user__id=self.request.user.id, removed=False)
-                    if my_profile.get_role() == 'Director':
-                        member = DepartmentMember.objects.get(department_member=profile, removed=False)
-                        if not query:
-                            # lấy theo query=current
-                            return Tag.objects.filter(user=member,
-                                                      period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime,
-                                                      removed=False).order_by('-created_at')
-                        elif query == 'all':
-                            return Tag.objects.filter(user=member,
-                                                      removed=False).order_by('-created_at')
-                        elif query == 'current':
-                            # kpi chưa hết hạn
-                            return Tag.objects.filter(user=member,
-                                                      period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime,
-                                                      removed=False).order_by('-created_at')
-                        elif query == 'tmonth':
-                            # kpi được tạo trong tháng này, bắt đầu trong tháng này, kết thúc sau hôm nay
-                            start = arrow.now().to(settings.TIME_ZONE).floor('month').datetime
-                            end = arrow.now().to(settings.TIME_ZONE).ceil('month').datetime
-                            return Tag.objects.filter(user=member,
-                                                      period_start__range=(start, end),
-                                                      period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime,
-                                                      created_at__range=(start, end),
-                                                      removed=False).order_by('-created_at')
-                        elif query == 'outdated':
-                            return Tag.objects.filter(user=member,
-                                                      period_end__lt=arrow.now().to(settings.TIME_ZONE).datetime,
-                                                      removed=False).order_by('-created_at')
-                        else:
-                            return []
-
-                    elif my_profile.get_role() == 'Manager':
-                        member = DepartmentMember.objects.get(department_member=profile, removed=False)
-                        me = DepartmentMember.objects.get(department_member=my_profile, removed=False)
-                        d_id = me.department.id
-                        if not query:
-                            return Tag.objects.filter(user=member,
-                                                      user__department__id=d_id,
-                                                      period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime,
-                                                      removed=False).order_by('-created_at')
-                        elif query == 'all':
-                            return Tag.objects.filter(user=member,
-                                                      user__department__id=d_id,
-                                                      removed=False).order_by('-created_at')
-                        elif query == 'current':
-                            # kpi chưa hết hạn
-                            return Tag.objects.filter(user=member,
-                                                      user__department__id=d_id,
-                                                      period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime,
-                                                      removed=False).order_by('-created_at')
-                        elif query == 'tmonth':
-                            # kpi được tạo trong tháng này, bắt đầu trong tháng này, kết thúc sau hôm nay
-                            start = arrow.now().to(settings.TIME_ZONE).floor('month').datetime
-                            end = arrow.now().to(settings.TIME_ZONE).ceil('month').datetime
-                            return Tag.objects.filter(user=member,
-                                                      user__department__id=d_id,
-                                                      period_start__range=(start, end),
-                                                      period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime,
-                                                      created_at__range=(start, end),
-                                                      removed=False).order_by('-created_at')
-                        elif query == 'outdated':
-                            return Tag.objects.filter(user=member,
-                                                      user__department__id=d_id,
-                                                      period_end__lt=arrow.now().to(settings.TIME_ZONE).datetime,
-                                                      removed=False).order_by('-created_at')
-                    else:
-                        return []
+        period = tag_period_q(self.request.GET.get('query'))
+        if not self.request.user.is_authenticated or not user_id or period is None:
+            return []
 
-                except (Profile.DoesNotExist, DepartmentMember.DoesNotExist, Tag.DoesNotExist):
-                    return []
+        if not can_be_integer(user_id):
+            return []
 
-        return []
+        return tag_list_queryset().filter(period, user__department_member__user_id=user_id, user__removed=False,
+                                          user__department_member__removed=False,
+                                          removed=False).order_by('-created_at')
 
 
-class GetMyTagView(generics.ListAPIView):
+class GetMyTagView(TagIncludeMixin, generics.ListAPIView):
     """
     API lấy danh sách các Tag của tôi
     """
@@ -203,39 +94,11 @@ class GetMyTagView(generics.ListAPIView):
     pagination_class = StandardResultsSetPagination
 
     def get_queryset(self):
-        query = self.request.GET.get('query')
-        if self.request.user.is_authenticated:
-            user_id = self.request.user.id
+        period = tag_period_q(self.request.GET.get('query'))
+        if self.request.user.is_authenticated and period is not None:
             try:
-                profile = Profile.objects.get(user__id=user_id, removed=False)
-                member = DepartmentMember.objects.get(department_member=profile, removed=False)
-                if not query:
-                    return Tag.objects.filter(user=member,
-                                              period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime,
-                                              removed=False).order_by('-created_at')
-                elif query == 'all':
-                    return Tag.objects.filter(user=member,
-                                              removed=False).order_by('-created_at')
-                elif query == 'current':
-                    # kpi chưa hết hạn
-                    return Tag.objects.filter(user=member,
-                                              period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime,
-                                              removed=False).order_by('-created_at')
-                elif query == 'tmonth':
-                    # kpi được tạo trong tháng này, bắt đầu trong tháng này, kết thúc sau hôm nay
-                    start = arrow.now().to(settings.TIME_ZONE).floor('month').datetime
-                    end = arrow.now().to(settings.TIME_ZONE).ceil('month').datetime
-                    return Tag.objects.filter(user=member,
-                                              period_start__range=(start, end),
-                                              period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime,
-                                              created_at__range=(start, end),
-                                              removed=False).order_by('-created_at')
-                elif query == 'outdated':
-                    return Tag.objects.filter(user=member,
-                                              period_end__lt=arrow.now().to(settings.TIME_ZONE).datetime,
-                                              removed=False).order_by('-created_at')
-                else:
-                    return []
+                member = self.request.member.get_department_member()
+                return tag_list_queryset().filter(period, user=member, removed=False).order_by('-created_at')
 
             except (Profile.DoesNotExist, DepartmentMember.DoesNotExist, Tag.DoesNotExist):
                 return []
@@ -260,25 +123,11 @@ def get_one_tag_of_member_detail_api_view(request):
                 return Response({})
 
             try:
-                profile = Profile.objects.get(user__id=user_id, removed=False)
-                member = DepartmentMember.objects.get(department_member=profile, removed=False)
-                my_profile = Profile.objects.get(user__id=request.user.id, removed=False)
-
-                if my_profile.get_role() == 'Director':
-                    tag = Tag.objects.get(id=tag_id, user=member, removed=False)
-                    serializer = serializer_api.GetTagOfMemberSerializer(tag)
-                    return Response(serializer.data)
-                elif my_profile.get_role() == 'Manager':
-                    me = DepartmentMember.objects.get(department_member=my_profile, removed=False)
-
-                    if int(me.department.id) == int(member.department.id):
-                        tag = Tag.objects.get(id=tag_id, user=member, removed=False)
-                        serializer = serializer_api.GetTagOfMemberSerializer(tag)
-                        return Response(serializer.data)
-                    else:
-                        return Response({})
-                else:
-                    return Response({})
+                tag = tag_list_queryset().filter(scopes.scope_q(request.member)).get(
+                    id=tag_id, user__department_member__user_id=user_id, user__removed=False,
+                    user__department_member__removed=False, removed=False)
+                serializer = serializer_api.GetTagOfMemberSerializer(tag)
+                return Response(serializer.data)
 
             except (Profile.DoesNotExist, DepartmentMember.DoesNotExist, Tag.DoesNotExist):
                 return Response({})
@@ -294,16 +143,14 @@ def get_one_tag_detail_of_me_api_view(request):
     :return:
     """
     if request.user.is_authenticated:
-        user_id = request.user.id
         tag_id = request.GET.get('tag_id')
         if tag_id:
             if not can_be_integer(tag_id):
                 return Response({})
 
             try:
-                profile = Profile.objects.get(user__id=user_id, removed=False)
-                member = DepartmentMember.objects.get(department_member=profile, removed=False)
-                tag = Tag.objects.get(id=tag_id, user=member, removed=False)
+                member = request.member.get_department_member()
+                tag = tag_list_queryset().get(id=tag_id, user=member, removed=False)
                 serializer = serializer_api.GetTagOfMemberSerializer(tag)
                 return Response(serializer.data)
 
@@ -321,11 +168,9 @@ def get_tag_list_of_me_no_pagination_api_view(request):
     :return:
     """
     if request.user.is_authenticated:
-        user_id = request.user.id
         data = []
         try:
-            profile = Profile.objects.get(user__id=user_id, removed=False)
-            member = DepartmentMember.objects.get(department_member=profile, removed=False)
+            member = request.member.get_department_member()
             tag = Tag.objects.filter(user=member, removed=False)
             for item in tag:
                 data.append({
@@ -347,7 +192,6 @@ def add_new_tag_api_view(request):
     :param request: profile_id, tag_name, tag_description, period_start, period_end, quantity, weight
     :return: tạo mới một tag
     """
-    user_id = request.user.id
     profile_id = request.data.get('profile_id')
     tag_name = request.data.get('tag_name')
     tag_description = request.data.get('tag_description')
@@ -358,7 +202,7 @@ def add_new_tag_api_view(request):
 
     if request.user.is_authenticated:
         try:
-            my_profile = Profile.objects.get(user__id=user_id, removed=False)
+            my_profile = request.member.get_profile()
             if my_profile.get_role() != 'Director' and my_profile.get_role() != 'Manager':
                 return Response({
                     'ok': False,
@@ -442,9 +286,7 @@ def add_new_tag_api_view(request):
 
         if my_profile.get_role() == 'Director':
             try:
-                fp = Profile.objects.get(user__id=user_id, removed=False)
-                tp = Profile.objects.get(id=profile_id, removed=False)
-                dpm = DepartmentMember.objects.get(department_member=tp, removed=False)
+                dpm = get_member(department_member_id=profile_id)
 
                 tag = Tag(
                     user=dpm,
@@ -457,7 +299,7 @@ def add_new_tag_api_view(request):
                     finished=0,
                     progress=0,
                     state='PR',
-                    created_by=fp,
+                    created_by=my_profile,
                 )
                 tag.save()
                 return Response({
@@ -472,9 +314,8 @@ def add_new_tag_api_view(request):
 
         if my_profile.get_role() == 'Manager':
             try:
-                me = DepartmentMember.objects.get(department_member=my_profile, removed=False)
-                tp = Profile.objects.get(id=profile_id, removed=False)
-                dpm = DepartmentMember.objects.get(department_member=tp, removed=False)
+                me = request.member.get_department_member()
+                dpm = get_member(department_member_id=profile_id)
                 if int(me.department.id) != int(dpm.department.id):
                     return Response({
                         'ok': False,
@@ -566,11 +407,10 @@ def edit_tag_member_api_view(request):
 
         if tag_request == 'remove':
             try:
-                my_profile = Profile.objects.get(user__id=request.user.id, removed=False)
+                my_profile = request.member.get_profile()
 
                 if my_profile.get_role() == 'Director':
-                    tp = Profile.objects.get(id=profile_id, removed=False)
-                    dpm = DepartmentMember.objects.get(department_member=tp, removed=False)
+                    dpm = get_member(department_member_id=profile_id)
                     tag = Tag.objects.get(id=tag_id, user=dpm, removed=False)
 
                     tag.removed = True
@@ -583,10 +423,8 @@ def edit_tag_member_api_view(request):
                     })
 
                 elif my_profile.get_role() == 'Manager':
-                    me = DepartmentMember.objects.get(department_member=my_profile, removed=False)
-
-                    tp = Profile.objects.get(id=profile_id, removed=False)
-                    dpm = DepartmentMember.objects.get(department_member=tp, removed=False)
+                    me = request.member.get_department_member()
+                    dpm = get_member(department_member_id=profile_id)
 
                     if int(me.department.id) == int(dpm.department.id):
                         tag = Tag.objects.get(id=tag_id, user=dpm, removed=False)
@@ -675,10 +513,9 @@ def edit_tag_member_api_view(request):
                 })
 
             try:
-                fp = Profile.objects.get(user__id=request.user.id, removed=False)
-                tp = Profile.objects.get(id=profile_id, removed=False)
-                me = DepartmentMember.objects.get(department_member=fp, removed=False)
-                dpm = DepartmentMember.objects.get(department_member=tp, removed=False)
+                fp = request.member.get_profile()
+                me = request.member.get_department_member()
+                dpm = get_member(department_member_id=profile_id)
 
                 if fp.get_role() == 'Director':
                     tag = Tag.objects.get(id=tag_id, user=dpm, removed=False)
@@ -755,7 +592,6 @@ def edit_my_tag_api_view(request):
     :param request: profile_id, tag_id, finished, tag_state
     :return: tạo mới một tag
     """
-    user_id = request.user.id
     profile_id = request.data.get('profile_id')
     tag_id = request.data.get('tag_id')
     finished = request.data.get('finished')
@@ -815,9 +651,8 @@ def edit_my_tag_api_view(request):
                 })
 
             try:
-                tp = Profile.objects.get(user__id=user_id, id=profile_id, removed=False)
-                dpm = DepartmentMember.objects.get(department_member=tp, removed=False)
-                tag = Tag.objects.get(id=tag_id, user=dpm)
+                dpm = request.member.get_department_member()
+                tag = Tag.objects.get(id=tag_id, user=dpm, user__department_member_id=profile_id)
 
                 if tag.state == 'CO':
                     return Response({
@@ -856,12 +691,12 @@ def edit_my_tag_api_view(request):
 def my_tag_computation_api_view(request):
     """
     API cộng tất cả kết quả đạt được của Task rồi cập nhật cho Tag của tôi
-    :param request: profile_id, tag_id
+    :param request: profile_id, tag_id, background (true: chạy nền, trả về jobId để theo dõi bằng job/status/)
     :return: tạo mới một tag
     """
-    user_id = request.user.id
     profile_id = request.data.get('profile_id')
     tag_id = request.data.get('tag_id')
+    background = request.data.get('background') in (True, 'true', '1')
 
     if request.user.is_authenticated:
         if profile_id:
@@ -884,25 +719,16 @@ def my_tag_computation_api_view(request):
                 })
 
             try:
-                tp = Profile.objects.get(user__id=user_id, id=profile_id, removed=False)
-                dpm = DepartmentMember.objects.get(department_member=tp, removed=False)
-                tag = Tag.objects.get(id=tag_id, user=dpm, removed=False)
-                task = Task.objects.filter(tag=tag, removed=False)
-
-                count = 0
-
-                for item in task:
-                    if item.state == 'CO':
-                        count += int(item.result_value)
-
-                tag.finished = count
-
-                percent = float(count) / float(tag.quantity) * 100.0
-                percent = round(percent, 2)
-
-                tag.progress = percent
-
-                tag.save()
+                dpm = request.member.get_department_member()
+                tag = Tag.objects.get(id=tag_id, user=dpm, user__department_member_id=profile_id, removed=False)
+                if background:
+                    job = jobs.enqueue('reconcile_tag', {'tag_id': tag.id}, created_by=request.member.profile)
+                    return Response({
+                        'ok': True,
+                        'msg': 'Đã thêm vào hàng đợi đồng bộ dữ liệu!',
+                        'jobId': job.id,
+                    })
+                reconcile_tag(tag)
                 return Response({
                     'ok': True,
                     'msg': 'Đồng bộ dữ liệu thành công!',
@@ -930,69 +756,19 @@ def get_my_tag_statistics_api_view(request):
     :return:
     """
     if request.user.is_authenticated:
-        user_id = request.user.id
         query = request.GET.get('query')
         try:
-            profile = Profile.objects.get(user__id=user_id, removed=False)
-            member = DepartmentMember.objects.get(department_member=profile, removed=False)
+            member = request.member.get_department_member()
             start = arrow.now().to(settings.TIME_ZONE).floor('month').datetime
-            end = arrow.now().to(settings.TIME_ZONE).ceil('month').datetime
-            wt = WorkTime.objects.filter(user=member, removed=False,
-                                         date__range=(start,
-                                                      end)).aggregate(totalTime=Sum('time_total'))['totalTime']
-            tag = None
-            if not query:
-                tag = Tag.objects.filter(user=member,
-                                         removed=False,
-                                         period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime)
-            elif query == 'all':
-                tag = Tag.objects.filter(user=member, removed=False)
-            elif query == 'current':
-                tag = Tag.objects.filter(user=member,
-                                         removed=False,
-                                         period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime)
-            elif query == 'tmonth':
-                # kpi được tạo trong tháng này, bắt đầu trong tháng này, kết thúc sau hôm nay
-                start = arrow.now().to(settings.TIME_ZONE).floor('month').datetime
-                end = arrow.now().to(settings.TIME_ZONE).ceil('month').datetime
-                tag = Tag.objects.filter(user=member,
-                                         removed=False,
-                                         period_start__range=(start, end),
-                                         period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime,
-                                         created_at__range=(start, end))
-            elif query == 'outdated':
-                tag = Tag.objects.filter(user=member,
-                                         removed=False,
-                                         period_end__lt=arrow.now().to(settings.TIME_ZONE).datetime)
-            if tag:
-                total = 0
-                count_finished = 0
-                count_progress = 0
-                count_un_finished = 0
-                for item in tag:
-                    total += 1
-                    if item.state == 'CO':
-                        count_finished += 1
-                    elif item.state == 'PR':
-                        count_progress += 1
-                    elif item.state == 'NF':
-                        count_un_finished += 1
-
-                return Response({
-                    'total_time': wt,
-                    'total_tag': total,
-                    'count_finished': count_finished,
-                    'count_progress': count_progress,
-                    'count_un_finished': count_un_finished,
-                })
+            period = tag_period_q(query)
+            if period is None:
+                tag = Tag.objects.none()
             else:
-                return Response({
-                    'total_time': wt,
-                    'total_tag': 0,
-                    'count_finished': 0,
-                    'count_progress': 0,
-                    'count_un_finished': 0,
-                })
+                tag = Tag.objects.filter(period, user=member, removed=False)
+
+            data = {'total_time': get_member_month_summary(member, start)['total_time']}
+            data.update(count_tags_by_state(tag))
+            return Response(data)
 
         except (Profile.DoesNotExist, DepartmentMember.DoesNotExist, Tag.DoesNotExist):
             return Response({})
@@ -1015,70 +791,12 @@ def get_member_tag_statistics_api_view(request):
         if not can_be_integer(user_id):
             return Response({})
         try:
-            my_profile = Profile.objects.get(user__id=request.user.id, removed=False)
-            profile = Profile.objects.get(user__id=user_id, removed=False)
-            if my_profile.get_role() == 'Director':
-                member = DepartmentMember.objects.get(department_member=profile, removed=False)
-                start = arrow.now().to(settings.TIME_ZONE).floor('month').datetime
-                end = arrow.now().to(settings.TIME_ZONE).ceil('month').datetime
-                wt = WorkTime.objects.filter(user=member, removed=False,
-                                             date__range=(start,
-                                                          end)).aggregate(totalTime=Sum('time_total'))['totalTime']
-                tag = Tag.objects.filter(user=member, removed=False, created_at__range=(start, end))
-                total = 0
-                count_finished = 0
-                count_progress = 0
-                count_un_finished = 0
-                for item in tag:
-                    total += 1
-                    if item.state == 'CO':
-                        count_finished += 1
-                    elif item.state == 'PR':
-                        count_progress += 1
-                    elif item.state == 'NF':
-                        count_un_finished += 1
-                return Response({
-                  'total_time': wt,
-                  'total_tag': total,
-                  'count_finished': count_finished,
-                  'count_progress': count_progress,
-                  'count_un_finished': count_un_finished,
-                })
-            elif my_profile.get_role() == 'Manager':
-                me = DepartmentMember.objects.get(department_member=my_profile, removed=False)
-                dpm = DepartmentMember.objects.get(department_member=profile, removed=False)
-                if int(me.department.id) == int(dpm.department.id):
-                    member = DepartmentMember.objects.get(department_member=profile, removed=False)
-                    start = arrow.now().to(settings.TIME_ZONE).floor('month').datetime
-                    end = arrow.now().to(settings.TIME_ZONE).ceil('month').datetime
-                    wt = WorkTime.objects.filter(user=member, removed=False,
-                                                 date__range=(start,
-                                                              end)).aggregate(totalTime=Sum('time_total'))['totalTime']
-                    tag = Tag.objects.filter(user=member, removed=False, created_at__range=(start, end))
-                    total = 0
-                    count_finished = 0
-                    count_progress = 0
-                    count_un_finished = 0
-                    for item in tag:
-                        total += 1
-                        if item.state == 'CO':
-                            count_finished += 1
-                        elif item.state == 'PR':
-                            count_progress += 1
-                        elif item.state == 'NF':
-                            count_un_finished += 1
-                    return Response({
-                        'total_time': wt,
-                        'total_tag': total,
-                        'count_finished': count_finished,
-                        'count_progress': count_progress,
-                        'count_un_finished': count_un_finished,
-                    })
-                else:
-                    return Response({})
-            else:
+            member = get_member(department_member__user_id=user_id)
+            if not scopes.in_scope(request.member, member):
                 return Response({})
 
+            return Response(get_member_month_summary(member, arrow.now().datetime))
+
         except (Profile.DoesNotExist, DepartmentMember.DoesNotExist, Tag.DoesNotExist):
             return Response({})
 
@@ -1093,101 +811,22 @@ def get_tag_statistics_api_view(request):
     :return:
     """
     if request.user.is_authenticated:
-        query = request.GET.get('query')
+        period = tag_period_q(request.GET.get('query'))
+        if period is None or request.member.role not in (scopes.DIRECTOR, scopes.MANAGER):
+            return Response({})
         try:
-            my_profile = Profile.objects.get(user__id=request.user.id, removed=False)
-            if my_profile.get_role() == 'Director':
-                tag = None
-                if not query:
-                    tag = Tag.objects.filter(removed=False,
-                                             period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime)
-                elif query == 'all':
-                    tag = Tag.objects.filter(removed=False)
-                elif query == 'current':
-                    tag = Tag.objects.filter(removed=False,
-                                             period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime)
-                elif query == 'tmonth':
-                    # kpi được tạo trong tháng này, bắt đầu trong tháng này, kết thúc sau hôm nay
-                    start = arrow.now().to(settings.TIME_ZONE).floor('month').datetime
-                    end = arrow.now().to(settings.TIME_ZONE).ceil('month').datetime
-                    tag = Tag.objects.filter(removed=False,
-                                             period_start__range=(start, end),
-                                             period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime,
-                                             created_at__range=(start, end))
-                elif query == 'outdated':
-                    tag = Tag.objects.filter(removed=False,
-                                             period_end__lt=arrow.now().to(settings.TIME_ZONE).datetime)
-                if tag:
-                    total = 0
-                    count_finished = 0
-                    count_progress = 0
-                    count_un_finished = 0
-                    for item in tag:
-                        total += 1
-                        if item.state == 'CO':
-                            count_finished += 1
-                        elif item.state == 'PR':
-                            count_progress += 1
-                        elif item.state == 'NF':
-                            count_un_finished += 1
-                    return Response({
-                      'total': total,
-                      'count_finished': count_finished,
-                      'count_progress': count_progress,
-                      'count_un_finished': count_un_finished,
-                    })
-                else:
-                    return Response({})
-            elif my_profile.get_role() == 'Manager':
-                me = DepartmentMember.objects.get(department_member=my_profile, removed=False)
-                tag = None
-                if not query:
-                    tag = Tag.objects.filter(user__department__id=me.department.id,
-                                             removed=False,
-                                             period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime)
-                elif query == 'all':
-                    tag = Tag.objects.filter(user__department__id=me.department.id, removed=False)
-                elif query == 'current':
-                    tag = Tag.objects.filter(user__department__id=me.department.id,
-                                             removed=False,
-                                             period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime)
-                elif query == 'tmonth':
-                    # kpi được tạo trong tháng này, bắt đầu trong tháng này, kết thúc sau hôm nay
-                    start = arrow.now().to(settings.TIME_ZONE).floor('month').datetime
-                    end = arrow.now().to(settings.TIME_ZONE).ceil('month').datetime
-                    tag = Tag.objects.filter(user__department__id=me.department.id,
-                                             removed=False,
-                                             period_start__range=(start, end),
-                                             period_end__gt=arrow.now().to(settings.TIME_ZONE).datetime,
-                                             created_at__range=(start, end))
-                elif query == 'outdated':
-                    tag = Tag.objects.filter(user__department__id=me.department.id,
-                                             removed=False,
-                                             period_end__lt=arrow.now().to(settings.TIME_ZONE).datetime)
-                if tag:
-                    total = 0
-                    count_finished = 0
-                    count_progress = 0
-                    count_un_finished = 0
-                    for item in tag:
-                        total += 1
-                        if item.state == 'CO':
-                            count_finished += 1
-                        elif item.state == 'PR':
-                            count_progress += 1
-                        elif item.state == 'NF':
-                            count_un_finished += 1
-                    return Response({
-                        'total': total,
-                        'count_finished': count_finished,
-                        'count_progress': count_progress,
-                        'count_un_finished': count_un_finished,
-                    })
-                else:
-                    return Response({})
-            else:
+            tag = Tag.objects.filter(scopes.scope_q(request.member), period, removed=False)
+            data = count_tags_by_state(tag)
+            if not data['total_tag']:
                 return Response({})
 
+            return Response({
+                'total': data['total_tag'],
+                'count_finished': data['count_finished'],
+                'count_progress': data['count_progress'],
+                'count_un_finished': data['count_un_finished'],
+            })
+
         except (Profile.DoesNotExist, DepartmentMember.DoesNotExist, Tag.DoesNotExist):
             return Response({})
 
@@ -1,30 +1,26 @@
 # import markdown2
+import json
+
 import arrow
 from django.conf import settings
+from django.db import transaction
 
 from rest_framework import generics
 from rest_framework.decorators import api_view
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
+from kpi_manager.content_processors import render_description
 from kpi_manager.models import Profile, Tag, Task, DepartmentMember, Comment
 from utils.common import can_be_integer
 from web_api.utils import build_absolute_url
+from .. import reports, scopes
+from ..members import get_member
+from ..querysets import comment_list_queryset
+from ..pagination import StandardResultsSetPagination
 from .. import serializers as serializer_api
 
-
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 1000
-
-    def get_paginated_response(self, data):
-        return Response({
-            'count': self.page.paginator.count,
-            'page_size': self.page_size,
-            'current': self.page.number,
-            'results': data
-        })
+# Số task tối đa của một lần tạo nhiều task
+MAX_BATCH_TASKS = 100
 
 
 class GetTaskListView(generics.ListAPIView):
@@ -33,6 +29,8 @@ class GetTaskListView(generics.ListAPIView):
     """
     serializer_class = serializer_api.GetTaskOfMemberDependOnTagSerializer
     pagination_class = StandardResultsSetPagination
+    filter_backends = (scopes.ScopeFilterBackend,)
+    scope_include_self = True
 
     def get_queryset(self):
         user_id = self.request.GET.get('user_id')
@@ -46,8 +44,7 @@ class GetTaskListView(generics.ListAPIView):
                         return []
 
                     try:
-                        profile = Profile.objects.get(user__id=user_id, removed=False)
-                        member = DepartmentMember.objects.get(department_member=profile, removed=False)
+                        member = get_member(department_member__user_id=user_id)
                         tag = Tag.objects.get(id=tag_id, user=member, removed=False)
                         return Task.objects.filter(user=member, tag=tag, removed=False).order_by('-created_at')
 
@@ -65,14 +62,12 @@ class GetMyTaskListView(generics.ListAPIView):
 
     def get_queryset(self):
         if self.request.user.is_authenticated:
-            user_id = self.request.user.id
             tag_id = self.request.GET.get('tag_id')
             if tag_id:
                 if not can_be_integer(tag_id):
                     return []
                 try:
-                    profile = Profile.objects.get(user__id=user_id, removed=False)
-                    member = DepartmentMember.objects.get(department_member=profile, removed=False)
+                    member = self.request.member.get_department_member()
                     tag = Tag.objects.get(id=tag_id, user=member, removed=False)
                     return Task.objects.filter(user=member, tag=tag, removed=False).order_by('-created_at')
 
@@ -87,6 +82,9 @@ class GetCommentOfTaskView(generics.ListAPIView):
     """
     serializer_class = serializer_api.GetCommentOfTaskSerializer
     pagination_class = StandardResultsSetPagination
+    filter_backends = (scopes.ScopeFilterBackend,)
+    scope_path = 'task__user'
+    scope_include_self = True
 
     def get_queryset(self):
         task_id = self.request.GET.get('task_id')
@@ -97,7 +95,7 @@ class GetCommentOfTaskView(generics.ListAPIView):
 
                 try:
                     task = Task.objects.get(id=task_id, removed=False)
-                    return Comment.objects.filter(task=task, removed=False).order_by('-created_at')
+                    return comment_list_queryset().filter(task=task, removed=False).order_by('-created_at')
 
                 except Task.DoesNotExist:
                     return []
@@ -121,7 +119,7 @@ class GetCommentOfMyTaskView(generics.ListAPIView):
 
                 try:
                     task = Task.objects.get(id=task_id, user__department_member__user_id=user_id, removed=False)
-                    return Comment.objects.filter(task=task, removed=False).order_by('-created_at')
+                    return comment_list_queryset().filter(task=task, removed=False).order_by('-created_at')
 
                 except Task.DoesNotExist:
                     return []
@@ -145,8 +143,10 @@ def get_one_task_of_member_detail_api_view(request):
                 return Response({})
 
             try:
-                profile = Profile.objects.get(user__id=user_id, removed=False)
-                member = DepartmentMember.objects.get(department_member=profile, removed=False)
+                member = get_member(department_member__user_id=user_id)
+                if not scopes.in_scope(request.member, member, include_self=True):
+                    return Response({})
+
                 task = Task.objects.get(id=task_id, user=member, removed=False)
                 # taskDesc = markdown2.markdown(task.task_description,
                 #                               extras=["tables",
@@ -163,6 +163,8 @@ def get_one_task_of_member_detail_api_view(request):
                     'taskId': task.pk,
                     'taskName': task.task_name,
                     'taskDescription': task.task_description,
+                    'taskDescriptionHtml': serializer_api.description_html(task.task_description,
+                                                                           task.task_description_html),
                     # 'taskDescEdit': task.task_description,
                     'periodStart': task.period_start,
                     'periodEnd': task.period_end,
@@ -191,15 +193,13 @@ def get_one_task_detail_of_me_api_view(request):
     :return:
     """
     if request.user.is_authenticated:
-        user_id = request.user.id
         task_id = request.GET.get('task_id')
         if task_id:
             if not can_be_integer(task_id):
                 return Response({})
 
             try:
-                profile = Profile.objects.get(user__id=user_id, removed=False)
-                member = DepartmentMember.objects.get(department_member=profile, removed=False)
+                member = request.member.get_department_member()
                 task = Task.objects.get(id=task_id, user=member, removed=False)
                 # taskDesc = markdown2.markdown(task.task_description,
                 #                               extras=["tables",
@@ -216,6 +216,8 @@ def get_one_task_detail_of_me_api_view(request):
                     'taskId': task.pk,
                     'taskName': task.task_name,
                     'taskDescription': task.task_description,
+                    'taskDescriptionHtml': serializer_api.description_html(task.task_description,
+                                                                           task.task_description_html),
                     # 'taskDescEdit': task.task_description,
                     'periodStart': task.period_start,
                     'periodEnd': task.period_end,
@@ -236,6 +238,87 @@ def get_one_task_detail_of_me_api_view(request):
         return Response({})
 
 
+def clean_task_data(data):
+    """
+    Kiểm tra dữ liệu của một task mới (dùng chung cho API tạo một task và tạo nhiều task)
+    :param data: dict chứa task_name, task_description, period_start, period_end, unit_of_measure, target_value, weight
+    :return: (dữ liệu đã chuẩn hóa, None) hoặc (None, thông báo lỗi)
+    """
+    task_name = data.get('task_name')
+    task_description = data.get('task_description')
+    period_start = data.get('period_start')
+    period_end = data.get('period_end')
+    unit_of_measure = data.get('unit_of_measure')
+    target_value = data.get('target_value')
+    weight = data.get('weight')
+
+    if not task_name:
+        return None, 'Tiêu đề không được để trống!'
+
+    if not task_description:
+        task_description = None
+
+    if not target_value:
+        return None, 'Chỉ tiêu không được để trống!'
+
+    if not unit_of_measure:
+        unit_of_measure = None
+
+    if not can_be_integer(target_value):
+        return None, 'Chỉ tiêu phải nhập số!'
+
+    if not weight:
+        weight = 1
+
+    if not can_be_integer(weight):
+        return None, 'Trọng số phải nhập số!'
+
+    if int(weight) < 1 or int(weight) > 10:
+        return None, 'Trọng số phải có giá trị từ 1 đến 10!'
+
+    try:
+        if period_start:
+            period_start = arrow.get(period_start).to(settings.TIME_ZONE).datetime
+
+        if period_end:
+            period_end = arrow.get(period_end).to(settings.TIME_ZONE).datetime
+    except (arrow.parser.ParserError, TypeError, ValueError):
+        return None, 'Thời gian không hợp lệ!'
+
+    if period_start and period_end and period_end < period_start:
+        return None, 'Thời gian kết thúc không được trước thời gian bắt đầu!'
+
+    if period_start and not period_end:
+        return None, 'Thời gian kết thúc không được để trống!'
+
+    if not period_start and period_end:
+        return None, 'Thời gian bắt đầu không được để trống!'
+
+    return {
+        'task_name': task_name,
+        'task_description': task_description,
+        'period_start': period_start or None,
+        'period_end': period_end or None,
+        'unit_of_measure': unit_of_measure,
+        'target_value': int(target_value),
+        'weight': int(weight),
+    }, None
+
+
+def get_tag_for_new_task(dpm, tag_id):
+    """
+    KPI của tôi để thêm task
+    :return: (Tag, None) hoặc (None, thông báo lỗi)
+    """
+    t = Tag.objects.get(id=tag_id)
+    if dpm.id != t.user_id:
+        return None, 'Không tồn tại KPI này!'
+
+    if t.state == 'CO':
+        return None, 'KPI này đã hoàn thành nên không thể tạo Task!'
+    return t, None
+
+
 @api_view(['POST'])
 def add_new_task_api_view(request):
     """
@@ -243,15 +326,7 @@ def add_new_task_api_view(request):
     :param request:
     :return:
     """
-    user_id = request.user.id
     tag_id = request.data.get('tag_id')
-    task_name = request.data.get('task_name')
-    task_description = request.data.get('task_description')
-    period_start = request.data.get('period_start')
-    period_end = request.data.get('period_end')
-    unit_of_measure = request.data.get('unit_of_measure')
-    target_value = request.data.get('target_value')
-    weight = request.data.get('weight')
 
     if request.user.is_authenticated:
         if not tag_id:
@@ -266,108 +341,116 @@ def add_new_task_api_view(request):
                 'msg': 'Không tìm thấy KPI bạn lựa chọn!',
             })
 
-        if not task_name:
+        data, msg = clean_task_data(request.data)
+        if msg:
             return Response({
                 'ok': False,
-                'msg': 'Tiêu đề không được để trống!',
+                'msg': msg,
             })
 
-        if not task_description:
-            task_description = None
+        try:
+            dpm = request.member.get_department_member()
+            t, msg = get_tag_for_new_task(dpm, tag_id)
+            if msg:
+                return Response({
+                    'ok': False,
+                    'msg': msg,
+                })
 
-        if not target_value:
+            task = Task(user=dpm, tag=t, progress=0, state='PR', **data)
+            task.save()
             return Response({
-                'ok': False,
-                'msg': 'Chỉ tiêu không được để trống!',
+                'ok': True,
+                'msg': 'Tạo Task thành công!',
             })
-
-        if not unit_of_measure:
-            unit_of_measure = None
-
-        if not can_be_integer(target_value):
+        except (Profile.DoesNotExist, DepartmentMember.DoesNotExist, Tag.DoesNotExist):
             return Response({
                 'ok': False,
-                'msg': 'Chỉ tiêu phải nhập số!',
+                'msg': 'Không tồn tại nhân viên hoặc KPI!',
             })
+    return Response({
+        'ok': False,
+        'msg': 'Bạn chưa đăng nhập!',
+    })
 
-        if not weight:
-            weight = 1
 
-        if not can_be_integer(weight):
+@api_view(['POST'])
+def add_new_task_batch_api_view(request):
+    """
+    API tạo nhiều task mới cho một KPI trong một request.
+    Tất cả task được kiểm tra như API tạo một task; nếu có task không hợp lệ thì không tạo task nào.
+    :param request: tag_id, tasks (danh sách, hoặc chuỗi JSON nếu gửi dạng form)
+    :return: kết quả của từng task theo thứ tự gửi lên
+    """
+    tag_id = request.data.get('tag_id')
+    tasks = request.data.get('tasks')
+
+    if request.user.is_authenticated:
+        if not tag_id:
             return Response({
                 'ok': False,
-                'msg': 'Trọng số phải nhập số!',
+                'msg': 'Không tồn tại KPI!',
             })
 
-        if int(weight) < 1 or int(weight) > 10:
+        if not can_be_integer(tag_id):
             return Response({
                 'ok': False,
-                'msg': 'Trọng số phải có giá trị từ 1 đến 10!',
+                'msg': 'Không tìm thấy KPI bạn lựa chọn!',
             })
 
-        if period_start:
-            period_start = arrow.get(period_start).to(settings.TIME_ZONE).datetime
-
-        if period_end:
-            period_end = arrow.get(period_end).to(settings.TIME_ZONE).datetime
+        if isinstance(tasks, str):
+            try:
+                tasks = json.loads(tasks)
+            except ValueError:
+                tasks = None
 
-        if period_start and period_end and period_end < period_start:
+        if not tasks or not isinstance(tasks, list) or not all(isinstance(item, dict) for item in tasks):
             return Response({
                 'ok': False,
-                'msg': 'Thời gian kết thúc không được trước thời gian bắt đầu!',
+                'msg': 'Danh sách task không hợp lệ!',
             })
 
-        if period_start and not period_end:
+        if len(tasks) > MAX_BATCH_TASKS:
             return Response({
                 'ok': False,
-                'msg': 'Thời gian kết thúc không được để trống!',
+                'msg': 'Chỉ được tạo tối đa %s task mỗi lần!' % MAX_BATCH_TASKS,
             })
 
-        if not period_start and period_end:
+        cleaned, results = [], []
+        for item in tasks:
+            data, msg = clean_task_data(item)
+            cleaned.append(data)
+            results.append({'ok': not msg, 'msg': msg or 'Hợp lệ!'})
+
+        if not all(result['ok'] for result in results):
             return Response({
                 'ok': False,
-                'msg': 'Thời gian bắt đầu không được để trống!',
+                'msg': 'Có task không hợp lệ, chưa tạo task nào!',
+                'results': results,
             })
 
-        if not period_start:
-            period_start = None
-
-        if not period_end:
-            period_end = None
-
         try:
-            p = Profile.objects.get(user__id=user_id, removed=False)
-            dpm = DepartmentMember.objects.get(department_member=p, removed=False)
-            t = Tag.objects.get(id=tag_id)
-            if dpm.department_member.user.id != t.user.department_member.user.id:
+            dpm = request.member.get_department_member()
+            t, msg = get_tag_for_new_task(dpm, tag_id)
+            if msg:
                 return Response({
                     'ok': False,
-                    'msg': 'Không tồn tại KPI này!',
+                    'msg': msg,
                 })
 
-            if t.state == 'CO':
-                return Response({
-                    'ok': False,
-                    'msg': 'KPI này đã hoàn thành nên không thể tạo Task!',
-                })
-
-            task = Task(
-                user=dpm,
-                task_name=task_name,
-                task_description=task_description,
-                period_start=period_start,
-                period_end=period_end,
-                unit_of_measure=unit_of_measure,
-                target_value=target_value,
-                progress=0,
-                weight=weight,
-                state='PR',
-                tag=t,
-            )
-            task.save()
+            # bulk_create không gửi signal: tự render mô tả và tự bỏ trang in đã lưu của nhân viên.
+            # Tag.finished không cần cộng vì chỉ Task hoàn thành (CO) mới được tính, Task mới ở trạng thái PR
+            with transaction.atomic():
+                Task.objects.bulk_create([render_description(Task(user=dpm, tag=t, progress=0, state='PR', **data))
+                                          for data in cleaned], batch_size=MAX_BATCH_TASKS)
+            reports.invalidate_member_reports(dpm.id)
+
+            for result in results:
+                result['msg'] = 'Tạo Task thành công!'
             return Response({
                 'ok': True,
-                'msg': 'Tạo Task thành công!',
+                'msg': 'Tạo %s Task thành công!' % len(cleaned),
+                'results': results,
             })
         except (Profile.DoesNotExist, DepartmentMember.DoesNotExist, Tag.DoesNotExist):
             return Response({
@@ -387,7 +470,6 @@ def edit_my_task_api_view(request):
     :param request:
     :return:
     """
-    user_id = request.user.id
     tag_id = request.data.get('tag_id')
     task_id = request.data.get('task_id')
     edit_task = request.data.get('edit_task')
@@ -433,25 +515,13 @@ def edit_my_task_api_view(request):
 
         if edit_task == 'remove':
             try:
-                p = Profile.objects.get(user__id=user_id, removed=False)
-                dpm = DepartmentMember.objects.get(department_member=p, removed=False)
-                task = Task.objects.get(id=task_id, user=dpm, removed=False)
-
-                task.removed = True
-
-                task.save()
-
-                if task.state == 'CO':
-                    tag = Tag.objects.get(id=tag_id, user=dpm, removed=False)
-                    task_list = Task.objects.filter(tag=tag, removed=False)
-                    count = 0
-
-                    for item in task_list:
-                        if item.state == 'CO':
-                            count += int(item.result_value)
-
-                    tag.finished = count
-                    tag.save()
+                dpm = request.member.get_department_member()
+                # Tag.finished/progress được cộng dồn trong web_api.signals, khóa Task tới khi lưu xong
+                # để hai request cùng lúc không cộng hai lần
+                with transaction.atomic():
+                    task = Task.objects.select_for_update().get(id=task_id, user=dpm, removed=False)
+                    task.removed = True
+                    task.save()
 
                 return Response({
                     'ok': True,
@@ -475,8 +545,7 @@ def edit_my_task_api_view(request):
                 task_description = None
 
             try:
-                p = Profile.objects.get(user__id=user_id, removed=False)
-                dpm = DepartmentMember.objects.get(department_member=p, removed=False)
+                dpm = request.member.get_department_member()
                 task = Task.objects.get(id=task_id, user=dpm, removed=False)
 
                 task.task_name = task_name
@@ -529,40 +598,28 @@ def edit_my_task_api_view(request):
                 task_state = 'CO'
 
             try:
-                p = Profile.objects.get(user__id=user_id, removed=False)
-                dpm = DepartmentMember.objects.get(department_member=p, removed=False)
-                task = Task.objects.get(id=task_id, user=dpm, removed=False)
-
-                if task.is_finished:
-                    return Response({
-                        'ok': False,
-                        'msg': 'Task này đã hoàn thành nên không thể chỉnh sửa!',
-                    })
-
-                task.result_value = result_value
-                task.state = task_state
-
-                percent = float(result_value) / float(task.target_value) * 100.0
-                percent = round(percent, 2)
+                dpm = request.member.get_department_member()
+                with transaction.atomic():
+                    task = Task.objects.select_for_update().get(id=task_id, user=dpm, removed=False)
 
-                task.progress = percent
+                    if task.is_finished:
+                        return Response({
+                            'ok': False,
+                            'msg': 'Task này đã hoàn thành nên không thể chỉnh sửa!',
+                        })
 
-                if task_state == 'CO':
-                    task.is_finished = True
+                    task.result_value = result_value
+                    task.state = task_state
 
-                task.save()
+                    percent = float(result_value) / float(task.target_value) * 100.0
+                    percent = round(percent, 2)
 
-                if task.state == 'CO':
-                    tag = Tag.objects.get(id=tag_id, user=dpm, removed=False)
-                    task_list = Task.objects.filter(tag=tag, removed=False)
-                    count = 0
+                    task.progress = percent
 
-                    for item in task_list:
-                        if item.state == 'CO':
-                            count += int(item.result_value)
+                    if task_state == 'CO':
+                        task.is_finished = True
 
-                    tag.finished = count
-                    tag.save()
+                    task.save()
 
                 return Response({
                     'ok': True,
@@ -657,44 +714,32 @@ def edit_my_task_api_view(request):
                 period_end = None
 
             try:
-                p = Profile.objects.get(user__id=user_id, removed=False)
-                dpm = DepartmentMember.objects.get(department_member=p, removed=False)
-                task = Task.objects.get(id=task_id, user=dpm, removed=False)
-
-                if task.is_finished:
-                    return Response({
-                        'ok': False,
-                        'msg': 'Task này đã hoàn thành nên không thể chỉnh sửa!',
-                    })
+                dpm = request.member.get_department_member()
+                with transaction.atomic():
+                    task = Task.objects.select_for_update().get(id=task_id, user=dpm, removed=False)
 
-                task.period_start = period_start
-                task.period_end = period_end
-                task.unit_of_measure = unit_of_measure
-                task.result_value = result_value
+                    if task.is_finished:
+                        return Response({
+                            'ok': False,
+                            'msg': 'Task này đã hoàn thành nên không thể chỉnh sửa!',
+                        })
 
-                percent = float(result_value) / float(task.target_value) * 100.0
-                percent = round(percent, 2)
+                    task.period_start = period_start
+                    task.period_end = period_end
+                    task.unit_of_measure = unit_of_measure
+                    task.result_value = result_value
 
-                task.progress = percent
-                task.weight = weight
-                task.state = task_state
-
-                if task_state == 'CO':
-                    task.is_finished = True
-
-                task.save()
+                    percent = float(result_value) / float(task.target_value) * 100.0
+                    percent = round(percent, 2)
 
-                if task.state == 'CO':
-                    tag = Tag.objects.get(id=tag_id, user=dpm, removed=False)
-                    task_list = Task.objects.filter(tag=tag, removed=False)
-                    count = 0
+                    task.progress = percent
+                    task.weight = weight
+                    task.state = task_state
 
-                    for item in task_list:
-                        if item.state == 'CO':
-                            count += int(item.result_value)
+                    if task_state == 'CO':
+                        task.is_finished = True
 
-                    tag.finished = count
-                    tag.save()
+                    task.save()
 
                 return Response({
                     'ok': True,
@@ -722,7 +767,6 @@ def add_comment_for_my_task_api_view(request):
     :param request:
     :return:
     """
-    user_id = request.user.id
     task_id = request.data.get('task_id')
     cmt_content = request.data.get('cmt_content')
 
@@ -746,13 +790,12 @@ def add_comment_for_my_task_api_view(request):
             })
 
         try:
-            p = Profile.objects.get(user__id=user_id, removed=False)
-            dpm = DepartmentMember.objects.get(department_member=p, removed=False)
+            dpm = request.member.get_department_member()
             task = Task.objects.get(id=task_id, user=dpm, removed=False)
 
             comment = Comment(
                 task=task,
-                user=p,
+                user=dpm.department_member,
                 content=cmt_content
             )
             comment.save()
@@ -805,9 +848,8 @@ def add_comment_for_member_task_api_view(request):
             })
 
         try:
-            my_profile = Profile.objects.get(user__id=request.user.id, removed=False)
-            p = Profile.objects.get(user__id=user_id, removed=False)
-            dpm = DepartmentMember.objects.get(department_member=p, removed=False)
+            my_profile = request.member.get_profile()
+            dpm = get_member(department_member__user_id=user_id)
             task = Task.objects.get(id=task_id, user=dpm, removed=False)
 
             if my_profile.get_role() == 'Director' or my_profile.get_role() == 'Manager':
@@ -878,7 +920,7 @@ def edit_comment_for_my_task_api_view(request):
 
         if cmt_request == 'remove':
             try:
-                comment = Comment.objects.get(id=comment_id, user=request.user.profile, removed=False)
+                comment = Comment.objects.get(id=comment_id, user=request.member.profile, removed=False)
                 comment.removed = True
                 comment.save()
 
@@ -900,7 +942,7 @@ def edit_comment_for_my_task_api_view(request):
                 })
 
             try:
-                comment = Comment.objects.get(id=comment_id, user=request.user.profile, removed=False)
+                comment = Comment.objects.get(id=comment_id, user=request.member.profile, removed=False)
                 comment.content = cmt_content
 
                 comment.save()
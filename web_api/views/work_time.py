@@ -1,31 +1,22 @@
+import csv
+import io
+
 import arrow
 from django.conf import settings
-from datetime import datetime, date
 # from django.db import models
 from django.db.models import Sum
 
 from rest_framework import generics
 from rest_framework.decorators import api_view
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
 from kpi_manager.models import Profile, DepartmentMember, WorkTime
 from utils.common import can_be_integer
+from .. import scopes
+from ..members import get_member
+from ..pagination import StandardResultsSetPagination
 from .. import serializers as serializer_api
-
-
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 1000
-
-    def get_paginated_response(self, data):
-        return Response({
-            'count': self.page.paginator.count,
-            'page_size': self.page_size,
-            'current': self.page.number,
-            'results': data
-        })
+from ..work_times import compute_time_total, WorkTimeImport
 
 
 class GetWordTimeListView(generics.ListAPIView):
@@ -64,8 +55,7 @@ class GetWordTimeListView(generics.ListAPIView):
                         end = arrow.now().\
                             replace(month=int(month_request), year=int(year_request)).\
                             to(settings.TIME_ZONE).ceil('month').datetime
-                        profile = Profile.objects.get(user__id=user_id, removed=False)
-                        member = DepartmentMember.objects.get(department_member=profile, removed=False)
+                        member = self.request.member.get_department_member()
                         return WorkTime.objects.filter(user=member, date__range=(start, end), removed=False)
 
                     except (Profile.DoesNotExist, DepartmentMember.DoesNotExist):
@@ -73,8 +63,7 @@ class GetWordTimeListView(generics.ListAPIView):
 
                 else:
                     try:
-                        profile = Profile.objects.get(user__id=user_id, removed=False)
-                        member = DepartmentMember.objects.get(department_member=profile, removed=False)
+                        member = self.request.member.get_department_member()
                         return WorkTime.objects.filter(user=member, removed=False)
 
                     except (Profile.DoesNotExist, DepartmentMember.DoesNotExist, WorkTime.DoesNotExist):
@@ -88,6 +77,8 @@ class GetWordTimeMemberListView(generics.ListAPIView):
     """
     serializer_class = serializer_api.GetWorkTimeOfMemberSerializer
     pagination_class = StandardResultsSetPagination
+    filter_backends = (scopes.ScopeFilterBackend,)
+    scope_roles = (scopes.DIRECTOR, scopes.MANAGER)
 
     def get_queryset(self):
         user_id = self.request.GET.get('user_id')
@@ -98,6 +89,8 @@ class GetWordTimeMemberListView(generics.ListAPIView):
                 if not can_be_integer(user_id):
                     return []
 
+                queryset = WorkTime.objects.filter(user__department_member__user_id=user_id, user__removed=False,
+                                                   user__department_member__removed=False, removed=False)
                 if month_request and year_request:
                     if not can_be_integer(month_request):
                         return []
@@ -111,48 +104,14 @@ class GetWordTimeMemberListView(generics.ListAPIView):
                     if int(year_request) < 1990 or int(year_request) > arrow.now().year:
                         return []
 
-                    try:
-                        start = arrow.now().\
-                            replace(month=int(month_request), year=int(year_request)).\
-                            to(settings.TIME_ZONE).floor('month').datetime
-                        end = arrow.now().\
-                            replace(month=int(month_request), year=int(year_request)).\
-                            to(settings.TIME_ZONE).ceil('month').datetime
-                        my_profile = Profile.objects.get(user=self.request.user, removed=False)
-                        profile = Profile.objects.get(user__id=user_id, removed=False)
-                        member = DepartmentMember.objects.get(department_member=profile, removed=False)
-                        if my_profile.get_role() == 'Director':
-                            return WorkTime.objects.filter(user=member, date__range=(start, end), removed=False)
-                        elif my_profile.get_role() == 'Manager':
-                            me = DepartmentMember.objects.get(department_member=my_profile, removed=False)
-                            if int(me.department.id) == int(member.department.id):
-                                return WorkTime.objects.filter(user=member, date__range=(start, end), removed=False)
-                            else:
-                                return []
-                        else:
-                            return []
-
-                    except (Profile.DoesNotExist, DepartmentMember.DoesNotExist, WorkTime.DoesNotExist):
-                        return []
-
-                else:
-                    try:
-                        my_profile = Profile.objects.get(user=self.request.user, removed=False)
-                        profile = Profile.objects.get(user__id=user_id, removed=False)
-                        member = DepartmentMember.objects.get(department_member=profile, removed=False)
-                        if my_profile.get_role() == 'Director':
-                            return WorkTime.objects.filter(user=member, removed=False)
-                        elif my_profile.get_role() == 'Manager':
-                            me = DepartmentMember.objects.get(department_member=my_profile, removed=False)
-                            if int(me.department.id) == int(member.department.id):
-                                return WorkTime.objects.filter(user=member, removed=False)
-                            else:
-                                return []
-                        else:
-                            return []
-
-                    except (Profile.DoesNotExist, DepartmentMember.DoesNotExist):
-                        return []
+                    start = arrow.now().\
+                        replace(month=int(month_request), year=int(year_request)).\
+                        to(settings.TIME_ZONE).floor('month').datetime
+                    end = arrow.now().\
+                        replace(month=int(month_request), year=int(year_request)).\
+                        to(settings.TIME_ZONE).ceil('month').datetime
+                    queryset = queryset.filter(date__range=(start, end))
+                return queryset
         return []
 
 
@@ -163,7 +122,6 @@ def add_my_work_time_api_view(request):
     :param request:
     :return:
     """
-    user_id = request.user.id
     work_date = request.data.get('date')
     start_in_day = request.data.get('start_in_day')
     end_in_day = request.data.get('end_in_day')
@@ -197,19 +155,9 @@ def add_my_work_time_api_view(request):
             })
 
         try:
-            profile = Profile.objects.get(user__id=user_id, removed=False)
-            dpm = DepartmentMember.objects.get(department_member=profile, removed=False)
-
-            total = 0
-            if start_in_day and end_in_day:
-                start = datetime.combine(date.today(), start_in_day)
-                end = datetime.combine(date.today(), end_in_day)
-                total = end - start
-                total = total.total_seconds()
-                total = float(total) / 3600.0
+            dpm = request.member.get_department_member()
 
-                if rest_time:
-                    total = float(total) - float(rest_time)
+            total = compute_time_total(start_in_day, end_in_day, rest_time)
 
             worktime = WorkTime(
                 user=dpm,
@@ -237,6 +185,60 @@ def add_my_work_time_api_view(request):
     })
 
 
+@api_view(['POST'])
+def import_my_work_time_api_view(request):
+    """
+    API nhập giờ làm việc của tôi từ file CSV (cột date, start, end, rest)
+    :param request: file
+    :return: số ngày đã nhập, số ngày trùng và các dòng lỗi
+    """
+    csv_file = request.FILES.get('file')
+
+    if request.user.is_authenticated:
+        if not csv_file:
+            return Response({
+                'ok': False,
+                'msg': 'Bạn chưa chọn file!',
+            })
+
+        try:
+            dpm = request.member.get_department_member()
+            # File lớn được Django lưu tạm ra đĩa, đọc lần lượt từng dòng
+            stream = io.TextIOWrapper(csv_file.file, encoding='utf-8-sig', newline='')
+            result = WorkTimeImport(member=dpm).run(stream)
+        except (Profile.DoesNotExist, DepartmentMember.DoesNotExist):
+            return Response({
+                'ok': False,
+                'msg': 'Lỗi dữ liệu!',
+            })
+        except UnicodeDecodeError:
+            return Response({
+                'ok': False,
+                'msg': 'File phải là CSV mã hóa UTF-8!',
+            })
+        except ValueError as e:
+            return Response({
+                'ok': False,
+                'msg': str(e),
+            })
+        except csv.Error:
+            return Response({
+                'ok': False,
+                'msg': 'File CSV không hợp lệ!',
+            })
+
+        result.update({
+            'ok': True,
+            'msg': 'Đã nhập %s ngày làm việc!' % result['created'],
+        })
+        return Response(result)
+
+    return Response({
+        'ok': False,
+        'msg': 'Bạn chưa đăng nhập!',
+    })
+
+
 @api_view(['POST'])
 def edit_my_work_time_api_view(request):
     """
@@ -244,7 +246,6 @@ def edit_my_work_time_api_view(request):
     :param request:
     :return:
     """
-    user_id = request.user.id
     work_time_id = request.data.get('work_time_id')
     work_date = request.data.get('date')
     start_in_day = request.data.get('start_in_day')
@@ -279,8 +280,7 @@ def edit_my_work_time_api_view(request):
 
         if work_time_request == 'remove':
             try:
-                profile = Profile.objects.get(user__id=user_id, removed=False)
-                dpm = DepartmentMember.objects.get(department_member=profile, removed=False)
+                dpm = request.member.get_department_member()
                 wt = WorkTime.objects.get(id=work_time_id, user=dpm, removed=False)
 
                 wt.removed = True
@@ -326,20 +326,10 @@ def edit_my_work_time_api_view(request):
                 })
 
             try:
-                profile = Profile.objects.get(user__id=user_id, removed=False)
-                dpm = DepartmentMember.objects.get(department_member=profile, removed=False)
+                dpm = request.member.get_department_member()
                 wt = WorkTime.objects.get(id=work_time_id, user=dpm, removed=False)
 
-                total = 0
-                if start_in_day and end_in_day:
-                    start = datetime.combine(date.today(), start_in_day)
-                    end = datetime.combine(date.today(), end_in_day)
-                    total = end - start
-                    total = total.total_seconds()
-                    total = float(total) / 3600.0
-
-                    if rest_time:
-                        total = float(total) - float(rest_time)
+                total = compute_time_total(start_in_day, end_in_day, rest_time)
 
                 wt.date = work_date
                 wt.start_in_day = start_in_day
@@ -373,8 +363,7 @@ def my_work_time_statistic_api_view(request):
     """
     if request.user.is_authenticated:
         try:
-            profile = Profile.objects.get(user__id=request.user.id, removed=False)
-            dpm = DepartmentMember.objects.get(department_member=profile, removed=False)
+            dpm = request.member.get_department_member()
             start = arrow.now().to(settings.TIME_ZONE).floor('month').datetime
             end = arrow.now().to(settings.TIME_ZONE).ceil('month').datetime
             wt = WorkTime.objects.filter(user=dpm,
@@ -397,24 +386,16 @@ def work_time_member_statistic_api_view(request):
     if request.user.is_authenticated:
         user_id = request.GET.get('user_id')
         try:
-            my_profile = Profile.objects.get(user=request.user, removed=False)
-            profile = Profile.objects.get(user__id=user_id, removed=False)
-            member = DepartmentMember.objects.get(department_member=profile, removed=False)
+            member = get_member(department_member__user_id=user_id)
+            if not scopes.in_scope(request.member, member):
+                return Response({})
+
             start = arrow.now().to(settings.TIME_ZONE).floor('month').datetime
             end = arrow.now().to(settings.TIME_ZONE).ceil('month').datetime
             wt = WorkTime.objects.filter(user=member,
                                          date__range=(start, end),
                                          removed=False).aggregate(totalTime=Sum('time_total'))['totalTime']
-            if my_profile.get_role() == 'Director':
-                return Response(wt)
-            elif my_profile.get_role() == 'Manager':
-                me = DepartmentMember.objects.get(department_member=my_profile, removed=False)
-                if int(me.department.id) == int(member.department.id):
-                    return Response(wt)
-                else:
-                    return Response({})
-            else:
-                return Response({})
+            return Response(wt)
 
         except (Profile.DoesNotExist, DepartmentMember.DoesNotExist, WorkTime.DoesNotExist):
             return Response({})
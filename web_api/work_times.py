@@ -0,0 +1,180 @@
+import csv
+from datetime import datetime, date
+
+import arrow
+from django.db import transaction
+
+from kpi_manager.models import DepartmentMember, WorkTime
+from .members import member_queryset
+from .summary import month_of, refresh_member_month
+
+# Tên cột được chấp nhận trong file CSV
+CSV_COLUMNS = {
+    'date': ('date',),
+    'start_in_day': ('start_in_day', 'start'),
+    'end_in_day': ('end_in_day', 'end'),
+    'rest_time': ('rest_time', 'rest'),
+    'username': ('username',),
+}
+DATE_FORMATS = ['YYYY-MM-DD', 'DD/MM/YYYY']
+TIME_FORMATS = ['HH:mm', 'HH:mm:ss', 'H:mm']
+MAX_ERRORS = 100
+
+
+def compute_time_total(start_in_day, end_in_day, rest_time=None):
+    """
+    Tổng số giờ làm việc trong ngày: (kết thúc - bắt đầu) - thời gian nghỉ
+    """
+    total = 0
+    if start_in_day and end_in_day:
+        start = datetime.combine(date.today(), start_in_day)
+        end = datetime.combine(date.today(), end_in_day)
+        total = end - start
+        total = total.total_seconds()
+        total = float(total) / 3600.0
+
+        if rest_time:
+            total = float(total) - float(rest_time)
+    return total
+
+
+class WorkTimeImport(object):
+    """
+    Nhập giờ làm việc từ file CSV (date, start, end, rest[, username]).
+    Đọc lần lượt từng dòng, ghi theo từng nhóm chunk_size dòng bằng bulk_create nên bộ nhớ không tăng theo
+    kích thước file. Ngày đã có giờ làm việc (cùng nhân viên) được bỏ qua và báo là trùng.
+    :param member: nhân viên nhận dữ liệu; bỏ trống thì lấy theo cột username
+    """
+
+    def __init__(self, member=None, chunk_size=500, dry_run=False):
+        self.member = member
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.members = {}
+        self.months = set()
+        self.rows = 0
+        self.created = 0
+        self.duplicates = 0
+        self.errors = []
+        self.error_count = 0
+
+    def run(self, stream):
+        """
+        :param stream: file văn bản (hoặc iterator các dòng) của CSV
+        :return: kết quả nhập
+        """
+        reader = csv.DictReader(stream)
+        columns = self.get_columns(reader.fieldnames or [])
+
+        with transaction.atomic():
+            chunk = []
+            for row in reader:
+                self.rows += 1
+                work_time = self.parse(reader.line_num, row, columns)
+                if work_time is not None:
+                    chunk.append(work_time)
+                if len(chunk) >= self.chunk_size:
+                    self.flush(chunk)
+                    chunk = []
+            self.flush(chunk)
+
+            if self.dry_run:
+                transaction.set_rollback(True)
+
+        # bulk_create không gửi signal: tự tính lại số liệu các tháng có dữ liệu mới
+        if not self.dry_run:
+            for member_id, month in self.months:
+                refresh_member_month(member_id, month)
+        return self.result()
+
+    def get_columns(self, fieldnames):
+        names = {name.strip().lower(): name for name in fieldnames if name}
+        columns = {}
+        for field, aliases in CSV_COLUMNS.items():
+            columns[field] = next((names[alias] for alias in aliases if alias in names), None)
+        if not columns['date'] or not columns['start_in_day']:
+            raise ValueError('File CSV phải có cột date và start!')
+        if self.member is None and not columns['username']:
+            raise ValueError('File CSV phải có cột username!')
+        return columns
+
+    def error(self, line, msg):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'line': line, 'msg': msg})
+
+    def parse(self, line, row, columns):
+        value = {field: (row.get(column) or '').strip() if column else '' for field, column in columns.items()}
+
+        member = self.get_member(value['username'])
+        if member is None:
+            self.error(line, 'Không tồn tại nhân viên %s!' % value['username'])
+            return None
+
+        if not value['date']:
+            self.error(line, 'Ngày làm việc không được để trống!')
+            return None
+
+        if not value['start_in_day']:
+            self.error(line, 'Thời gian bắt đầu không được để trống!')
+            return None
+
+        try:
+            work_date = arrow.get(value['date'], DATE_FORMATS).date()
+            start_in_day = arrow.get(value['start_in_day'], TIME_FORMATS).time()
+            end_in_day = arrow.get(value['end_in_day'], TIME_FORMATS).time() if value['end_in_day'] else None
+            rest_time = float(value['rest_time']) if value['rest_time'] else None
+        except (arrow.parser.ParserError, ValueError):
+            self.error(line, 'Dữ liệu không hợp lệ!')
+            return None
+
+        if end_in_day and end_in_day < start_in_day:
+            self.error(line, 'Thời gian kết thúc không được trước thời gian bắt đầu!')
+            return None
+
+        return WorkTime(user=member, date=work_date, start_in_day=start_in_day, end_in_day=end_in_day,
+                        rest_time=rest_time, time_total=compute_time_total(start_in_day, end_in_day, rest_time))
+
+    def get_member(self, username):
+        if self.member is not None:
+            return self.member
+        if username not in self.members:
+            try:
+                self.members[username] = member_queryset().get(department_member__user__username=username,
+                                                               removed=False)
+            except DepartmentMember.DoesNotExist:
+                self.members[username] = None
+        return self.members[username]
+
+    def flush(self, chunk):
+        """
+        Bỏ các ngày đã có (trong CSDL hoặc trùng trong cùng nhóm) rồi bulk_create cả nhóm.
+        Các nhóm trước đã được ghi nên kiểm tra CSDL cũng phát hiện trùng giữa các nhóm.
+        """
+        if not chunk:
+            return
+
+        existing = set(WorkTime.objects.filter(user_id__in={item.user_id for item in chunk},
+                                               date__in={item.date for item in chunk}, removed=False)
+                       .values_list('user_id', 'date'))
+        new = []
+        for item in chunk:
+            key = (item.user_id, item.date)
+            if key in existing:
+                self.duplicates += 1
+                continue
+            existing.add(key)
+            new.append(item)
+            self.months.add((item.user_id, month_of(item.date)))
+
+        WorkTime.objects.bulk_create(new)
+        self.created += len(new)
+
+    def result(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'duplicates': self.duplicates,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }